@@ -1,5 +1,7 @@
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 from database import TransmissionLine, TrippingIncident, TowerLocation, State
+from incident_archive import incident_source
 from datetime import datetime, timedelta
 
 class PowerGridChatbot:
@@ -9,7 +11,8 @@ class PowerGridChatbot:
     def get_stats(self):
         """Get system statistics"""
         total_lines = self.db.query(TransmissionLine).count()
-        total_incidents = self.db.query(TrippingIncident).count()
+        incidents = incident_source(self.db)  # archived years included
+        total_incidents = self.db.query(func.count(incidents.c.id)).scalar()
         total_towers = self.db.query(TowerLocation).count()
         
         thirty_days_ago = datetime.now().date() - timedelta(days=30)
@@ -0,0 +1,219 @@
+"""Compiled random forest inference.
+
+compile_forest() flattens the trees of a fitted RandomForestClassifier into
+contiguous node arrays; predict_proba() walks all trees for a block of rows
+with one vectorized step per tree level. Results are bit-identical to
+sklearn's single-threaded predict_proba (float32 rows compared with `<=`
+against the thresholds, tree probabilities summed in estimator order).
+
+explain() adds per-feature path contributions (as in treeinterpreter):
+proba == bias + contributions.sum(features), tabulated once per node.
+
+save() writes the arrays to one raw file and load() memory-maps it, so all
+workers share the pages. check_forest.py checks parity, bench_forest.py
+times it against sklearn.
+"""
+import os
+import numpy as np
+import sklearn
+from sklearn.ensemble import RandomForestClassifier
+
+COMPILED_FORMAT = 1
+SECTION_ALIGN = 64
+
+# (row, tree) pairs traversed together, so the working set stays in cache
+BLOCK_PAIRS = 65536
+
+# Before scikit-learn 1.4, tree values held class counts that predict_proba normalized
+_NORMALIZE_LEAVES = tuple(int(part) for part in sklearn.__version__.split(".")[:2]) < (1, 4)
+
+
+class UnsupportedModel(ValueError):
+    """Only single-output RandomForestClassifier models can be compiled"""
+
+
+class CompiledForest:
+    ARRAYS = ("feature", "threshold", "children", "missing_left", "value")
+
+    def __init__(self, feature, threshold, children, missing_left, value, roots, classes, max_depth):
+        self.feature = feature            # int64, 0 on leaves
+        self.threshold = threshold        # float64
+        self.children = children          # int64, [2i] left and [2i + 1] right of node i
+        self.missing_left = missing_left  # bool, NaN goes left
+        self.value = value                # float64 (n_nodes, n_classes) class probabilities
+        self.roots = np.asarray(roots, dtype=np.int64)
+        self.classes_ = np.asarray(classes)
+        self.max_depth = int(max_depth)
+        self._paths = None
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @property
+    def n_nodes(self):
+        return len(self.threshold)
+
+    def _apply_block(self, X):
+        n_rows, n_features = X.shape
+        flat = X.ravel()
+        has_nan = bool(np.isnan(flat).any())
+        node = np.tile(self.roots, n_rows)
+        base = np.repeat(np.arange(n_rows, dtype=np.int64) * n_features, self.n_trees)
+        pair = np.arange(len(node))
+        leaves = np.empty_like(node)
+        for _ in range(self.max_depth + 1):
+            done = self.children[2 * node] == node
+            if done.any():
+                leaves[pair[done]] = node[done]
+                active = ~done
+                node, base, pair = node[active], base[active], pair[active]
+                if not len(node):
+                    break
+            x = flat[base + self.feature[node]]
+            go_right = ~(x <= self.threshold[node])
+            if has_nan:
+                go_right &= ~(np.isnan(x) & self.missing_left[node])
+            node = self.children[2 * node + go_right]
+        return leaves.reshape(n_rows, self.n_trees)
+
+    def _blocks(self, X):
+        step = max(1, BLOCK_PAIRS // self.n_trees)
+        for start in range(0, len(X), step):
+            yield start, self._apply_block(X[start:start + step])
+
+    def apply(self, X):
+        """Leaf node index per row and tree, shape (n_rows, n_trees)"""
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        leaves = np.empty((len(X), self.n_trees), dtype=np.int64)
+        for start, block in self._blocks(X):
+            leaves[start:start + len(block)] = block
+        return leaves
+
+    def predict_proba(self, X):
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        proba = np.empty((len(X), len(self.classes_)), dtype=np.float64)
+        for start, leaves in self._blocks(X):
+            # accumulate() adds strictly tree by tree, the order sklearn sums in
+            proba[start:start + len(leaves)] = np.add.accumulate(self.value[leaves.T], axis=0)[-1]
+        proba /= self.n_trees
+        return proba
+
+    def predict(self, X):
+        return self.classes_.take(self.predict_proba(X).argmax(axis=1))
+
+    def _path_contributions(self, n_features):
+        """Per node, the summed probability change along its root path by split feature"""
+        if self._paths is None or self._paths.shape[1] != n_features:
+            paths = np.zeros((self.n_nodes, n_features, len(self.classes_)), dtype=np.float64)
+            frontier = self.roots
+            while len(frontier):
+                parent = frontier[self.children[2 * frontier] != frontier]
+                frontier = []
+                for side in (0, 1):
+                    child = self.children[2 * parent + side]
+                    paths[child] = paths[parent]
+                    paths[child, self.feature[parent]] += self.value[child] - self.value[parent]
+                    frontier.append(child)
+                frontier = np.concatenate(frontier)
+            self._paths = paths
+        return self._paths
+
+    def explain(self, X):
+        """(proba, bias, contributions): predict_proba(X), the mean root
+        probability per class, and per-row feature contributions shaped
+        (n_rows, n_features, n_classes)"""
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        paths = self._path_contributions(X.shape[1])
+        proba = np.empty((len(X), len(self.classes_)), dtype=np.float64)
+        contributions = np.empty((len(X), X.shape[1], len(self.classes_)), dtype=np.float64)
+        for start, leaves in self._blocks(X):
+            proba[start:start + len(leaves)] = np.add.accumulate(self.value[leaves.T], axis=0)[-1]
+            contributions[start:start + len(leaves)] = paths[leaves].sum(axis=1)
+        proba /= self.n_trees
+        contributions /= self.n_trees
+        bias = self.value[self.roots].mean(axis=0)
+        return proba, bias, contributions
+
+    # ---------- persistence ----------
+
+    def save(self, path):
+        """Write the arrays to one file; returns the layout load() needs"""
+        sections = {}
+        offset = 0
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            for name in self.ARRAYS:
+                array = np.ascontiguousarray(getattr(self, name))
+                offset = -(-offset // SECTION_ALIGN) * SECTION_ALIGN
+                f.seek(offset)
+                f.write(array.tobytes())
+                sections[name] = {"offset": offset, "dtype": array.dtype.str, "shape": list(array.shape)}
+                offset += array.nbytes
+        os.replace(tmp, path)
+        return {
+            "format": COMPILED_FORMAT,
+            "size": offset,
+            "sections": sections,
+            "roots": self.roots.tolist(),
+            "classes": self.classes_.tolist(),
+            "max_depth": self.max_depth,
+        }
+
+    @classmethod
+    def load(cls, path, layout):
+        """Memory-map a saved forest; None if the file does not match the layout"""
+        if layout.get("format") != COMPILED_FORMAT:
+            return None
+        try:
+            if os.path.getsize(path) != layout["size"]:
+                return None
+            arrays = {
+                name: np.memmap(path, dtype=np.dtype(section["dtype"]), mode="r",
+                                offset=section["offset"], shape=tuple(section["shape"]))
+                for name, section in layout["sections"].items()
+            }
+        except (OSError, ValueError, KeyError):
+            return None
+        return cls(**arrays, roots=layout["roots"], classes=layout["classes"], max_depth=layout["max_depth"])
+
+
+def compile_forest(model):
+    """Flatten a fitted RandomForestClassifier into a CompiledForest"""
+    if not isinstance(model, RandomForestClassifier):
+        raise UnsupportedModel(f"Cannot compile {type(model).__name__}; only random forests are supported")
+    if model.n_outputs_ != 1:
+        raise UnsupportedModel("Cannot compile a multi-output forest")
+
+    features, thresholds, children, missing_left, values, roots = [], [], [], [], [], []
+    offset = 0
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        own = np.arange(offset, offset + tree.node_count, dtype=np.int64)
+        leaf = tree.children_left == -1
+        features.append(np.where(leaf, 0, tree.feature))
+        thresholds.append(tree.threshold)
+        children.append(np.stack([
+            np.where(leaf, own, tree.children_left + offset),
+            np.where(leaf, own, tree.children_right + offset),
+        ], axis=1).ravel())
+        missing_left.append(getattr(tree, "missing_go_to_left", np.zeros(tree.node_count)))
+        value = tree.value[:, 0, :]
+        if _NORMALIZE_LEAVES:
+            normalizer = value.sum(axis=1)[:, np.newaxis]
+            normalizer[normalizer == 0.0] = 1.0
+            value = value / normalizer
+        values.append(value)
+        roots.append(offset)
+        offset += tree.node_count
+
+    return CompiledForest(
+        feature=np.concatenate(features).astype(np.int64),
+        threshold=np.concatenate(thresholds).astype(np.float64),
+        children=np.concatenate(children).astype(np.int64),
+        missing_left=np.concatenate(missing_left).astype(bool),
+        value=np.ascontiguousarray(np.concatenate(values), dtype=np.float64),
+        roots=roots,
+        classes=model.classes_,
+        max_depth=max(estimator.tree_.max_depth for estimator in model.estimators_),
+    )
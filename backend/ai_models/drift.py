@@ -0,0 +1,196 @@
+"""Drift of the maintenance model's inputs and outputs against its training data.
+
+At training time reference_profile() bins every feature at its training
+deciles (fewer bins for features with few distinct values), with one more
+bin on each side for values outside the training range, and keeps the bin
+counts, plus a histogram of the risk probability predicted for the
+training lines; the profile is stored in model_info.json.
+
+Every scoring run that rescored at least one line calls observe() with the
+bins those lines fall into (line_bins()), and the bins they fell into under
+the same model version before, which are cached per line. The difference
+is applied to running counts in drift_counts with relative UPDATEs, so the
+cost depends on the lines rescored, not on the population, and concurrent
+scoring runs in other workers never overwrite each other's counts. PSI and
+a binned Kolmogorov-Smirnov statistic then come from the reference and the
+running histograms. If the counts no longer add up to the population
+(lines removed, or one line rescored by two runs at once), the caller
+recounts them from the cached bins of every line.
+
+When any PSI exceeds PSI_THRESHOLD or any KS exceeds KS_THRESHOLD, the
+snapshot is marked drifted and a retrain is started in a background thread
+(DRIFT_AUTO_RETRAIN=0 only records it). A conditional UPDATE on the
+snapshot row claims the retrain, so one worker starts it per model version.
+"""
+import json
+import os
+import threading
+from datetime import datetime
+import numpy as np
+from sqlalchemy import bindparam
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from database import DriftSnapshot, DriftCount
+
+BINS = 10
+PROBABILITY_EDGES = [0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9]
+PSI_THRESHOLD = float(os.getenv("DRIFT_PSI_THRESHOLD", "0.25"))
+KS_THRESHOLD = float(os.getenv("DRIFT_KS_THRESHOLD", "0.3"))
+AUTO_RETRAIN = os.getenv("DRIFT_AUTO_RETRAIN", "1") != "0"
+EPSILON = 1e-4  # floor for empty bins in PSI
+
+
+def _histogram(values, edges):
+    values = np.asarray(values, dtype=np.float64)
+    return np.bincount(np.searchsorted(edges, values, side="right"), minlength=len(edges) + 1)
+
+
+def reference_profile(X, risk_probability):
+    """Training histograms of every feature column of X and of the risk probability"""
+    features = {}
+    for name in X.columns:
+        values = X[name].to_numpy(dtype=np.float64)
+        # [min, deciles..., just above max] so out-of-range values get bins of their own
+        edges = np.unique(np.quantile(values, np.linspace(0, 1, BINS + 1)[:-1]))
+        edges = np.append(edges, np.nextafter(values.max(), np.inf)).tolist()
+        features[name] = {"edges": edges, "counts": _histogram(values, edges).tolist()}
+    return {
+        "samples": len(X),
+        "features": features,
+        "risk_probability": {"edges": PROBABILITY_EDGES,
+                             "counts": _histogram(risk_probability, PROBABILITY_EDGES).tolist()},
+    }
+
+
+def psi(expected, actual):
+    """Population stability index of two histograms over the same bins"""
+    e = np.maximum(np.asarray(expected, dtype=np.float64) / max(sum(expected), 1), EPSILON)
+    a = np.maximum(np.asarray(actual, dtype=np.float64) / max(sum(actual), 1), EPSILON)
+    return float(np.sum((a - e) * np.log(a / e)))
+
+
+def ks(expected, actual):
+    """Largest gap between the two cumulative distributions, at bin edges"""
+    e = np.cumsum(expected) / max(sum(expected), 1)
+    a = np.cumsum(actual) / max(sum(actual), 1)
+    return float(np.max(np.abs(a - e)))
+
+
+def _histograms(reference):
+    """(name, reference histogram) of every feature, then of the risk probability"""
+    return [*reference["features"].items(), ("risk_probability", reference["risk_probability"])]
+
+
+def line_bins(reference, X, risk_probability):
+    """Bin of every line in each reference histogram, one column per _histograms() entry"""
+    columns = [np.searchsorted(ref["edges"], X[name].to_numpy(dtype=np.float64), side="right")
+               for name, ref in reference["features"].items()]
+    columns.append(np.searchsorted(reference["risk_probability"]["edges"],
+                                   np.asarray(risk_probability, dtype=np.float64), side="right"))
+    return np.stack(columns, axis=1)
+
+
+def _create_snapshot(db: Session, model_version, reference):
+    try:
+        db.add(DriftSnapshot(model_version=model_version, scoring_runs=0))
+        db.add_all(DriftCount(model_version=model_version, feature=name, bin=index, count=0)
+                   for name, ref in _histograms(reference) for index in range(len(ref["edges"]) + 1))
+        db.commit()
+    except IntegrityError:
+        db.rollback()  # created by a concurrent scoring run
+
+
+def observe(db: Session, model_version, reference, line_count, added, removed=(), reset=False, on_drift=None):
+    """Move lines in and out of the running counts of this model version and
+    refresh its drift snapshot; commits.
+
+    `added` and `removed` are line_bins() rows: a rescored line's new bins
+    are added and its previous ones removed. reset=True zeroes the counts
+    first, to recount from every line's bins. Returns the snapshot, or None
+    (leaving it untouched) if the counts do not add up to line_count.
+    """
+    if db.get(DriftSnapshot, model_version) is None:
+        _create_snapshot(db, model_version, reference)
+    histograms = _histograms(reference)
+    added = np.asarray(added, dtype=np.int64).reshape(-1, len(histograms))
+    removed = np.asarray(removed, dtype=np.int64).reshape(-1, len(histograms))
+
+    changes = []
+    for column, (name, ref) in enumerate(histograms):
+        size = len(ref["edges"]) + 1
+        delta = np.bincount(added[:, column], minlength=size) - np.bincount(removed[:, column], minlength=size)
+        changes += [{"_feature": name, "_bin": int(index), "_delta": int(delta[index])}
+                    for index in np.flatnonzero(delta)]
+    table = DriftCount.__table__
+    if reset:
+        db.execute(table.update().where(table.c.model_version == model_version).values(count=0))
+    if changes:
+        # Always in histogram order, so concurrent runs lock the rows in the same order
+        db.execute(table.update().where(
+            table.c.model_version == model_version,
+            table.c.feature == bindparam("_feature"),
+            table.c.bin == bindparam("_bin"),
+        ).values(count=table.c.count + bindparam("_delta")), changes)
+
+    counts = {name: np.zeros(len(ref["edges"]) + 1, dtype=np.int64) for name, ref in histograms}
+    for row in db.query(DriftCount).filter(DriftCount.model_version == model_version):
+        counts[row.feature][row.bin] = row.count
+    if any(c.sum() != line_count or c.min() < 0 for c in counts.values()):
+        db.commit()
+        return None
+
+    stats = {name: {"psi": psi(ref["counts"], counts[name]), "ks": ks(ref["counts"], counts[name]),
+                    "counts": counts[name].tolist()}
+             for name, ref in histograms}
+    max_psi = max(s["psi"] for s in stats.values())
+    max_ks = max(s["ks"] for s in stats.values())
+    drifted = max_psi > PSI_THRESHOLD or max_ks > KS_THRESHOLD
+
+    snapshots = DriftSnapshot.__table__
+    this_version = snapshots.c.model_version == model_version
+    db.execute(snapshots.update().where(this_version).values(
+        computed_at=datetime.utcnow(),
+        scoring_runs=snapshots.c.scoring_runs + 1,
+        line_count=line_count,
+        max_psi=max_psi,
+        max_ks=max_ks,
+        drifted=drifted,
+        stats=json.dumps(stats),
+    ))
+    start = False
+    if drifted and AUTO_RETRAIN and on_drift is not None:
+        # Claimed like a scheduler lease: only the worker whose UPDATE matched starts it
+        start = db.execute(snapshots.update().where(
+            this_version, snapshots.c.retrain_triggered_at.is_(None)
+        ).values(retrain_triggered_at=datetime.utcnow())).rowcount == 1
+    db.commit()
+    if start:
+        start_retrain(on_drift)
+    return db.get(DriftSnapshot, model_version)
+
+
+def start_retrain(retrain):
+    """Run retrain() in a background thread"""
+    def run():
+        try:
+            retrain()
+        except Exception as e:
+            print(f"⚠️  Drift-triggered retrain failed: {e}")
+
+    threading.Thread(target=run, name="drift-retrain", daemon=True).start()
+
+
+def snapshot_to_dict(snapshot):
+    stats = json.loads(snapshot.stats) if snapshot.stats else {}
+    return {
+        "model_version": snapshot.model_version,
+        "computed_at": snapshot.computed_at.isoformat() if snapshot.computed_at else None,
+        "scoring_runs": snapshot.scoring_runs,
+        "line_count": snapshot.line_count,
+        "max_psi": snapshot.max_psi,
+        "max_ks": snapshot.max_ks,
+        "drifted": snapshot.drifted,
+        "retrain_triggered_at": snapshot.retrain_triggered_at.isoformat() if snapshot.retrain_triggered_at else None,
+        "thresholds": {"psi": PSI_THRESHOLD, "ks": KS_THRESHOLD},
+        "features": stats,
+    }
@@ -0,0 +1,137 @@
+from datetime import date, datetime, timedelta
+from sqlalchemy import case, func
+from sqlalchemy.orm import Session
+from database import SessionLocal, TransmissionLine, TowerLocation, LineFeature
+from incident_archive import incident_source
+
+RECENT_WINDOW_DAYS = 180
+POOR_TOWER_CONDITIONS = ['Needs Inspection', 'Under Repair']
+
+
+def refresh_line_features(db: Session, line_ids=None, as_of: date = None):
+    """Recompute stored features for the given lines (all lines if None).
+
+    Uses grouped aggregates over the indexed line columns, so a write only
+    costs a re-count of the affected line. Does not commit.
+    """
+    as_of = as_of or date.today()
+    window_start = as_of - timedelta(days=RECENT_WINDOW_DAYS)
+    db.flush()
+
+    if line_ids is None:
+        line_ids = [row.id for row in db.query(TransmissionLine.id).all()]
+        db.query(LineFeature).filter(~LineFeature.transmission_line_id.in_(line_ids)).delete(synchronize_session=False)
+    else:
+        existing = {row.id for row in db.query(TransmissionLine.id).filter(TransmissionLine.id.in_(list(line_ids))).all()}
+        db.query(LineFeature).filter(
+            LineFeature.transmission_line_id.in_([i for i in line_ids if i not in existing])
+        ).delete(synchronize_session=False)
+        line_ids = list(existing)
+    if not line_ids:
+        return 0
+
+    incidents = incident_source(db)  # incident_count spans archived years too
+    incident_stats = {
+        row[0]: (row[1], row[2] or 0)
+        for row in db.query(
+            incidents.c.transmission_line_id,
+            func.count(incidents.c.id),
+            func.sum(case((incidents.c.fault_date >= window_start, 1), else_=0))
+        ).filter(
+            incidents.c.transmission_line_id.in_(line_ids)
+        ).group_by(incidents.c.transmission_line_id).all()
+    }
+
+    tower_stats = {
+        row[0]: (row[1], row[2] or 0)
+        for row in db.query(
+            TowerLocation.transmission_line_id,
+            func.count(TowerLocation.id),
+            func.sum(case((TowerLocation.condition.in_(POOR_TOWER_CONDITIONS), 1), else_=0))
+        ).filter(
+            TowerLocation.transmission_line_id.in_(line_ids)
+        ).group_by(TowerLocation.transmission_line_id).all()
+    }
+
+    features = {
+        f.transmission_line_id: f
+        for f in db.query(LineFeature).filter(LineFeature.transmission_line_id.in_(line_ids)).all()
+    }
+
+    now = datetime.utcnow()
+    for line_id in line_ids:
+        feature = features.get(line_id)
+        if feature is None:
+            feature = LineFeature(transmission_line_id=line_id)
+            db.add(feature)
+        feature.incident_count, feature.recent_incidents = incident_stats.get(line_id, (0, 0))
+        feature.tower_count, feature.poor_tower_count = tower_stats.get(line_id, (0, 0))
+        feature.as_of = as_of
+        feature.updated_at = now
+
+    db.flush()
+    return len(line_ids)
+
+
+def load_line_features(db: Session, as_of: date = None):
+    """Return one dict per line with the model inputs, read in a single scan.
+
+    If the stored window is not anchored on `as_of` (the daily job has not
+    run yet) or a line has no feature row, the store is refreshed first so
+    training and serving always see the same values.
+    """
+    as_of = as_of or date.today()
+
+    def scan():
+        return db.query(
+            TransmissionLine.id,
+            TransmissionLine.line_name,
+            TransmissionLine.voltage_level,
+            TransmissionLine.total_length_km,
+            TransmissionLine.commission_date,
+            LineFeature.incident_count,
+            LineFeature.recent_incidents,
+            LineFeature.tower_count,
+            LineFeature.poor_tower_count,
+            LineFeature.as_of
+        ).outerjoin(
+            LineFeature, LineFeature.transmission_line_id == TransmissionLine.id
+        ).order_by(TransmissionLine.id).all()
+
+    rows = scan()
+    if any(row.as_of != as_of for row in rows):
+        refresh_line_features(db, as_of=as_of)
+        db.commit()
+        rows = scan()
+
+    return [
+        {
+            'line_id': row.id,
+            'line_name': row.line_name,
+            'voltage_level': row.voltage_level,
+            'total_length_km': row.total_length_km,
+            'commission_date': row.commission_date,
+            'line_age': (as_of - row.commission_date).days / 365,
+            'incident_count': row.incident_count,
+            'recent_incidents': row.recent_incidents,
+            'tower_count': row.tower_count,
+            'poor_tower_count': row.poor_tower_count,
+        }
+        for row in rows
+    ]
+
+
+def slide_feature_window(as_of: date = None):
+    """Daily job: re-anchor the recent_incidents window for every line"""
+    db = SessionLocal()
+    try:
+        count = refresh_line_features(db, as_of=as_of)
+        db.commit()
+        return count
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    count = slide_feature_window()
+    print(f"✅ Refreshed features for {count} transmission lines")
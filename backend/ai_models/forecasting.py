@@ -0,0 +1,257 @@
+"""Expected trips per line for the coming months.
+
+Monthly incident counts are modelled as Poisson with a per-line rate and a
+network-wide month-of-year (monsoon) seasonality:
+
+    trips[line, month] ~ Poisson(rate[line] * season[month_of_year])
+
+Each line's rate has a Gamma prior centred on the network mean, so lines
+with little history are shrunk towards it and forecasts are
+negative-binomial. All lines are fitted together by alternating closed-form
+updates on a (lines x months) count matrix built from the month incident
+rollups - no per-line loop. The fitted parameters are cached in
+FORECAST_PATH; the scheduler refits them when incidents changed or a new
+month started, and requests only read the cached fit.
+
+    python -m ai_models.forecasting --months 6
+"""
+import argparse
+import os
+from datetime import date
+import numpy as np
+from scipy.stats import nbinom
+from sqlalchemy.orm import Session
+from database import TransmissionLine, IncidentRollup, get_generation
+
+FORECAST_PATH = 'incident_forecast.npz'
+
+HISTORY_MONTHS = 60
+MAX_HORIZON_MONTHS = 12
+
+# Strength of the network-mean prior on each line's rate, in months of exposure
+PRIOR_MONTHS = 12
+# Pseudo-counts pulling each month-of-year factor towards 1
+SEASON_PRIOR = 2.0
+FIT_ITERATIONS = 50
+
+INTERVAL = 0.9
+
+
+def month_index(day):
+    return day.year * 12 + day.month - 1
+
+
+def index_month(index):
+    return date(index // 12, index % 12 + 1, 1)
+
+
+class IncidentForecaster:
+    def __init__(self):
+        self.line_ids = None
+        self.rate_shape = None  # posterior Gamma shape per line
+        self.rate_scale = None  # posterior Gamma rate (exposure + prior) per line
+        self.season = None  # 12 month-of-year factors, mean 1
+        self.fitted_month = None  # month index the forecast starts at
+        self.generation = None  # incidents cache generation the fit saw
+
+    # ---------- fitting ----------
+
+    def count_matrix(self, db: Session, first_month, last_month):
+        """(line_ids, counts, exposure) over months [first_month, last_month)"""
+        lines = db.query(TransmissionLine.id, TransmissionLine.commission_date).order_by(TransmissionLine.id).all()
+        line_ids = np.array([line.id for line in lines], dtype=np.int64)
+        months = np.arange(first_month, last_month)
+
+        commissioned = np.array([
+            month_index(line.commission_date) if line.commission_date else first_month for line in lines
+        ], dtype=np.int64)
+        exposure = (months[None, :] >= commissioned[:, None]).astype(np.float64)
+
+        counts = np.zeros((len(line_ids), len(months)))
+        rows = db.query(
+            IncidentRollup.transmission_line_id, IncidentRollup.period_start, IncidentRollup.incident_count
+        ).filter(
+            IncidentRollup.granularity == "month",
+            IncidentRollup.period_start >= index_month(first_month),
+            IncidentRollup.period_start < index_month(last_month)
+        ).all()
+        if rows:
+            row_lines = np.array([r[0] for r in rows], dtype=np.int64)
+            row_months = np.array([month_index(r[1]) for r in rows], dtype=np.int64) - first_month
+            row_counts = np.array([r[2] for r in rows], dtype=np.float64)
+            positions = np.searchsorted(line_ids, row_lines)
+            known = (positions < len(line_ids)) & (line_ids[np.minimum(positions, len(line_ids) - 1)] == row_lines)
+            np.add.at(counts, (positions[known], row_months[known]), row_counts[known])
+            # Incidents before the recorded commission date still count as service
+            exposure = np.maximum(exposure, counts > 0)
+
+        return line_ids, counts, exposure
+
+    def fit(self, db: Session, today: date = None):
+        """Fit every line at once on the complete months of history"""
+        today = today or date.today()
+        last_month = month_index(today)  # current month is incomplete
+        first_month = last_month - HISTORY_MONTHS
+
+        earliest = db.query(IncidentRollup.period_start).filter(
+            IncidentRollup.granularity == "month"
+        ).order_by(IncidentRollup.period_start).first()
+        if earliest:
+            first_month = max(first_month, month_index(earliest[0]))
+        first_month = min(first_month, last_month - 1)
+
+        generation = get_generation(db, "incidents")
+        line_ids, counts, exposure = self.count_matrix(db, first_month, last_month)
+        month_of_year = np.arange(first_month, last_month) % 12
+
+        line_totals = counts.sum(axis=1)
+        season_totals = np.bincount(month_of_year, weights=counts.sum(axis=0), minlength=12)
+        season = np.ones(12)
+        rate = np.zeros(len(line_ids))
+        for _ in range(FIT_ITERATIONS):
+            seasonal_exposure = exposure * season[month_of_year]
+            line_exposure = seasonal_exposure.sum(axis=1)
+            prior_rate = line_totals.sum() / max(line_exposure.sum(), 1e-9)
+            rate = (line_totals + PRIOR_MONTHS * prior_rate) / (line_exposure + PRIOR_MONTHS)
+
+            expected = np.bincount(month_of_year, weights=(exposure * rate[:, None]).sum(axis=0), minlength=12)
+            updated = (season_totals + SEASON_PRIOR) / (expected + SEASON_PRIOR)
+            # Circular smoothing: neighbouring months share weather
+            updated = 0.25 * np.roll(updated, 1) + 0.5 * updated + 0.25 * np.roll(updated, -1)
+            updated /= updated.mean()
+            converged = np.allclose(updated, season, rtol=1e-6)
+            season = updated
+            if converged:
+                break
+
+        line_exposure = (exposure * season[month_of_year]).sum(axis=1)
+        self.line_ids = line_ids
+        self.rate_shape = line_totals + PRIOR_MONTHS * prior_rate
+        self.rate_scale = line_exposure + PRIOR_MONTHS
+        self.season = season
+        self.fitted_month = last_month
+        self.generation = generation
+        return {
+            "lines": int(len(line_ids)),
+            "history_from": index_month(first_month).isoformat(),
+            "history_months": int(last_month - first_month),
+            "network_monthly_rate": round(float(prior_rate) * len(line_ids), 3),
+            "season": [round(float(s), 3) for s in season],
+        }
+
+    # ---------- persistence ----------
+
+    def save(self, path=FORECAST_PATH):
+        """Write to a temp file and swap it in, so other workers never load a partial file"""
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, line_ids=self.line_ids, rate_shape=self.rate_shape, rate_scale=self.rate_scale,
+                     season=self.season, fitted_month=self.fitted_month, generation=self.generation)
+        os.replace(tmp, path)
+
+    def load(self, path=FORECAST_PATH):
+        with np.load(path) as data:
+            self.line_ids = data['line_ids']
+            self.rate_shape = data['rate_shape']
+            self.rate_scale = data['rate_scale']
+            self.season = data['season']
+            self.fitted_month = int(data['fitted_month'])
+            self.generation = int(data['generation'])
+
+    def is_current(self, db: Session, today: date = None):
+        today = today or date.today()
+        return (self.line_ids is not None and self.fitted_month == month_index(today)
+                and self.generation == get_generation(db, "incidents"))
+
+    # ---------- forecasting ----------
+
+    def forecast(self, months=6, line_ids=None):
+        """Expected trips per line per month, with an interval on the total"""
+        rows = np.arange(len(self.line_ids))
+        if line_ids is not None and len(self.line_ids):
+            positions = np.searchsorted(self.line_ids, line_ids)
+            positions = np.minimum(positions, len(self.line_ids) - 1)
+            rows = positions[self.line_ids[positions] == np.asarray(line_ids)]
+
+        horizon = np.arange(self.fitted_month, self.fitted_month + months)
+        mean_rate = self.rate_shape[rows] / self.rate_scale[rows]
+        monthly = mean_rate[:, None] * self.season[horizon % 12][None, :]
+
+        # Gamma-Poisson mixture: the horizon total is negative binomial. A line
+        # (or network) without any incident in the window has shape 0: no trips
+        seasonal_sum = self.season[horizon % 12].sum()
+        shape = self.rate_shape[rows]
+        p = self.rate_scale[rows] / (self.rate_scale[rows] + seasonal_sum)
+        low = np.zeros(len(rows))
+        high = np.zeros(len(rows))
+        positive = shape > 0
+        low[positive] = nbinom.ppf((1 - INTERVAL) / 2, shape[positive], p[positive])
+        high[positive] = nbinom.ppf(1 - (1 - INTERVAL) / 2, shape[positive], p[positive])
+
+        labels = [index_month(m).strftime('%Y-%m') for m in horizon]
+        return [
+            {
+                "line_id": int(self.line_ids[row]),
+                "expected_total": round(float(monthly[i].sum()), 3),
+                "interval": [int(low[i]), int(high[i])],
+                "months": [{"month": label, "expected": round(float(value), 3)}
+                           for label, value in zip(labels, monthly[i])],
+            }
+            for i, row in enumerate(rows)
+        ]
+
+
+def get_forecaster(db: Session, refit=False, stale_ok=False):
+    """Cached forecaster, refitted if incidents changed or a new month began.
+
+    With stale_ok, any saved fit is returned as is and only a missing one
+    is fitted (the read path; refits are left to the scheduler).
+    """
+    forecaster = IncidentForecaster()
+    if not refit and os.path.exists(FORECAST_PATH):
+        forecaster.load()
+        if stale_ok or forecaster.is_current(db):
+            return forecaster, None
+    summary = forecaster.fit(db)
+    forecaster.save()
+    return forecaster, summary
+
+
+def forecast_incidents(db: Session, months=6, line_ids=None):
+    """Batch forecast for the given lines (all lines if None)"""
+    months = max(1, min(months, MAX_HORIZON_MONTHS))
+    forecaster, _ = get_forecaster(db, stale_ok=True)
+    results = forecaster.forecast(months, line_ids)
+
+    names = dict(db.query(TransmissionLine.id, TransmissionLine.line_name).all())
+    for result in results:
+        result["line_name"] = names.get(result["line_id"])
+    results.sort(key=lambda r: -r["expected_total"])
+    return {
+        "starting": index_month(forecaster.fitted_month).strftime('%Y-%m'),
+        "current": forecaster.is_current(db),
+        "months": months,
+        "season": [round(float(s), 3) for s in forecaster.season],
+        "forecasts": results,
+    }
+
+
+if __name__ == "__main__":
+    import time
+    from database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Refit and print per-line incident forecasts")
+    parser.add_argument("--months", type=int, default=6, help="forecast horizon in months")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        forecaster, summary = get_forecaster(db, refit=True)
+        print(f"✅ Fitted {summary['lines']} lines on {summary['history_months']} months "
+              f"in {(time.perf_counter() - started) * 1000:.1f} ms")
+        for result in forecast_incidents(db, args.months)["forecasts"][:10]:
+            print(f"   {result['line_name']}: {result['expected_total']} trips "
+                  f"({result['interval'][0]}-{result['interval'][1]})")
+    finally:
+        db.close()
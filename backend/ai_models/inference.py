@@ -0,0 +1,238 @@
+"""Standalone inference worker for the predictive maintenance model.
+
+The worker loads PredictiveMaintenanceModel once and serves it over a local
+Unix socket, so API workers never import pandas/sklearn. Start it next to the
+API and point the API at the same socket:
+
+    python -m ai_models.inference --socket /tmp/tlamp-inference.sock
+    INFERENCE_SOCKET=/tmp/tlamp-inference.sock uvicorn main:app --workers 4
+
+Messages are JSON objects sent as length-prefixed frames via
+multiprocessing.connection: requests look like {"op": "predict"} and replies
+like {"ok": true, "result": ...} or {"ok": false, "error": "..."}.
+Only the standard library is imported at module level so the client side
+stays lean.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from multiprocessing.connection import Client, Listener
+
+INFERENCE_SOCKET = os.getenv("INFERENCE_SOCKET", "")
+INFERENCE_AUTHKEY = os.getenv("INFERENCE_AUTHKEY", "powergrid-inference").encode()
+REQUEST_TIMEOUT_SECONDS = float(os.getenv("INFERENCE_TIMEOUT", "120"))
+
+# Requests for the same op arriving within this window share one model run
+BATCH_WINDOW_SECONDS = 0.05
+
+
+def _to_json(value):
+    """json.dumps fallback for numpy scalars/arrays and dates"""
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _send(conn, message):
+    conn.send_bytes(json.dumps(message, default=_to_json).encode())
+
+
+def _recv(conn):
+    return json.loads(conn.recv_bytes().decode())
+
+
+# ==================== CLIENT ====================
+
+class InferenceError(Exception):
+    """Raised when the inference worker reports a failure or cannot be reached"""
+
+
+class InferenceClient:
+    """Talks to the inference worker; one short-lived connection per call"""
+
+    def __init__(self, address=None, authkey=INFERENCE_AUTHKEY, timeout=REQUEST_TIMEOUT_SECONDS):
+        self.address = address or INFERENCE_SOCKET
+        self.authkey = authkey
+        self.timeout = timeout
+
+    def call(self, op, **params):
+        try:
+            conn = Client(self.address, family="AF_UNIX", authkey=self.authkey)
+        except OSError as e:
+            raise InferenceError(f"Inference worker unavailable at {self.address}: {e}")
+
+        try:
+            _send(conn, {"op": op, "params": params})
+            if not conn.poll(self.timeout):
+                raise InferenceError(f"Inference worker timed out after {self.timeout:.0f}s ({op})")
+            reply = _recv(conn)
+        except (EOFError, OSError) as e:
+            raise InferenceError(f"Inference worker connection lost: {e}")
+        finally:
+            conn.close()
+
+        if not reply.get("ok"):
+            raise InferenceError(reply.get("error", "Unknown inference error"))
+        return reply.get("result")
+
+
+class RemoteMaintenanceModel:
+    """Drop-in for PredictiveMaintenanceModel that delegates to the worker.
+
+    The `db` arguments are accepted for interface compatibility; the worker
+    uses its own database session.
+    """
+
+    def __init__(self, client=None):
+        self.client = client or InferenceClient()
+
+    def predict_maintenance_needs(self, db=None):
+        return self.client.call("predict")
+
+    def train_model(self, db=None):
+        return self.client.call("train")
+
+    def update_model(self, db=None):
+        return self.client.call("update")
+
+    def get_model_metrics(self, db=None):
+        return self.client.call("metrics")
+
+    def select_model(self, db=None, budget_seconds=None):
+        return self.client.call("select", budget_seconds=budget_seconds)
+
+
+# ==================== WORKER ====================
+
+class _Batch:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _Coalescer:
+    """Run `fn` once for all callers that arrive within the batch window.
+
+    Callers that arrive while a run is in progress join the next batch, so
+    nobody is handed a result computed before their request was sent.
+    """
+
+    def __init__(self, fn, run_lock, window=BATCH_WINDOW_SECONDS):
+        self.fn = fn
+        self.run_lock = run_lock
+        self.window = window
+        self.lock = threading.Lock()
+        self.pending = None
+
+    def __call__(self):
+        with self.lock:
+            leader = self.pending is None
+            if leader:
+                self.pending = _Batch()
+            batch = self.pending
+
+        if leader:
+            time.sleep(self.window)
+            with self.lock:
+                self.pending = None
+            with self.run_lock:
+                try:
+                    batch.result = self.fn()
+                except Exception as e:
+                    batch.error = e
+            batch.done.set()
+        else:
+            batch.done.wait()
+
+        if batch.error is not None:
+            raise batch.error
+        return batch.result
+
+
+class InferenceWorker:
+    """Owns the single in-memory model and answers requests from API workers"""
+
+    def __init__(self):
+        from ai_models.predictive_maintenance import PredictiveMaintenanceModel
+        from database import SessionLocal
+
+        self.session_factory = SessionLocal
+        self.model = PredictiveMaintenanceModel()
+        # Model runs are serialized; training swaps the model under this lock
+        self.run_lock = threading.Lock()
+        self.ops = {
+            "ping": lambda: "pong",
+            "predict": _Coalescer(lambda: self._with_db(self.model.predict_maintenance_needs), self.run_lock),
+            "metrics": _Coalescer(lambda: self._with_db(self.model.get_model_metrics), self.run_lock),
+            "train": _Coalescer(lambda: self._with_db(self.model.train_model), self.run_lock),
+            "update": _Coalescer(lambda: self._with_db(self.model.update_model), self.run_lock),
+            "select": self._select_model,
+        }
+
+    def _with_db(self, fn):
+        db = self.session_factory()
+        try:
+            return fn(db)
+        finally:
+            db.close()
+
+    def _select_model(self, budget_seconds=None):
+        with self.run_lock:
+            return self._with_db(lambda db: self.model.select_model(db, budget_seconds=budget_seconds))
+
+    def warm_up(self):
+        """Load (or train) the model before accepting connections"""
+        with self.run_lock:
+            self._with_db(self.model.predict_maintenance_needs)
+
+    def handle(self, conn):
+        try:
+            request = _recv(conn)
+            op = self.ops.get(request.get("op"))
+            if op is None:
+                _send(conn, {"ok": False, "error": f"Unknown op: {request.get('op')}"})
+                return
+            try:
+                _send(conn, {"ok": True, "result": op(**(request.get("params") or {}))})
+            except Exception as e:
+                _send(conn, {"ok": False, "error": str(e)})
+        except (EOFError, OSError):
+            pass
+        finally:
+            conn.close()
+
+    def serve_forever(self, address):
+        if os.path.exists(address):
+            os.remove(address)
+        with Listener(address, family="AF_UNIX", authkey=INFERENCE_AUTHKEY) as listener:
+            print(f"🧠 Inference worker listening on {address}")
+            while True:
+                try:
+                    conn = listener.accept()
+                except OSError as e:
+                    print(f"Rejected inference connection: {e}")
+                    continue
+                threading.Thread(target=self.handle, args=(conn,), daemon=True).start()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PowerGrid predictive maintenance inference worker")
+    parser.add_argument("--socket", default=INFERENCE_SOCKET or "/tmp/tlamp-inference.sock",
+                        help="Unix socket path to listen on")
+    parser.add_argument("--no-warm-up", action="store_true", help="skip loading the model before serving")
+    args = parser.parse_args()
+
+    worker = InferenceWorker()
+    if not args.no_warm_up:
+        worker.warm_up()
+        print("✅ Model loaded")
+    worker.serve_forever(args.socket)
+
+
+if __name__ == "__main__":
+    main()
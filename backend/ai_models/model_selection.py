@@ -0,0 +1,216 @@
+"""Hyperparameter search and model selection for the maintenance model.
+
+Runs successive halving over randomly sampled RandomForest and
+gradient-boosted tree configurations. Candidates in a rung are evaluated in
+parallel worker processes (joblib/loky) with commission-ordered
+cross-validation on a feature matrix that is extracted once. The best
+configuration is refit on all data and registered as the current model.
+Workers check the wall-clock budget before every fold fit, so the search
+overruns it by at most one fit per worker; candidates cut short are left
+out of the ranking and no further rung starts.
+
+Commission-ordered CV is forward chaining over lines sorted by commission
+date: each fold trains on older lines and validates on the next, newer
+ones. It is not a split in incident time. Every row is a line's current
+feature snapshot, so all folds see incidents up to today; the scheme
+measures how well the model carries over to lines commissioned later.
+
+    python -m ai_models.model_selection --budget 1800 --n-jobs -1
+"""
+import argparse
+import math
+import time
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from sklearn.ensemble import RandomForestClassifier, HistGradientBoostingClassifier
+from sklearn.metrics import f1_score
+from sklearn.model_selection import TimeSeriesSplit
+from sklearn.preprocessing import LabelEncoder
+from sqlalchemy.orm import Session
+from ai_models.predictive_maintenance import PredictiveMaintenanceModel, FEATURE_COLS, data_version, rebuild_info, training_reference
+
+DEFAULT_BUDGET_SECONDS = 1800
+DEFAULT_CANDIDATES = 24
+HALVING_FACTOR = 3
+CV_SCHEME = 'commission_ordered'
+
+# Sampled per family; the halving resource (trees / boosting rounds) is set per rung
+SEARCH_SPACES = {
+    'random_forest': {
+        'max_depth': [None, 4, 6, 8, 12],
+        'min_samples_leaf': [1, 2, 4],
+        'max_features': ['sqrt', 0.5, 1.0],
+        'class_weight': [None, 'balanced'],
+    },
+    'gradient_boosting': {
+        'learning_rate': [0.03, 0.1, 0.3],
+        'max_depth': [None, 3, 5],
+        'min_samples_leaf': [2, 5, 10],
+        'l2_regularization': [0.0, 0.1, 1.0],
+    },
+}
+
+RESOURCE = {
+    'random_forest': ('n_estimators', 25, 400),
+    'gradient_boosting': ('max_iter', 25, 400),
+}
+
+
+def build_estimator(family, params, resource):
+    name = RESOURCE[family][0]
+    if family == 'random_forest':
+        return RandomForestClassifier(random_state=42, n_jobs=1, **{name: resource}, **params)
+    return HistGradientBoostingClassifier(random_state=42, early_stopping=False, **{name: resource}, **params)
+
+
+def sample_candidates(n, rng):
+    """Draw n (family, params) configurations, alternating between families"""
+    families = sorted(SEARCH_SPACES)
+    candidates = []
+    for i in range(n):
+        family = families[i % len(families)]
+        space = SEARCH_SPACES[family]
+        candidates.append((family, {key: values[rng.randint(len(values))] for key, values in space.items()}))
+    return candidates
+
+
+def _cv_score(family, params, resource, X, y, splits, deadline=None):
+    """Mean weighted F1 over the commission-ordered folds (runs in a worker process);
+    None if the deadline (time.time()) passed before every fold was fitted"""
+    scores = []
+    for train_idx, test_idx in splits:
+        if deadline is not None and time.time() >= deadline:
+            return None
+        model = build_estimator(family, params, resource)
+        model.fit(X[train_idx], y[train_idx])
+        scores.append(f1_score(y[test_idx], model.predict(X[test_idx]), average='weighted', zero_division=0))
+    return float(np.mean(scores)) if scores else 0.0
+
+
+def extract_training_matrix(db: Session):
+    """Build X, y once for all candidates, ordered by commission date, plus the data version"""
+    pm = PredictiveMaintenanceModel()
+    df = pm.prepare_features(db)
+    if len(df) < 10:
+        return None, None, None, None
+
+    encoder = LabelEncoder()
+    df['voltage_encoded'] = encoder.fit_transform(df['voltage_level'])
+    # Oldest lines first so every fold validates on lines commissioned after the ones it trained on
+    df = df.sort_values('line_age', ascending=False, kind='mergesort')
+    X = np.ascontiguousarray(df[FEATURE_COLS].to_numpy(dtype=np.float64))
+    y = df['risk_level'].to_numpy()
+    return X, y, encoder, data_version(db, df)
+
+
+def select_model(db: Session, budget_seconds=DEFAULT_BUDGET_SECONDS, n_candidates=DEFAULT_CANDIDATES,
+                 n_jobs=-1, random_state=42):
+    """Run the search, register the winner and return a summary"""
+    started = time.monotonic()
+    # Wall clock, so worker processes can check it too
+    deadline = time.time() + budget_seconds
+
+    X, y, encoder, data = extract_training_matrix(db)
+    if X is None:
+        return {"success": False, "message": "Not enough data to train model"}
+
+    # Forward chaining over the commission order of the rows, see the module docstring
+    n_splits = max(2, min(5, len(y) // 3))
+    splits = list(TimeSeriesSplit(n_splits=n_splits).split(X))
+
+    rng = np.random.RandomState(random_state)
+    candidates = sample_candidates(n_candidates, rng)
+    n_rungs = max(1, int(math.log(max(n_candidates, 1), HALVING_FACTOR)) + 1)
+
+    history = []
+    leader = None
+    with Parallel(n_jobs=n_jobs, backend='loky') as parallel:
+        for rung in range(n_rungs):
+            if rung > 0 and time.time() >= deadline:
+                print(f"⏱️  Budget spent after {rung} rung(s); keeping current leader")
+                break
+
+            resources = []
+            for family, _ in candidates:
+                _, low, high = RESOURCE[family]
+                resources.append(min(high, low * HALVING_FACTOR ** rung))
+
+            scores = parallel(
+                delayed(_cv_score)(family, params, resource, X, y, splits, deadline)
+                for (family, params), resource in zip(candidates, resources)
+            )
+
+            ranked = sorted(((s, i) for i, s in enumerate(scores) if s is not None), key=lambda s: -s[0])
+            if not ranked:
+                print(f"⏱️  Budget spent before any candidate of rung {rung} finished")
+                break
+            history.append({
+                "rung": rung,
+                "candidates": len(candidates),
+                "evaluated": len(ranked),
+                "best_score": ranked[0][0],
+                "elapsed_seconds": round(time.monotonic() - started, 2),
+            })
+            leader = (candidates[ranked[0][1]], resources[ranked[0][1]], ranked[0][0])
+            if len(ranked) < len(candidates):
+                print(f"⏱️  Budget spent during rung {rung}; keeping current leader")
+                break
+
+            keep = max(1, len(candidates) // HALVING_FACTOR)
+            candidates = [candidates[i] for _, i in ranked[:keep]]
+            if len(candidates) == 1 and rung > 0:
+                break
+
+    if leader is None:
+        return {"success": False, "message": "Budget spent before any candidate was evaluated"}
+    (family, params), resource, score = leader
+    estimator = build_estimator(family, params, resource)
+    if family == 'random_forest':
+        estimator.set_params(n_jobs=n_jobs)
+    X_frame = pd.DataFrame(X, columns=FEATURE_COLS)
+    estimator.fit(X_frame, y)
+
+    pm = PredictiveMaintenanceModel()
+    pm.model = estimator
+    pm.label_encoders = {'voltage_level': encoder}
+    pm.save_model(
+        training_samples=len(y),
+        **rebuild_info(estimator, data),
+        drift_reference=training_reference(estimator, X_frame),
+        selection={
+            "family": family,
+            "params": {k: v for k, v in estimator.get_params().items() if k in params or k == RESOURCE[family][0]},
+            "cv_score": score,
+            "cv_scheme": CV_SCHEME,
+            "cv_splits": n_splits,
+            "rungs": history,
+        }
+    )
+
+    elapsed = time.monotonic() - started
+    print(f"✅ Selected {family} (cv f1={score:.3f}) in {elapsed:.1f}s")
+    return {
+        "success": True,
+        "model_version": pm.model_version,
+        "family": family,
+        "cv_score": score,
+        "elapsed_seconds": round(elapsed, 2),
+        "rungs": history,
+    }
+
+
+if __name__ == "__main__":
+    from database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Search and register the best maintenance model")
+    parser.add_argument("--budget", type=float, default=DEFAULT_BUDGET_SECONDS, help="wall-clock budget in seconds")
+    parser.add_argument("--candidates", type=int, default=DEFAULT_CANDIDATES, help="configurations in the first rung")
+    parser.add_argument("--n-jobs", type=int, default=-1, help="worker processes (-1 = all cores)")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        select_model(db, budget_seconds=args.budget, n_candidates=args.candidates, n_jobs=args.n_jobs)
+    finally:
+        db.close()
@@ -1,115 +1,499 @@
 import pandas as pd
 import numpy as np
+from sklearn.base import clone
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import LabelEncoder
 from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score, confusion_matrix
 import joblib
-from datetime import datetime
+import copy
+import hashlib
+import json
+import os
+import shutil
+import threading
+from datetime import date, datetime, timedelta
 from sqlalchemy.orm import Session
-from database import TransmissionLine, TrippingIncident, TowerLocation
+from database import LinePrediction, SessionLocal, upsert_rows
+from sync import current_seq
+from ai_models.feature_store import load_line_features
+from ai_models.compiled_forest import CompiledForest, UnsupportedModel, compile_forest
+from ai_models import drift
+
+# Models saved before versioned artifacts; still loaded when model_info.json names no directory
+MODEL_PATH = 'predictive_maintenance_model.pkl'
+ENCODERS_PATH = 'label_encoders.pkl'
+COMPILED_PATH = 'predictive_maintenance_model.forest'
+
+# Each save writes its artifacts to MODEL_DIR/<version>/ and then atomically
+# replaces model_info.json, which names that directory: readers never see a
+# half-written file or a model paired with another version's encoders.
+MODEL_INFO_PATH = 'model_info.json'
+MODEL_DIR = 'models'
+KEEP_VERSIONS = 3
+
+# Score with the flattened forest instead of sklearn's predict_proba (same results)
+COMPILED_INFERENCE = os.getenv('COMPILED_INFERENCE', '1') != '0'
+
+# Incremental updates: trees added per update, and when to rebuild from scratch instead
+BASE_TREES = 100
+INCREMENT_TREES = 20
+MAX_TREES = 200
+FULL_REBUILD_DAYS = int(os.getenv('MODEL_FULL_REBUILD_DAYS', '7'))
+MAX_CHANGED_FRACTION = 0.5
+# Unchanged lines replayed per changed line, so new trees still see the whole network
+REPLAY_RATIO = 1.0
+
+FEATURE_COLS = ['total_length_km', 'line_age', 'incident_count',
+                'recent_incidents', 'tower_count', 'poor_tower_count',
+                'voltage_encoded']
+
+# Stored per-line inputs that determine a prediction (voltage is encoded later).
+# The commission date stands in for line_age, which grows every day without
+# any data changing.
+HASHED_FEATURES = ['voltage_level', 'total_length_km', 'commission_date', 'incident_count',
+                   'recent_incidents', 'tower_count', 'poor_tower_count']
+
+
+def feature_hash(features):
+    """Stable digest of the inputs a line's prediction depends on"""
+    payload = json.dumps([features[name] for name in HASHED_FEATURES], default=str)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+def rebuild_info(model, data):
+    """model_info entries of a model fitted from scratch on `data`"""
+    return {
+        'training_mode': 'full',
+        'rebuilt_at': datetime.utcnow().isoformat(),
+        'base_trees': model.n_estimators if isinstance(model, RandomForestClassifier) else None,
+        'updates_since_rebuild': 0,
+        'data': data,
+    }
+
+
+def training_reference(model, X):
+    """Drift reference: the training features and the risk probabilities predicted for them"""
+    return drift.reference_profile(X, model.predict_proba(X).max(axis=1))
+
+
+def data_version(db: Session, df):
+    """What a model was trained on: the change log seq, the feature window date
+    and each line's feature hash"""
+    return {
+        'seq': current_seq(db),
+        'as_of': date.today().isoformat(),
+        'line_hashes': {str(row['line_id']): feature_hash(row) for row in df.to_dict('records')},
+    }
+
+
+def _write_json_atomic(path, data):
+    tmp = f"{path}.tmp{os.getpid()}"
+    with open(tmp, 'w') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp, path)
+
+
+def _prune_versions(keep):
+    """Remove artifact directories of all but the newest `keep` versions"""
+    try:
+        versions = sorted(os.listdir(MODEL_DIR))
+    except OSError:
+        return
+    for name in versions[:-keep]:
+        shutil.rmtree(os.path.join(MODEL_DIR, name), ignore_errors=True)
+
+
+def retrain_after_drift():
+    """Background retrain started by the drift monitor"""
+    db = SessionLocal()
+    try:
+        result = PredictiveMaintenanceModel().update_model(db)
+        print(f"🔁 Drift retrain ({result.get('mode')}): model {result.get('model_version')}")
+    finally:
+        db.close()
+
 
 class PredictiveMaintenanceModel:
     def __init__(self):
         self.model = None
         self.label_encoders = {}
+        self.model_info = {}
+        self.forest = None
+        self._info_mtime = None
+        # Requests run in FastAPI's threadpool; a (re)loaded or retrained model is swapped in under it
+        self.lock = threading.RLock()
+
+    @property
+    def model_version(self):
+        return self.model_info.get('version')
 
     def prepare_features(self, db: Session):
-        """Extract features from database for ML model"""
-        lines = db.query(TransmissionLine).all()
+        """Extract features from the feature store for ML model"""
         data = []
 
-        for line in lines:
-            line_age = (datetime.now().date() - line.commission_date).days / 365
-
-            incidents = db.query(TrippingIncident).filter(
-                TrippingIncident.transmission_line_id == line.id
-            ).all()
-            incident_count = len(incidents)
-            recent_incidents = len([i for i in incidents
-                                   if (datetime.now().date() - i.fault_date).days <= 180])
-
-            towers = db.query(TowerLocation).filter(
-                TowerLocation.transmission_line_id == line.id
-            ).all()
-            poor_towers = len([t for t in towers if t.condition in ['Needs Inspection', 'Under Repair']])
-
-            if recent_incidents > 3:
+        for features in load_line_features(db):
+            if features['recent_incidents'] > 3:
                 risk_score = 2
-            elif recent_incidents > 1 or line_age > 30 or poor_towers > 2:
+            elif features['recent_incidents'] > 1 or features['line_age'] > 30 or features['poor_tower_count'] > 2:
                 risk_score = 1
             else:
                 risk_score = 0
 
-            data.append({
-                'line_id': line.id,
-                'line_name': line.line_name,
-                'voltage_level': line.voltage_level,
-                'total_length_km': line.total_length_km,
-                'line_age': line_age,
-                'incident_count': incident_count,
-                'recent_incidents': recent_incidents,
-                'tower_count': len(towers),
-                'poor_tower_count': poor_towers,
-                'risk_level': risk_score
-            })
+            features['risk_level'] = risk_score
+            data.append(features)
 
         return pd.DataFrame(data)
 
-    def train_model(self, db: Session):
-        """Train the predictive maintenance model"""
+    def save_model(self, **info):
+        """Persist the model and stamp it with a new version"""
+        version = datetime.utcnow().strftime('%Y%m%d%H%M%S%f')
+        directory = os.path.join(MODEL_DIR, version)
+        tmp = f"{directory}.tmp{os.getpid()}"
+        os.makedirs(tmp)
+        joblib.dump(self.model, os.path.join(tmp, 'model.pkl'))
+        joblib.dump(self.label_encoders, os.path.join(tmp, 'label_encoders.pkl'))
+        try:
+            self.forest = compile_forest(self.model)
+            info['compiled_forest'] = self.forest.save(os.path.join(tmp, 'model.forest'))
+        except UnsupportedModel:
+            self.forest = None
+        os.replace(tmp, directory)
+
+        self.model_info = {
+            'version': version,
+            'trained_at': datetime.utcnow().isoformat(),
+            'estimator': type(self.model).__name__,
+            'artifacts': directory,
+            **info
+        }
+        _write_json_atomic(MODEL_INFO_PATH, self.model_info)
+        self._info_mtime = os.path.getmtime(MODEL_INFO_PATH)
+        _prune_versions(KEEP_VERSIONS)
+
+    def load_model(self):
+        """Load the persisted model; raises if it has not been trained yet"""
+        loaded = PredictiveMaintenanceModel()
+        if os.path.exists(MODEL_INFO_PATH):
+            loaded._info_mtime = os.path.getmtime(MODEL_INFO_PATH)
+            with open(MODEL_INFO_PATH) as f:
+                loaded.model_info = json.load(f)
+        directory = loaded.model_info.get('artifacts')
+        if directory:
+            loaded.model = joblib.load(os.path.join(directory, 'model.pkl'))
+            loaded.label_encoders = joblib.load(os.path.join(directory, 'label_encoders.pkl'))
+        else:
+            loaded.model = joblib.load(MODEL_PATH)
+            loaded.label_encoders = joblib.load(ENCODERS_PATH)
+            if not loaded.model_info:
+                # Model trained before versioning: derive a version from its bytes
+                with open(MODEL_PATH, 'rb') as f:
+                    digest = hashlib.sha1(f.read()).hexdigest()
+                loaded.model_info = {'version': f'legacy-{digest[:12]}'}
+        loaded.forest = loaded._load_forest()
+        self._adopt(loaded)
+
+    def _adopt(self, other):
+        """Switch to another instance's fitted state in one step under the lock"""
+        with self.lock:
+            self.model = other.model
+            self.label_encoders = other.label_encoders
+            self.model_info = other.model_info
+            self.forest = other.forest
+            self._info_mtime = other._info_mtime
+
+    def _snapshot(self):
+        """Shallow copy of the fitted state, unaffected by a later swap"""
+        snapshot = PredictiveMaintenanceModel()
+        with self.lock:
+            snapshot._adopt(self)
+        return snapshot
+
+    def _load_forest(self):
+        """Memory-map the compiled forest saved with the model, or compile it in memory"""
+        layout = self.model_info.get('compiled_forest')
+        directory = self.model_info.get('artifacts')
+        path = os.path.join(directory, 'model.forest') if directory else COMPILED_PATH
+        forest = CompiledForest.load(path, layout) if layout else None
+        if forest is None:
+            try:
+                forest = compile_forest(self.model)
+            except UnsupportedModel:
+                return None
+        return forest
+
+    def score(self, X):
+        """(classes, probabilities, explanations) for a FEATURE_COLS frame.
+
+        Explanations come from the compiled forest's path attribution: per
+        row, the forest's base probability of the predicted class and each
+        feature's contribution to it, largest first. They are None for
+        models that cannot be compiled and when COMPILED_INFERENCE is off.
+        """
+        if not COMPILED_INFERENCE or self.forest is None:
+            return self.model.classes_, self.model.predict_proba(X), [None] * len(X)
+
+        probabilities, bias, contributions = self.forest.explain(X.to_numpy(dtype=np.float32))
+        explanations = []
+        for k, row in zip(probabilities.argmax(axis=1), contributions):
+            ranked = sorted(zip(FEATURE_COLS, row[:, k]), key=lambda item: abs(item[1]), reverse=True)
+            explanations.append({
+                'base_probability': round(float(bias[k]), 4),
+                'contributions': [{'feature': name, 'contribution': round(float(value), 4)} for name, value in ranked],
+            })
+        return self.forest.classes_, probabilities, explanations
+
+    def model_updated_on_disk(self):
+        """True if a newer model has been saved since this one was loaded"""
+        try:
+            return os.path.getmtime(MODEL_INFO_PATH) != self._info_mtime
+        except OSError:
+            return False
+
+    def train_model(self, db: Session, estimator=None):
+        """Train the predictive maintenance model (a fresh default forest unless
+        an unfitted estimator is given).
+
+        Fits and saves a new instance, then swaps it in, so requests keep
+        scoring with the current model until the new one is complete.
+        """
         df = self.prepare_features(db)
         if len(df) < 10:
             print("Not enough data to train model")
             return False
 
+        trained = PredictiveMaintenanceModel()
         le_voltage = LabelEncoder()
         df['voltage_encoded'] = le_voltage.fit_transform(df['voltage_level'])
-        self.label_encoders['voltage_level'] = le_voltage
+        trained.label_encoders = {'voltage_level': le_voltage}
 
-        feature_cols = ['total_length_km', 'line_age', 'incident_count',
-                       'recent_incidents', 'tower_count', 'poor_tower_count',
-                       'voltage_encoded']
-        X = df[feature_cols]
+        X = df[FEATURE_COLS]
         y = df['risk_level']
 
-        self.model = RandomForestClassifier(n_estimators=100, random_state=42)
-        self.model.fit(X, y)
+        trained.model = estimator if estimator is not None else RandomForestClassifier(n_estimators=BASE_TREES, random_state=42)
+        trained.model.fit(X, y)
 
-        joblib.dump(self.model, 'predictive_maintenance_model.pkl')
-        joblib.dump(self.label_encoders, 'label_encoders.pkl')
+        trained.save_model(training_samples=len(df), **rebuild_info(trained.model, data_version(db, df)),
+                           drift_reference=training_reference(trained.model, X))
+        self._adopt(trained)
 
         print("Model trained successfully!")
         return True
 
-    def predict_maintenance_needs(self, db: Session):
-        """Predict which lines need maintenance"""
+    def _rebuild_reason_without_data(self):
+        """Why the current model must be rebuilt whatever the data (None if it need not)"""
+        data = self.model_info.get('data')
+        if self.model is None or data is None:
+            return 'no data version recorded for the current model'
+        if not isinstance(self.model, RandomForestClassifier):
+            return f'{type(self.model).__name__} cannot grow trees incrementally'
+        rebuilt_at = self.model_info.get('rebuilt_at')
+        if rebuilt_at is None or datetime.fromisoformat(rebuilt_at) < datetime.utcnow() - timedelta(days=FULL_REBUILD_DAYS):
+            return f'last full rebuild is older than {FULL_REBUILD_DAYS} days'
+        return None
+
+    def _rebuild_reason(self, df, changed):
+        """Why an incremental update is not possible (None if it is)"""
+        reason = self._rebuild_reason_without_data()
+        if reason is not None:
+            return reason
+        if self.model.n_estimators + INCREMENT_TREES > MAX_TREES:
+            return f'forest would exceed {MAX_TREES} trees'
+        if len(changed) > MAX_CHANGED_FRACTION * len(df):
+            return f'{len(changed)} of {len(df)} lines changed'
+        if not set(df['voltage_level']) <= set(self.label_encoders['voltage_level'].classes_):
+            return 'new voltage level'
+        if set(df['risk_level']) != set(self.model.classes_):
+            return 'risk classes differ from the trained model'
+        return None
+
+    def update_model(self, db: Session):
+        """Grow the forest on lines whose features changed since it was trained.
+
+        Nothing is refitted when no write has been logged and the feature
+        window has not moved since training. Otherwise lines are compared by
+        the hash of their stored inputs (not line_age, which moves daily).
+        New trees (warm start) are fitted on the changed lines plus a replay
+        sample of unchanged ones, with every risk class present so the class
+        set never shrinks. Falls back to train_model() when the model has no
+        data version, is not a random forest, is due for its periodic full
+        rebuild, would grow past MAX_TREES or most lines changed. Either
+        way the new trees grow on a copy that is swapped in once saved.
+        """
+        started = datetime.utcnow()
         if self.model is None:
             try:
-                self.model = joblib.load('predictive_maintenance_model.pkl')
-                self.label_encoders = joblib.load('label_encoders.pkl')
-            except:
-                print("Model not found. Training new model...")
-                self.train_model(db)
+                self.load_model()
+            except Exception:
+                pass
+        # Work from the current state; request threads may swap in a reloaded model meanwhile
+        base = self._snapshot()
+
+        data = base.model_info.get('data') or {}
+        if (data.get('seq') == current_seq(db) and data.get('as_of') == date.today().isoformat()
+                and base._rebuild_reason_without_data() is None):
+            return {"success": True, "mode": "none", "model_version": base.model_version,
+                    "message": "No writes since the model was trained"}
 
         df = self.prepare_features(db)
-        df['voltage_encoded'] = self.label_encoders['voltage_level'].transform(df['voltage_level'])
+        if len(df) < 10:
+            return {"success": False, "message": "Not enough data to train model"}
 
-        feature_cols = ['total_length_km', 'line_age', 'incident_count',
-                       'recent_incidents', 'tower_count', 'poor_tower_count',
-                       'voltage_encoded']
-        X = df[feature_cols]
+        trained = data.get('line_hashes', {})
+        hashes = [feature_hash(row) for row in df.to_dict('records')]
+        changed = df[[trained.get(str(line_id)) != digest for line_id, digest in zip(df['line_id'], hashes)]]
 
-        predictions = self.model.predict(X)
-        probabilities = self.model.predict_proba(X)
+        reason = base._rebuild_reason(df, changed)
+        if reason is None and changed.empty:
+            return {"success": True, "mode": "none", "model_version": base.model_version,
+                    "message": "Model already up to date"}
+        if reason is not None:
+            # Same estimator settings, fitted from scratch
+            template = None
+            if base.model is not None:
+                template = clone(base.model)
+                if isinstance(template, RandomForestClassifier):
+                    template.set_params(warm_start=False, n_estimators=base.model_info.get('base_trees') or BASE_TREES)
+            success = self.train_model(db, estimator=template)
+            return {"success": success, "mode": "full", "reason": reason, "model_version": self.model_version,
+                    "elapsed_seconds": round((datetime.utcnow() - started).total_seconds(), 3)}
 
-        df['predicted_risk'] = predictions
-        df['risk_probability'] = probabilities.max(axis=1)
+        df['voltage_encoded'] = base.label_encoders['voltage_level'].transform(df['voltage_level'])
+        changed = df.loc[changed.index]
+        unchanged = df.drop(changed.index)
+        updates = base.model_info.get('updates_since_rebuild', 0)
+        replay = unchanged.sample(min(len(unchanged), int(len(changed) * REPLAY_RATIO)), random_state=updates)
+        window = pd.concat([changed, replay])
+        for label in base.model.classes_:
+            if not (window['risk_level'] == label).any():
+                window = pd.concat([window, df[df['risk_level'] == label].head(1)])
 
-        high_risk_lines = df[df['predicted_risk'] >= 1].sort_values('risk_probability', ascending=False)
-        return high_risk_lines[['line_id', 'line_name', 'voltage_level',
-                               'line_age', 'recent_incidents', 'predicted_risk',
-                               'risk_probability']].to_dict('records')
+        base_version = base.model_version
+        updated = PredictiveMaintenanceModel()
+        updated.model = copy.deepcopy(base.model)
+        updated.label_encoders = base.label_encoders
+        updated.model.set_params(warm_start=True, n_estimators=base.model.n_estimators + INCREMENT_TREES)
+        updated.model.fit(window[FEATURE_COLS], window['risk_level'])
+        updated.model.set_params(warm_start=False)
+
+        updated.save_model(
+            training_samples=len(df),
+            training_mode='incremental',
+            rebuilt_at=base.model_info['rebuilt_at'],
+            base_trees=base.model_info.get('base_trees'),
+            updates_since_rebuild=updates + 1,
+            base_version=base_version,
+            update={'changed_lines': len(changed), 'replayed_lines': len(window) - len(changed),
+                    'trees': updated.model.n_estimators},
+            data=data_version(db, df),
+            drift_reference=training_reference(updated.model, df[FEATURE_COLS]),
+        )
+        self._adopt(updated)
+        return {"success": True, "mode": "incremental", "model_version": updated.model_version,
+                "changed_lines": len(changed), "trees": updated.model.n_estimators,
+                "elapsed_seconds": round((datetime.utcnow() - started).total_seconds(), 3)}
+
+    def select_model(self, db: Session, budget_seconds=None):
+        """Run the hyperparameter search and switch to the winning model"""
+        from ai_models.model_selection import select_model, DEFAULT_BUDGET_SECONDS
+
+        result = select_model(db, budget_seconds=budget_seconds or DEFAULT_BUDGET_SECONDS)
+        if result["success"]:
+            self.load_model()
+        return result
+
+    def predict_maintenance_needs(self, db: Session):
+        """Predict which lines need maintenance.
+
+        Predictions and their explanations are cached per line, keyed by
+        the feature hash and model version; only lines whose inputs changed
+        (or all lines after a retrain) are rescored, in one batch, and
+        upserted so concurrent scorers never collide on a line.
+        """
+        with self.lock:
+            if self.model is None:
+                try:
+                    self.load_model()
+                except:
+                    print("Model not found. Training new model...")
+                    self.train_model(db)
+            elif self.model_updated_on_disk():
+                # Retrained by another worker or the nightly model selection
+                self.load_model()
+            # One model for the whole request, even if a retrain is swapped in meanwhile
+            current = self._snapshot()
+
+        lines = load_line_features(db)
+        cached = {p.transmission_line_id: p for p in db.query(LinePrediction).all()}
+        reference = current.model_info.get('drift_reference')
+
+        stale = []
+        removed_bins = []  # drift bins of rescored lines under this model version
+        for features in lines:
+            features['feature_hash'] = feature_hash(features)
+            entry = cached.get(features['line_id'])
+            if (entry is None or entry.feature_hash != features['feature_hash']
+                    or entry.model_version != current.model_version
+                    or (entry.contributions is None and COMPILED_INFERENCE and current.forest is not None)
+                    or (entry.drift_bins is None and reference)):
+                stale.append(features)
+                if entry is not None and entry.model_version == current.model_version and entry.drift_bins:
+                    removed_bins.append(json.loads(entry.drift_bins))
+
+        if stale:
+            df = pd.DataFrame(stale)
+            df['voltage_encoded'] = current.label_encoders['voltage_level'].transform(df['voltage_level'])
+            classes, probabilities, explanations = current.score(df[FEATURE_COLS])
+            predictions = classes.take(probabilities.argmax(axis=1))
+            risk_probabilities = probabilities.max(axis=1)
+            bins = drift.line_bins(reference, df[FEATURE_COLS], risk_probabilities) if reference else None
+
+            now = datetime.utcnow()
+            upsert_rows(db, LinePrediction, [
+                {
+                    'transmission_line_id': features['line_id'],
+                    'feature_hash': features['feature_hash'],
+                    'model_version': current.model_version,
+                    'predicted_risk': int(predicted),
+                    'risk_probability': float(proba),
+                    'contributions': json.dumps(explanation) if explanation else None,
+                    'drift_bins': json.dumps(bins[i].tolist()) if bins is not None else None,
+                    'generated_at': now,
+                }
+                for i, (features, predicted, proba, explanation)
+                in enumerate(zip(stale, predictions, risk_probabilities, explanations))
+            ], ['transmission_line_id'])
+            db.commit()
+            cached = {p.transmission_line_id: p for p in db.query(LinePrediction).all()}
+
+            # The scored population changed, so move the rescored lines in its drift counts
+            if reference:
+                snapshot = drift.observe(db, current.model_version, reference, len(lines), bins, removed_bins,
+                                         on_drift=retrain_after_drift)
+                if snapshot is None:
+                    # Lines removed or rescored concurrently: recount from every line's cached bins
+                    counted = [json.loads(entry.drift_bins) for entry in (cached[f['line_id']] for f in lines)
+                               if entry.model_version == current.model_version and entry.drift_bins]
+                    drift.observe(db, current.model_version, reference, len(counted), counted, reset=True,
+                                  on_drift=retrain_after_drift)
+
+        results = []
+        for features in lines:
+            entry = cached[features['line_id']]
+            if entry.predicted_risk >= 1:
+                results.append({
+                    'line_id': features['line_id'],
+                    'line_name': features['line_name'],
+                    'voltage_level': features['voltage_level'],
+                    'line_age': features['line_age'],
+                    'recent_incidents': features['recent_incidents'],
+                    'predicted_risk': entry.predicted_risk,
+                    'risk_probability': entry.risk_probability,
+                    'explanation': json.loads(entry.contributions) if entry.contributions else None,
+                    'generated_at': entry.generated_at.isoformat()
+                })
+
+        return sorted(results, key=lambda r: r['risk_probability'], reverse=True)
 
     def get_model_metrics(self, db: Session):
         """Get model performance metrics"""
@@ -129,11 +513,7 @@ class PredictiveMaintenanceModel:
         le_voltage = LabelEncoder()
         df['voltage_encoded'] = le_voltage.fit_transform(df['voltage_level'])
         
-        feature_cols = ['total_length_km', 'line_age', 'incident_count', 
-                    'recent_incidents', 'tower_count', 'poor_tower_count', 
-                    'voltage_encoded']
-        
-        X = df[feature_cols]
+        X = df[FEATURE_COLS]
         y = df['risk_level']
         
         # Split data
@@ -150,7 +530,7 @@ class PredictiveMaintenanceModel:
         y_pred_proba = model.predict_proba(X_test)
         
         # Feature importance
-        feature_importance = dict(zip(feature_cols, model.feature_importances_))
+        feature_importance = dict(zip(FEATURE_COLS, model.feature_importances_))
         sorted_features = sorted(feature_importance.items(), key=lambda x: x[1], reverse=True)
         
         # Confusion matrix
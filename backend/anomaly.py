@@ -0,0 +1,329 @@
+"""Streaming anomaly detection on tripping incidents.
+
+Every new incident updates two O(1) detectors for its line:
+
+* trip_interval - EWMA mean/variance of the log time between trips and a
+  one-sided CUSUM on how much shorter than usual each interval is;
+* fault_type_rate - exponentially decayed 30-day and 365-day counts per
+  fault type, alerting when the short-term rate runs well above the
+  long-term one.
+
+State is a small JSON dict per line in anomaly_line_states, and the id of
+the last incident processed is the watermark in anomaly_watermarks, so
+every worker shares one detector and a restart resumes where it stopped.
+catch_up() processes every incident newer than the watermark in fault
+time order, then advances the watermark with a conditional UPDATE; a
+worker that lost the race to another one rolls back. It runs after each
+incident insert commits and from the "anomalies" scheduler job, which
+picks up incidents written by other processes. Alerts are stored in
+anomaly_alerts, pushed to an in-memory stream for long-polling and
+published on the live event bus.
+
+Run this module directly to catch up, or to rebuild the state from all
+incidents:
+
+    python anomaly.py [--rebuild]
+"""
+import argparse
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from database import (
+    SessionLocal, TrippingIncident, AnomalyAlert, AnomalyLineState, AnomalyWatermark, upsert_rows
+)
+from events import emit
+
+WATERMARK = "incidents"
+LEGACY_STATE_PATH = 'anomaly_state.json'  # imported once by the v18 migration
+
+# trip_interval
+EWMA_ALPHA = 0.1
+MIN_INTERVALS = 5
+CUSUM_SLACK = 0.5
+CUSUM_THRESHOLD = 4.0
+
+# fault_type_rate
+SHORT_WINDOW_DAYS = 30
+LONG_WINDOW_DAYS = 365
+RATE_RATIO = 3.0
+MIN_SHORT_COUNT = 3
+
+STREAM_SIZE = 1000
+
+
+def _decay(value, elapsed_days, window_days):
+    return value * math.exp(-max(elapsed_days, 0) / window_days)
+
+
+class AlertStream:
+    """Bounded in-memory feed of recent alerts that readers can wait on"""
+
+    def __init__(self, size=STREAM_SIZE):
+        self.events = deque(maxlen=size)
+        self.condition = threading.Condition()
+
+    def publish(self, events):
+        with self.condition:
+            self.events.extend(events)
+            self.condition.notify_all()
+
+    def wait(self, after_id=0, timeout=25.0):
+        """Events with id > after_id, blocking up to `timeout` seconds for one to arrive"""
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while True:
+                events = [e for e in self.events if e["id"] > after_id]
+                remaining = deadline - time.monotonic()
+                if events or remaining <= 0:
+                    return events
+                self.condition.wait(remaining)
+
+
+def new_state():
+    return {"last_at": None, "intervals": 0, "mean": 0.0, "var": 0.0, "cusum": 0.0, "fault_types": {}}
+
+
+class IncidentAnomalyDetector:
+    def __init__(self):
+        self.lock = threading.Lock()  # one catch-up per worker at a time
+        self.stream = AlertStream()
+
+    # ---------- state ----------
+
+    @staticmethod
+    def watermark(db: Session):
+        """Id of the last incident processed, creating the watermark row if missing"""
+        row = db.query(AnomalyWatermark).filter(AnomalyWatermark.name == WATERMARK).first()
+        if row is not None:
+            return row.last_incident_id
+        try:
+            db.add(AnomalyWatermark(name=WATERMARK, last_incident_id=0))
+            db.commit()
+        except IntegrityError:
+            db.rollback()  # another worker created it
+        return db.query(AnomalyWatermark.last_incident_id).filter(AnomalyWatermark.name == WATERMARK).scalar()
+
+    @staticmethod
+    def load_states(db: Session, line_ids):
+        rows = db.query(AnomalyLineState).filter(AnomalyLineState.transmission_line_id.in_(line_ids)).all()
+        return {row.transmission_line_id: json.loads(row.state) for row in rows}
+
+    @staticmethod
+    def _claim(db: Session, previous, watermark):
+        """Advance the watermark if no other worker did since it was read"""
+        result = db.execute(
+            update(AnomalyWatermark)
+            .where(AnomalyWatermark.name == WATERMARK, AnomalyWatermark.last_incident_id == previous)
+            .values(last_incident_id=watermark, updated_at=datetime.utcnow())
+        )
+        return result.rowcount == 1
+
+    # ---------- detectors ----------
+
+    def observe(self, state, incident_id, line_id, fault_type, fault_at):
+        """Update one line's state with a new incident; returns alert dicts"""
+        alerts = []
+        last_at = datetime.fromisoformat(state["last_at"]) if state["last_at"] else None
+
+        # Late (back-dated) incidents still count towards fault type rates but
+        # cannot be placed in the interval sequence
+        if last_at is not None and fault_at >= last_at:
+            hours = (fault_at - last_at).total_seconds() / 3600
+            x = math.log1p(hours)
+            if state["intervals"] >= MIN_INTERVALS:
+                std = math.sqrt(state["var"]) or 1.0
+                z = (state["mean"] - x) / std
+                state["cusum"] = max(0.0, state["cusum"] + z - CUSUM_SLACK)
+                if state["cusum"] > CUSUM_THRESHOLD:
+                    alerts.append({
+                        "detector": "trip_interval",
+                        "fault_type": None,
+                        "score": round(state["cusum"], 3),
+                        "threshold": CUSUM_THRESHOLD,
+                        "message": f"Trips are arriving much faster than usual "
+                                   f"(last interval {hours:.1f} h, typical {math.expm1(state['mean']):.1f} h)",
+                    })
+                    state["cusum"] = 0.0
+            if state["intervals"] == 0:
+                state["mean"] = x
+            else:
+                delta = x - state["mean"]
+                state["mean"] += EWMA_ALPHA * delta
+                state["var"] = (1 - EWMA_ALPHA) * (state["var"] + EWMA_ALPHA * delta * delta)
+            state["intervals"] += 1
+        if last_at is None or fault_at > last_at:
+            state["last_at"] = fault_at.isoformat()
+
+        # [short count, long count, last update, alerting] per fault type
+        short, long_, updated, alerting = state["fault_types"].get(
+            fault_type, [0.0, 0.0, fault_at.isoformat(), False]
+        )
+        elapsed = (fault_at - datetime.fromisoformat(updated)).total_seconds() / 86400
+        short = _decay(short, elapsed, SHORT_WINDOW_DAYS) + 1
+        long_ = _decay(long_, elapsed, LONG_WINDOW_DAYS) + 1
+
+        ratio = (short / SHORT_WINDOW_DAYS) / (long_ / LONG_WINDOW_DAYS)
+        anomalous = short >= MIN_SHORT_COUNT and ratio > RATE_RATIO and long_ > short
+        state["fault_types"][fault_type] = [
+            short, long_, max(fault_at, datetime.fromisoformat(updated)).isoformat(), anomalous
+        ]
+        # Alert once when a burst starts, not on every trip during it
+        if anomalous and not alerting:
+            alerts.append({
+                "detector": "fault_type_rate",
+                "fault_type": fault_type,
+                "score": round(ratio, 3),
+                "threshold": RATE_RATIO,
+                "message": f"{fault_type} trips are running at {ratio:.1f}x their yearly rate",
+            })
+
+        for alert in alerts:
+            alert.update(transmission_line_id=line_id, incident_id=incident_id, fault_at=fault_at)
+        return alerts
+
+    # ---------- ingestion ----------
+
+    def catch_up(self, db: Session, chunk_size=1000):
+        """Process every incident newer than the watermark, in fault time order.
+        Returns the number processed (0 if another worker got there first)."""
+        with self.lock:
+            previous = self.watermark(db)
+            pending = TrippingIncident.id > previous, TrippingIncident.fault_at.isnot(None)
+            line_ids = [line_id for (line_id,) in db.query(TrippingIncident.transmission_line_id)
+                        .filter(*pending).distinct()]
+            if not line_ids:
+                return 0
+            states = self.load_states(db, line_ids)
+
+            query = db.query(
+                TrippingIncident.id, TrippingIncident.transmission_line_id,
+                TrippingIncident.fault_type, TrippingIncident.fault_at
+            ).filter(*pending).order_by(TrippingIncident.fault_at, TrippingIncident.id)
+
+            processed = 0
+            watermark = previous
+            touched = set()
+            alerts = []
+            for row in query.yield_per(chunk_size):
+                if row.transmission_line_id not in states:
+                    # A line whose first new incident committed after line_ids was read
+                    states.update(self.load_states(db, [row.transmission_line_id]))
+                state = states.setdefault(row.transmission_line_id, new_state())
+                alerts.extend(self.observe(state, row.id, row.transmission_line_id, row.fault_type, row.fault_at))
+                touched.add(row.transmission_line_id)
+                watermark = max(watermark, row.id)
+                processed += 1
+            if not processed:
+                return 0
+
+            if not self._claim(db, previous, watermark):
+                db.rollback()
+                return 0
+            now = datetime.utcnow()
+            upsert_rows(db, AnomalyLineState, [
+                {"transmission_line_id": line_id, "state": json.dumps(states[line_id]), "updated_at": now}
+                for line_id in touched
+            ], ["transmission_line_id"])
+            self._store_alerts(db, alerts)
+            return processed
+
+    def _store_alerts(self, db: Session, alerts):
+        """Store new alerts and commit together with the state"""
+        if not alerts:
+            db.commit()
+            return
+        # A rebuild replays incidents that already raised alerts
+        existing = {
+            (row.detector, row.incident_id)
+            for row in db.query(AnomalyAlert.detector, AnomalyAlert.incident_id).filter(
+                AnomalyAlert.incident_id.in_({a["incident_id"] for a in alerts})
+            ).all()
+        }
+        rows = [AnomalyAlert(**alert) for alert in alerts
+                if (alert["detector"], alert["incident_id"]) not in existing]
+        db.add_all(rows)
+        db.flush()
+        events = [alert_to_dict(row) for row in rows]
+        for event in events:
+            emit(db, "alert", event)
+        db.commit()
+        self.stream.publish(events)
+
+    def rebuild(self, db: Session):
+        """Replay all incidents from an empty state (alerts already stored are kept)"""
+        with self.lock:
+            previous = self.watermark(db)
+            db.query(AnomalyLineState).delete(synchronize_session=False)
+            if not self._claim(db, previous, 0):
+                db.rollback()
+                raise RuntimeError("Anomaly watermark moved during the rebuild; run it again")
+            db.commit()
+        return self.catch_up(db)
+
+
+def alert_to_dict(alert):
+    return {
+        "id": alert.id,
+        "line_id": alert.transmission_line_id,
+        "incident_id": alert.incident_id,
+        "detector": alert.detector,
+        "fault_type": alert.fault_type,
+        "score": alert.score,
+        "threshold": alert.threshold,
+        "message": alert.message,
+        "fault_at": alert.fault_at.isoformat() if alert.fault_at else None,
+        "created_at": alert.created_at.isoformat() if alert.created_at else None,
+        "acknowledged": alert.acknowledged,
+    }
+
+
+detector = IncidentAnomalyDetector()
+
+
+def process_new_incidents():
+    """Run the detector over incidents committed since the last call"""
+    db = SessionLocal()
+    try:
+        return detector.catch_up(db)
+    finally:
+        db.close()
+
+
+def import_state_file(db: Session, path=LEGACY_STATE_PATH):
+    """Seed the database state from an anomaly_state.json checkpoint if there is
+    one, then catch up; without one the detector replays every incident"""
+    if os.path.exists(path):
+        with open(path) as f:
+            state = json.load(f)
+        known = {line_id for (line_id,) in db.query(TrippingIncident.transmission_line_id).distinct()}
+        upsert_rows(db, AnomalyLineState, [
+            {"transmission_line_id": int(line_id), "state": json.dumps(line_state), "updated_at": datetime.utcnow()}
+            for line_id, line_state in state.get("lines", {}).items() if int(line_id) in known
+        ], ["transmission_line_id"])
+        previous = detector.watermark(db)
+        detector._claim(db, previous, state.get("watermark", 0))
+        db.commit()
+    return detector.catch_up(db)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the incident anomaly detector")
+    parser.add_argument("--rebuild", action="store_true", help="replay all incidents from an empty state")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        processed = detector.rebuild(db) if args.rebuild else detector.catch_up(db)
+        lines = db.query(AnomalyLineState).count()
+        print(f"✅ Processed {processed} incidents in {(time.perf_counter() - started) * 1000:.1f} ms "
+              f"({lines} lines tracked)")
+    finally:
+        db.close()
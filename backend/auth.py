@@ -1,10 +1,10 @@
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Query, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
-from database import get_db, User
+from database import get_db, SessionLocal, User
 import hashlib
 
 # Security configuration
@@ -13,6 +13,7 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 1440  # 24 hours
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login")
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login", auto_error=False)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against a hash using SHA256"""
@@ -60,6 +61,18 @@ def get_current_active_user(current_user: User = Depends(get_current_user)):
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
 
+def get_stream_user(token: Optional[str] = Depends(optional_oauth2_scheme),
+                    access_token: Optional[str] = Query(None)):
+    """Authenticate a long-lived stream from the header or ?access_token=,
+    without keeping a database session open for the stream's lifetime"""
+    db = SessionLocal()
+    try:
+        user = get_current_user(token or access_token or "", db)
+        db.expunge(user)
+    finally:
+        db.close()
+    return get_current_active_user(user)
+
 def require_admin(current_user: User = Depends(get_current_active_user)):
     """Require admin role"""
     if current_user.role != "admin":
@@ -0,0 +1,300 @@
+"""Transmission availability (MOU / CEA norms) computed from tripping incidents.
+
+Each incident becomes an outage interval. Overlapping intervals on a line
+are merged with a sort-and-sweep, clipped to calendar months and stored as
+per-line monthly outage minutes in `availability_rollups`. Availability for
+a line, office or region is derived from those rows at read time, weighting
+each line by its length and voltage class.
+
+Writes only recompute the months an incident touches; run this module
+directly for a full rebuild:
+
+    python availability.py
+"""
+import calendar
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+from database import SessionLocal, TransmissionLine, AvailabilityRollup, MaintenanceOffice, State, incident_timestamps
+from incident_archive import incident_source
+
+# MOU target availability for AC transmission systems
+TARGET_AVAILABILITY_PCT = 99.75
+
+# Outages the licensee is not responsible for are deemed available
+EXCLUDED_ATTRIBUTIONS = ("NO",)
+
+# Approximate sub-conductor count per voltage class, used as the CEA-style
+# weightage factor together with the line length
+VOLTAGE_WEIGHTS = {"132 KV": 1, "220 KV": 1, "400 KV": 2, "765 KV": 4, "800 KV": 4}
+
+
+def outage_interval(incident):
+    """(start, end) datetimes of an incident's outage, or None if it has no duration"""
+    start, end = incident.fault_at, incident.restored_at
+    if start is None:
+        start, end = incident_timestamps(
+            incident.fault_date, incident.fault_time, incident.restoration_time, incident.downtime_minutes
+        )
+    if start is None or end is None or end <= start:
+        return None
+    return start, end
+
+
+def merge_intervals(intervals):
+    """Merge overlapping (start, end) intervals with a sort-and-sweep"""
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return [(start, end) for start, end in merged]
+
+
+def month_bounds(year, month):
+    start = datetime(year, month, 1)
+    days = calendar.monthrange(year, month)[1]
+    return start, start + timedelta(days=days)
+
+
+def months_spanned(start, end):
+    """(year, month) pairs an interval overlaps"""
+    months = []
+    year, month = start.year, start.month
+    while datetime(year, month, 1) < end:
+        months.append((year, month))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+
+def incident_months(incident):
+    """(line_id, year, month) keys whose availability depends on this incident"""
+    interval = outage_interval(incident)
+    if interval is None:
+        return set()
+    return {(incident.transmission_line_id, y, m) for y, m in months_spanned(*interval)}
+
+
+def monthly_outages(incidents):
+    """{(line_id, year, month): (outage_minutes, outage_count)} from merged intervals"""
+    by_line = defaultdict(list)
+    for incident in incidents:
+        if incident.attributed_to_powergrid in EXCLUDED_ATTRIBUTIONS:
+            continue
+        interval = outage_interval(incident)
+        if interval:
+            by_line[incident.transmission_line_id].append(interval)
+
+    totals = defaultdict(lambda: [0.0, 0])
+    for line_id, intervals in by_line.items():
+        for start, end in merge_intervals(intervals):
+            for year, month in months_spanned(start, end):
+                month_start, month_end = month_bounds(year, month)
+                minutes = (min(end, month_end) - max(start, month_start)).total_seconds() / 60
+                totals[(line_id, year, month)][0] += minutes
+                totals[(line_id, year, month)][1] += 1
+    return {key: tuple(value) for key, value in totals.items()}
+
+
+def recompute_months(db: Session, keys):
+    """Recompute the stored rollups for the given (line_id, year, month) keys. Does not commit."""
+    keys = set(keys)
+    if not keys:
+        return 0
+    db.flush()
+
+    by_line_month = defaultdict(set)
+    for line_id, year, month in keys:
+        by_line_month[line_id].add((year, month))
+
+    for line_id, months in by_line_month.items():
+        first = min(months)
+        last = max(months)
+        window_start = month_bounds(*first)[0]
+        window_end = month_bounds(*last)[1]
+
+        # Every outage overlapping the window, however long ago it started
+        source = incident_source(db, None, window_end.date())
+        incidents = db.query(source).filter(
+            source.c.transmission_line_id == line_id,
+            or_(
+                and_(source.c.fault_at < window_end, source.c.restored_at > window_start),
+                # Not stamped yet: outage_interval() derives the interval itself
+                and_(source.c.fault_at.is_(None), source.c.fault_date < window_end.date()),
+            )
+        ).all()
+        outages = monthly_outages(incidents)
+
+        db.query(AvailabilityRollup).filter(
+            AvailabilityRollup.transmission_line_id == line_id,
+            (AvailabilityRollup.year * 100 + AvailabilityRollup.month).in_([y * 100 + m for y, m in months])
+        ).delete(synchronize_session=False)
+
+        for year, month in months:
+            minutes, count = outages.get((line_id, year, month), (0.0, 0))
+            if count:
+                db.add(AvailabilityRollup(
+                    transmission_line_id=line_id, year=year, month=month,
+                    outage_minutes=minutes, outage_count=count, updated_at=datetime.utcnow()
+                ))
+
+    db.flush()
+    return len(keys)
+
+
+def rebuild_availability(db: Session):
+    """Recompute every rollup from scratch, streaming incidents line by line"""
+    db.query(AvailabilityRollup).delete(synchronize_session=False)
+
+    rows = 0
+    line_ids = [row.id for row in db.query(TransmissionLine.id).all()]
+    source = incident_source(db)
+    for line_id in line_ids:
+        incidents = db.query(source).filter(
+            source.c.transmission_line_id == line_id
+        ).yield_per(1000)
+        now = datetime.utcnow()
+        for (_, year, month), (minutes, count) in monthly_outages(incidents).items():
+            db.add(AvailabilityRollup(
+                transmission_line_id=line_id, year=year, month=month,
+                outage_minutes=minutes, outage_count=count, updated_at=now
+            ))
+            rows += 1
+        db.flush()
+
+    db.commit()
+    return rows
+
+
+# ==================== READ SIDE ====================
+
+def line_weight(line):
+    return (line.total_length_km or 0) * VOLTAGE_WEIGHTS.get(line.voltage_level, 1)
+
+
+def _period_minutes(line, year, month=None):
+    """Minutes the line was in service during the month (or year)"""
+    months = [month] if month else range(1, 13)
+    today = datetime.now()
+    total = 0.0
+    for m in months:
+        start, end = month_bounds(year, m)
+        if line.commission_date:
+            start = max(start, datetime.combine(line.commission_date, time(0, 0)))
+        end = min(end, today)
+        if end > start:
+            total += (end - start).total_seconds() / 60
+    return total
+
+
+def get_availability(db: Session, year: int, month: int = None, level: str = "line"):
+    """Availability for a month (or the whole year) grouped by line, office or region"""
+    lines = db.query(TransmissionLine).join(MaintenanceOffice).join(State).all()
+
+    outage_query = db.query(AvailabilityRollup).filter(AvailabilityRollup.year == year)
+    if month:
+        outage_query = outage_query.filter(AvailabilityRollup.month == month)
+    outages = defaultdict(lambda: [0.0, 0])
+    for row in outage_query.all():
+        outages[row.transmission_line_id][0] += row.outage_minutes
+        outages[row.transmission_line_id][1] += row.outage_count
+
+    per_line = []
+    for line in lines:
+        period = _period_minutes(line, year, month)
+        if period <= 0:
+            continue
+        minutes, count = outages.get(line.id, (0.0, 0))
+        per_line.append({
+            "line_id": line.id,
+            "line_name": line.line_name,
+            "voltage_level": line.voltage_level,
+            "maintenance_office": line.maintenance_office.name,
+            "region": line.state.region,
+            "weight": line_weight(line),
+            "outage_minutes": round(minutes, 2),
+            "outage_count": count,
+            "availability_pct": round(100 * (1 - min(minutes, period) / period), 4),
+        })
+    for row in per_line:
+        row["meets_target"] = row["availability_pct"] >= TARGET_AVAILABILITY_PCT
+
+    if level == "line":
+        return per_line
+
+    key = "maintenance_office" if level == "office" else "region"
+    groups = defaultdict(list)
+    for row in per_line:
+        groups[row[key]].append(row)
+
+    result = []
+    for name, rows in sorted(groups.items()):
+        total_weight = sum(r["weight"] for r in rows)
+        if total_weight:
+            pct = sum(r["weight"] * r["availability_pct"] for r in rows) / total_weight
+        else:
+            pct = sum(r["availability_pct"] for r in rows) / len(rows)
+        result.append({
+            key: name,
+            "lines": len(rows),
+            "outage_minutes": round(sum(r["outage_minutes"] for r in rows), 2),
+            "outage_count": sum(r["outage_count"] for r in rows),
+            "availability_pct": round(pct, 4),
+            "meets_target": pct >= TARGET_AVAILABILITY_PCT,
+        })
+    return result
+
+
+def get_line_availability(db: Session, line_id: int, year: int):
+    """Monthly availability series for one line, plus the yearly figure"""
+    line = db.query(TransmissionLine).filter(TransmissionLine.id == line_id).first()
+    if line is None:
+        return None
+
+    outages = {
+        row.month: row
+        for row in db.query(AvailabilityRollup).filter(
+            AvailabilityRollup.transmission_line_id == line_id,
+            AvailabilityRollup.year == year
+        ).all()
+    }
+
+    months = []
+    total_period = total_outage = 0.0
+    for month in range(1, 13):
+        period = _period_minutes(line, year, month)
+        if period <= 0:
+            continue
+        row = outages.get(month)
+        minutes = min(row.outage_minutes, period) if row else 0.0
+        total_period += period
+        total_outage += minutes
+        months.append({
+            "month": month,
+            "outage_minutes": round(minutes, 2),
+            "outage_count": row.outage_count if row else 0,
+            "availability_pct": round(100 * (1 - minutes / period), 4),
+        })
+
+    yearly = round(100 * (1 - total_outage / total_period), 4) if total_period else None
+    return {
+        "line_id": line.id,
+        "line_name": line.line_name,
+        "year": year,
+        "availability_pct": yearly,
+        "meets_target": yearly is not None and yearly >= TARGET_AVAILABILITY_PCT,
+        "target_pct": TARGET_AVAILABILITY_PCT,
+        "months": months,
+    }
+
+
+if __name__ == "__main__":
+    db = SessionLocal()
+    try:
+        rows = rebuild_availability(db)
+        print(f"✅ Rebuilt availability rollups ({rows} line-months with outages)")
+    finally:
+        db.close()
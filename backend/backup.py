@@ -0,0 +1,184 @@
+"""Online backups of the SQLite database.
+
+online_copy() copies the live database with the SQLite backup API in
+steps of PAGES_PER_STEP pages. The source connection holds one read
+transaction for the whole copy, so the result is a consistent snapshot;
+with WAL, that read transaction does not block writers, and pausing
+between steps leaves the disk to them.
+
+create_backup() checkpoints the WAL (PASSIVE, never waits on writers),
+takes an online copy, checks its integrity, gzips it into BACKUP_DIR as
+powergrid-<UTC timestamp>.db.gz and prunes all but the newest RETAIN
+snapshots. restore_backup() writes a snapshot back into the database
+through the same API, so other connections never see a half-written file.
+The anomaly detector state and watermark live in the database, so they
+come back with the incidents they describe.
+
+    python backup.py                      # take a snapshot
+    python backup.py --list
+    python backup.py --checkpoint TRUNCATE
+    python backup.py --restore powergrid-20260101T000000Z.db.gz
+"""
+import argparse
+import gzip
+import os
+import shutil
+import sqlite3
+import time
+from datetime import datetime
+from database import SessionLocal, engine, is_sqlite
+
+BACKUP_DIR = os.getenv("BACKUP_DIR", "backups")
+RETAIN = int(os.getenv("BACKUP_RETAIN", "14"))
+PAGES_PER_STEP = 256
+STEP_PAUSE_SECONDS = 0.001
+CHECKPOINT_MODES = ("PASSIVE", "FULL", "RESTART", "TRUNCATE")
+
+
+class BackupError(RuntimeError):
+    pass
+
+
+def database_path():
+    if not is_sqlite(engine):
+        raise BackupError("Online backups are for SQLite; use pg_dump / base backups on PostgreSQL")
+    return engine.url.database
+
+
+def checkpoint(mode="PASSIVE"):
+    """Run a WAL checkpoint; returns (busy, wal pages, pages checkpointed)"""
+    if mode not in CHECKPOINT_MODES:
+        raise BackupError(f"mode must be one of {', '.join(CHECKPOINT_MODES)}")
+    conn = sqlite3.connect(database_path(), timeout=30)
+    try:
+        return conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+    finally:
+        conn.close()
+
+
+def online_copy(target_path, source_path=None, pages=PAGES_PER_STEP, pause=STEP_PAUSE_SECONDS):
+    """Consistent copy of the live database into target_path, page step by page step"""
+    source = sqlite3.connect(source_path or database_path(), timeout=30)
+    target = sqlite3.connect(target_path)
+    try:
+        # Pin one snapshot for all steps, so concurrent writes never restart the copy
+        source.execute("BEGIN")
+        source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        source.backup(target, pages=pages, progress=lambda status, remaining, total: time.sleep(pause))
+        source.rollback()
+        # A standalone copy: no -wal/-shm files needed to open it
+        target.execute("PRAGMA journal_mode=DELETE")
+    finally:
+        target.close()
+        source.close()
+
+
+def _integrity_ok(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("PRAGMA quick_check").fetchone()[0] == "ok"
+    finally:
+        conn.close()
+
+
+def list_backups(directory=BACKUP_DIR):
+    """Snapshots, newest first"""
+    if not os.path.isdir(directory):
+        return []
+    backups = []
+    for name in sorted(os.listdir(directory), reverse=True):
+        if name.startswith("powergrid-") and name.endswith(".db.gz"):
+            path = os.path.join(directory, name)
+            backups.append({"name": name, "size_bytes": os.path.getsize(path),
+                            "created_at": datetime.utcfromtimestamp(os.path.getmtime(path)).isoformat()})
+    return backups
+
+
+def prune_backups(retain=RETAIN, directory=BACKUP_DIR):
+    removed = []
+    for backup in list_backups(directory)[retain:]:
+        os.remove(os.path.join(directory, backup["name"]))
+        removed.append(backup["name"])
+    return removed
+
+
+def create_backup(directory=BACKUP_DIR, retain=RETAIN):
+    """Checkpoint, copy online, verify, compress and prune; returns a summary"""
+    started = time.perf_counter()
+    os.makedirs(directory, exist_ok=True)
+    checkpoint("PASSIVE")
+
+    name = f"powergrid-{datetime.utcnow().strftime('%Y%m%dT%H%M%S%fZ')}.db.gz"
+    raw_path = os.path.join(directory, f".{name}.tmp.db")
+    gz_path = os.path.join(directory, name)
+    try:
+        online_copy(raw_path)
+        copied_ms = (time.perf_counter() - started) * 1000
+        if not _integrity_ok(raw_path):
+            raise BackupError("Integrity check of the copy failed")
+        with open(raw_path, "rb") as src, gzip.open(f"{gz_path}.tmp", "wb", compresslevel=6) as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        os.replace(f"{gz_path}.tmp", gz_path)
+        size = os.path.getsize(raw_path)
+    finally:
+        for path in (raw_path, f"{gz_path}.tmp"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    return {
+        "name": name,
+        "database_bytes": size,
+        "compressed_bytes": os.path.getsize(gz_path),
+        "copy_ms": round(copied_ms, 1),
+        "total_ms": round((time.perf_counter() - started) * 1000, 1),
+        "pruned": prune_backups(retain, directory),
+    }
+
+
+def restore_backup(name, directory=BACKUP_DIR):
+    """Replace the database contents with a snapshot (restart the API afterwards)"""
+    path = os.path.join(directory, os.path.basename(name))
+    if not os.path.exists(path):
+        raise BackupError(f"No backup named {name}")
+    raw_path = os.path.join(directory, ".restore.tmp.db")
+    try:
+        with gzip.open(path, "rb") as src, open(raw_path, "wb") as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        if not _integrity_ok(raw_path):
+            raise BackupError(f"{name} is corrupt")
+        source = sqlite3.connect(raw_path)
+        target = sqlite3.connect(database_path(), timeout=30)
+        try:
+            source.backup(target)
+            target.execute("PRAGMA journal_mode=WAL")
+        finally:
+            target.close()
+            source.close()
+        checkpoint("TRUNCATE")
+    finally:
+        if os.path.exists(raw_path):
+            os.remove(raw_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Online SQLite backups")
+    parser.add_argument("--list", action="store_true", help="list retained snapshots")
+    parser.add_argument("--checkpoint", choices=CHECKPOINT_MODES, help="only run a WAL checkpoint")
+    parser.add_argument("--restore", metavar="NAME", help="restore a snapshot (stop the API first)")
+    parser.add_argument("--retain", type=int, default=RETAIN)
+    args = parser.parse_args()
+
+    if args.list:
+        for backup in list_backups():
+            print(f"   {backup['name']}  {backup['size_bytes'] / 1024:.0f} KB")
+    elif args.checkpoint:
+        busy, wal_pages, done = checkpoint(args.checkpoint)
+        print(f"✅ Checkpoint {args.checkpoint}: {done}/{wal_pages} WAL pages written back{' (busy)' if busy else ''}")
+    elif args.restore:
+        restore_backup(args.restore)
+        print(f"✅ Restored {args.restore}; restart the API so caches are rebuilt")
+    else:
+        summary = create_backup(retain=args.retain)
+        print(f"✅ {summary['name']}: {summary['database_bytes'] / 1024:.0f} KB -> "
+              f"{summary['compressed_bytes'] / 1024:.0f} KB in {summary['total_ms']} ms "
+              f"(copy {summary['copy_ms']} ms, pruned {len(summary['pruned'])})")
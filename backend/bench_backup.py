@@ -0,0 +1,95 @@
+"""Write latency during online backups.
+
+Works on a scratch copy of powergrid.db (optionally padded to a larger
+size): a writer thread commits small transactions back to back, first
+alone and then while backup.online_copy() runs repeatedly, and the commit
+latency percentiles of both phases are compared.
+
+    python bench_backup.py
+    python bench_backup.py --pad-mb 200 --seconds 5
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+from backup import online_copy
+
+
+def _prepare(directory, pad_mb):
+    path = os.path.join(directory, "bench.db")
+    source = sqlite3.connect("powergrid.db")
+    target = sqlite3.connect(path)
+    source.backup(target)
+    source.close()
+    target.execute("PRAGMA journal_mode=WAL")
+    target.execute("CREATE TABLE bench_writes (id INTEGER PRIMARY KEY, payload TEXT)")
+    if pad_mb:
+        target.execute("CREATE TABLE bench_padding (blob BLOB)")
+        target.executemany("INSERT INTO bench_padding VALUES (?)", ((os.urandom(4096),) for _ in range(pad_mb * 256)))
+    target.commit()
+    target.close()
+    return path
+
+
+def _write_latencies(path, seconds, stop=None):
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute("PRAGMA synchronous=NORMAL")
+    latencies = []
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline and not (stop and stop.is_set()):
+        started = time.perf_counter()
+        conn.execute("INSERT INTO bench_writes (payload) VALUES (?)", ("x" * 200,))
+        conn.commit()
+        latencies.append((time.perf_counter() - started) * 1000)
+    conn.close()
+    return latencies
+
+
+def _summary(latencies):
+    ordered = sorted(latencies)
+    return (statistics.median(ordered), ordered[int(len(ordered) * 0.99) - 1], ordered[-1], len(ordered))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Commit latency with and without a running online backup")
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--pad-mb", type=int, default=0, help="grow the scratch database by this many MB")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="bench_backup_")
+    try:
+        path = _prepare(directory, args.pad_mb)
+        print(f"📦 Scratch database: {os.path.getsize(path) / 1024 / 1024:.1f} MB")
+
+        idle = _summary(_write_latencies(path, args.seconds))
+
+        stop = threading.Event()
+        copies = []
+
+        def backups():
+            while not stop.is_set():
+                started = time.perf_counter()
+                online_copy(os.path.join(directory, "copy.db"), source_path=path)
+                copies.append((time.perf_counter() - started) * 1000)
+                os.remove(os.path.join(directory, "copy.db"))
+
+        thread = threading.Thread(target=backups)
+        thread.start()
+        busy = _summary(_write_latencies(path, args.seconds))
+        stop.set()
+        thread.join()
+
+        print(f"\n{'':>16}{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}{'commits':>9}")
+        for label, (p50, p99, worst, count) in (("idle", idle), ("during backup", busy)):
+            print(f"{label:>16}{p50:>9.3f}{p99:>9.3f}{worst:>9.2f}{count:>9}")
+        print(f"\n⏱️  {len(copies)} backups, {statistics.median(copies):.1f} ms median")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
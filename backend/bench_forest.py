@@ -0,0 +1,94 @@
+"""Latency of the compiled forest against sklearn.
+
+Times sklearn's predict_proba, the compiled forest and explain() at
+several batch sizes, for the current model and the largest forest of the
+model-selection search space, and compares the footprint of the pickle
+with the memory-mapped node table. Parity is checked by check_forest.py.
+
+    python bench_forest.py
+    python bench_forest.py --rows 100000 --repeat 5
+"""
+import argparse
+import os
+import pickle
+import tempfile
+import time
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+from ai_models.compiled_forest import CompiledForest, compile_forest
+from ai_models.predictive_maintenance import PredictiveMaintenanceModel, FEATURE_COLS
+from check_forest import FOREST_CONFIGS, line_frame, random_rows
+
+
+def _best_of(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def _latency(name, model, X_lines, X_random, args):
+    model = pickle.loads(pickle.dumps(model))
+    model.set_params(n_jobs=1)
+    forest = compile_forest(model)
+    with tempfile.TemporaryDirectory() as directory:
+        pickle_path = os.path.join(directory, "model.pkl")
+        nodes_path = os.path.join(directory, "model.forest")
+        with open(pickle_path, "wb") as f:
+            pickle.dump(model, f)
+        layout = forest.save(nodes_path)
+        load_pickle = _best_of(lambda: pickle.load(open(pickle_path, "rb")), args.repeat)
+        load_mmap = _best_of(lambda: CompiledForest.load(nodes_path, layout), args.repeat)
+        print(f"\n📦 {name}: {forest.n_trees} trees, {forest.n_nodes} nodes, depth {forest.max_depth}")
+        print(f"   pickle {os.path.getsize(pickle_path) / 1024:.0f} KB, load {load_pickle * 1000:.2f} ms")
+        print(f"   forest {os.path.getsize(nodes_path) / 1024:.0f} KB, mmap {load_mmap * 1000:.2f} ms")
+
+        mapped = CompiledForest.load(nodes_path, layout)
+        print(f"\n{'rows':>8}{'sklearn µs/row':>17}{'compiled µs/row':>18}{'speedup':>9}{'explain µs/row':>17}")
+        for size in sorted({1, len(X_lines), 1000, args.rows}):
+            frame = X_random.iloc[:size]
+            matrix = frame.to_numpy(dtype=np.float32)
+            baseline = _best_of(lambda: model.predict_proba(frame), args.repeat)
+            compiled = _best_of(lambda: mapped.predict_proba(matrix), args.repeat)
+            explained = _best_of(lambda: mapped.explain(matrix), args.repeat)
+            print(f"{size:>8}{baseline / size * 1e6:>17.2f}{compiled / size * 1e6:>18.2f}"
+                  f"{baseline / compiled:>8.1f}x{explained / size * 1e6:>17.2f}")
+        del mapped
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compiled forest latency against sklearn")
+    parser.add_argument("--rows", type=int, default=20000, help="largest batch size")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(0)
+    X_lines = line_frame()[FEATURE_COLS]
+    X_random = random_rows(X_lines, args.rows, rng)
+
+    pm = PredictiveMaintenanceModel()
+    try:
+        pm.load_model()
+        current = pm.model
+    except Exception:
+        current = None
+
+    models = []
+    if isinstance(current, RandomForestClassifier):
+        models.append(("current model", current))
+    # Labels from the rule used in training, on a wider sample so trees get deep
+    X_train = random_rows(X_lines, 3000, rng)
+    y_train = np.where(X_train['recent_incidents'] > 3, 2,
+                       np.where((X_train['recent_incidents'] > 1) | (X_train['line_age'] > 30)
+                                | (X_train['poor_tower_count'] > 2), 1, 0))
+    config = FOREST_CONFIGS[-1]
+    models.append((str(config), RandomForestClassifier(random_state=42, **config).fit(X_train, y_train)))
+
+    for name, model in models:
+        _latency(name, model, X_lines, X_random, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Cold-start benchmark for the API process.
+
+Runs `python -X importtime -c "import main"` in a fresh interpreter, prints the
+slowest imports and fails if the ML stack is imported at startup. Use it as a
+regression guard before shipping changes to main.py. Both runs use a
+temporary copy of powergrid.db (startup_event() migrates it) with the
+scheduler disabled:
+
+    python bench_startup.py            # summary + heavy-import check
+    python bench_startup.py --max-ms 800
+"""
+import argparse
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+# Modules that must only be imported when an AI endpoint is first used
+HEAVY_MODULES = ["pandas", "numpy", "sklearn", "scipy", "joblib"]
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+DATABASE_PATH = os.path.join(BACKEND_DIR, "powergrid.db")
+
+
+def bench_env(directory):
+    """Environment pointing the API at a copy of powergrid.db in `directory`, so
+    startup migrations never touch the real database, with the scheduler off"""
+    path = os.path.join(directory, "powergrid.db")
+    target = sqlite3.connect(path)
+    if os.path.exists(DATABASE_PATH):
+        source = sqlite3.connect(DATABASE_PATH)
+        try:
+            source.backup(target)
+        finally:
+            source.close()
+    target.close()
+    return {**os.environ, "DATABASE_URL": f"sqlite:///{path}", "SCHEDULER_ENABLED": "0"}
+
+
+def run_importtime(env, module="main"):
+    """Import `module` in a fresh interpreter and return parsed -X importtime rows"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        print(result.stderr[-2000:])
+        raise SystemExit(f"❌ 'import {module}' failed")
+
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def time_startup(env):
+    """Wall-clock time to import main and run the startup schema check"""
+    code = (
+        "import time; t = time.perf_counter(); import main; "
+        "t1 = time.perf_counter(); main.startup_event(); t2 = time.perf_counter(); "
+        "print(f'{(t1 - t) * 1000:.1f} {(t2 - t1) * 1000:.1f}')"
+    )
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, env=env, capture_output=True, text=True)
+    total_ms = (time.perf_counter() - start) * 1000
+    if result.returncode != 0:
+        print(result.stderr[-2000:])
+        raise SystemExit("❌ startup failed")
+    import_ms, startup_ms = (float(v) for v in result.stdout.split()[-2:])
+    return import_ms, startup_ms, total_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description="API cold-start benchmark")
+    parser.add_argument("--top", type=int, default=15, help="number of slowest imports to show")
+    parser.add_argument("--max-ms", type=float, default=None, help="fail if 'import main' exceeds this")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        env = bench_env(directory)
+        rows = run_importtime(env)
+        import_ms, startup_ms, total_ms = time_startup(env)
+    total_us = next((cum for name, _, cum in rows if name == "main"), 0)
+
+    print(f"📦 {len(rows)} modules imported by 'import main' ({total_us / 1000:.1f} ms cumulative)")
+    print(f"\n{'cumulative ms':>14}  {'self ms':>8}  module")
+    for name, self_us, cum_us in sorted(rows, key=lambda r: r[2], reverse=True)[:args.top]:
+        print(f"{cum_us / 1000:>14.1f}  {self_us / 1000:>8.1f}  {name}")
+
+    print(f"\n⏱️  import main: {import_ms:.1f} ms | startup_event: {startup_ms:.1f} ms | process total: {total_ms:.1f} ms")
+
+    failed = False
+    imported = {name.split(".")[0] for name, _, _ in rows}
+    heavy = [m for m in HEAVY_MODULES if m in imported]
+    if heavy:
+        print(f"❌ Heavy modules imported at startup: {', '.join(heavy)}")
+        failed = True
+    if args.max_ms is not None and total_us / 1000 > args.max_ms:
+        print(f"❌ 'import main' took {total_us / 1000:.1f} ms (budget {args.max_ms:.0f} ms)")
+        failed = True
+
+    if failed:
+        sys.exit(1)
+    print("✅ Startup is free of the ML stack")
+
+
+if __name__ == "__main__":
+    main()
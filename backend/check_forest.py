@@ -0,0 +1,152 @@
+"""Parity of the compiled forest with sklearn; exits 1 on any mismatch.
+
+Compares predict_proba, predict and explain() of the compiled forest with
+the sklearn model (n_jobs=1) for:
+
+* the saved model, with the forest it loads (memory-mapped when saved);
+* a model freshly trained on the line features as train_model() does,
+  saved and memory-mapped again;
+* forests covering the model-selection search space.
+
+Rows are the real line features, random rows over twice their range and
+rows sitting exactly on split thresholds. Probabilities and predictions
+must be bit-identical, and explain() must return the same probabilities
+with contributions that add up to them. Timing is bench_forest.py's job.
+
+    python check_forest.py
+"""
+import os
+import pickle
+import sys
+import tempfile
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.preprocessing import LabelEncoder
+from ai_models.compiled_forest import CompiledForest, compile_forest
+from ai_models.predictive_maintenance import PredictiveMaintenanceModel, FEATURE_COLS, BASE_TREES
+from database import SessionLocal, ensure_schema
+
+FOREST_CONFIGS = [
+    {"n_estimators": 25, "max_depth": 4, "max_features": "sqrt"},
+    {"n_estimators": 100, "min_samples_leaf": 2, "max_features": 0.5, "class_weight": "balanced"},
+    {"n_estimators": 400, "max_features": 1.0},
+]
+
+
+def line_frame():
+    """Line features with the training labels, as train_model() builds them"""
+    ensure_schema()
+    db = SessionLocal()
+    try:
+        df = PredictiveMaintenanceModel().prepare_features(db)
+    finally:
+        db.close()
+    df['voltage_encoded'] = LabelEncoder().fit_transform(df['voltage_level'])
+    return df
+
+
+def random_rows(base, n, rng):
+    """Rows spread over twice the observed range of every feature"""
+    high = np.maximum(base.max().to_numpy(dtype=np.float64), 1.0) * 2
+    rows = rng.uniform(0, 1, size=(n, len(FEATURE_COLS))) * high
+    integral = [i for i, name in enumerate(FEATURE_COLS) if name != 'total_length_km']
+    rows[:, integral] = np.round(rows[:, integral])
+    return pd.DataFrame(rows, columns=FEATURE_COLS)
+
+
+def threshold_rows(model, base, rng, n=2000):
+    """Rows with one feature set exactly to a split threshold (the `<=` edge);
+    None if no tree splits"""
+    splits = [(tree.tree_.feature[i], tree.tree_.threshold[i])
+              for tree in model.estimators_ for i in np.flatnonzero(tree.tree_.children_left != -1)]
+    if not splits:
+        return None
+    picks = rng.randint(len(splits), size=n)
+    rows = base.sample(n, replace=True, random_state=rng).to_numpy(dtype=np.float64)
+    for row, pick in zip(rows, picks):
+        feature, threshold = splits[pick]
+        row[feature] = np.float32(threshold)
+    return pd.DataFrame(rows, columns=FEATURE_COLS)
+
+
+def mismatches(model, forest, frame):
+    """Description of every way forest disagrees with model on frame (empty if none)"""
+    matrix = frame.to_numpy(dtype=np.float32)
+    expected = model.predict_proba(frame)
+    actual = forest.predict_proba(matrix)
+    problems = []
+    if actual.shape != expected.shape or not np.array_equal(forest.classes_, model.classes_):
+        return [f"shape {actual.shape} / classes {forest.classes_} vs {expected.shape} / {model.classes_}"]
+    if not np.array_equal(expected, actual):
+        problems.append(f"predict_proba differs on {int((expected != actual).any(axis=1).sum())} rows")
+    if not np.array_equal(model.predict(frame), forest.predict(matrix)):
+        problems.append("predict differs")
+    explained, bias, contributions = forest.explain(matrix)
+    if not np.array_equal(explained, expected):
+        problems.append("explain probabilities differ")
+    if not np.allclose(bias + contributions.sum(axis=1), expected):
+        problems.append("explain contributions do not add up")
+    return problems
+
+
+def check(name, model, forest, frames):
+    model = pickle.loads(pickle.dumps(model))
+    model.set_params(n_jobs=1)
+    problems = [f"{label}: {problem}" for label, frame in frames.items() for problem in mismatches(model, forest, frame)]
+    print(f"   {'✅' if not problems else '❌'} {name}")
+    for problem in problems:
+        print(f"      {problem}")
+    return not problems
+
+
+def main():
+    rng = np.random.RandomState(0)
+    df = line_frame()
+    X_lines = df[FEATURE_COLS]
+    X_random = random_rows(X_lines, 20000, rng)
+
+    def frames(model):
+        candidates = {"lines": X_lines, "random": X_random, "thresholds": threshold_rows(model, X_lines, rng)}
+        return {label: frame for label, frame in candidates.items() if frame is not None}
+
+    print("🔍 Compiled forest against sklearn (predict_proba, predict, explain)")
+    ok = True
+
+    saved = PredictiveMaintenanceModel()
+    try:
+        saved.load_model()
+    except Exception as e:
+        print(f"   ❌ saved model: cannot load ({type(e).__name__}: {e})")
+        ok = False
+    else:
+        if isinstance(saved.model, RandomForestClassifier):
+            ok &= check(f"saved model {saved.model_version}", saved.model, saved.forest, frames(saved.model))
+        else:
+            print(f"   ⏭️  saved model is a {type(saved.model).__name__}, which is not compiled")
+
+    fresh = RandomForestClassifier(n_estimators=BASE_TREES, random_state=42).fit(X_lines, df['risk_level'])
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "model.forest")
+        mapped = CompiledForest.load(path, compile_forest(fresh).save(path))
+        ok &= check("freshly trained model (saved and memory-mapped)", fresh, mapped, frames(fresh))
+        del mapped
+
+    # Labels from the training rule, on a wider sample so trees get deep
+    X_train = random_rows(X_lines, 3000, rng)
+    y_train = np.where(X_train['recent_incidents'] > 3, 2,
+                       np.where((X_train['recent_incidents'] > 1) | (X_train['line_age'] > 30)
+                                | (X_train['poor_tower_count'] > 2), 1, 0))
+    y_train = np.where(rng.uniform(size=len(y_train)) < 0.1, rng.randint(3, size=len(y_train)), y_train)
+    for config in FOREST_CONFIGS:
+        model = RandomForestClassifier(random_state=42, **config).fit(X_train, y_train)
+        ok &= check(str(config), model, compile_forest(model), frames(model))
+
+    if not ok:
+        print("\n❌ Compiled forest does not match sklearn")
+        sys.exit(1)
+    print("\n✅ Compiled forest matches sklearn bit for bit")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,20 @@
+import argparse
 import os
 from database import SessionLocal, State, MaintenanceOffice, TransmissionLine, TrippingIncident, TowerLocation
+from backup import create_backup
 
-def clear_database():
-    # Delete the database file if it exists
+def clear_database(backup=True):
+    # Delete the database file if it exists, keeping a snapshot of it first
     db_file = "powergrid.db"
     if os.path.exists(db_file):
+        if backup:
+            summary = create_backup()
+            print(f"💾 Backed up to backups/{summary['name']} (restore with 'python backup.py --restore')")
         os.remove(db_file)
+        # WAL journal files left next to it
+        for suffix in ("-wal", "-shm"):
+            if os.path.exists(db_file + suffix):
+                os.remove(db_file + suffix)
         print(f"✅ Database file '{db_file}' deleted successfully!")
     else:
         print("ℹ️  Database file doesn't exist.")
@@ -13,4 +22,7 @@ def clear_database():
     print("Database cleared. Run 'python create_db.py' and 'python seed_data.py' to recreate.")
 
 if __name__ == "__main__":
-    clear_database()
+    parser = argparse.ArgumentParser(description="Delete the database file")
+    parser.add_argument("--no-backup", action="store_true", help="skip the snapshot taken before deleting")
+    args = parser.parse_args()
+    clear_database(backup=not args.no_backup)
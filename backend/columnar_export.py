@@ -0,0 +1,323 @@
+"""Parquet export of lines, towers and incidents, and an analytics query path over it.
+
+Incidents are written as Hive-style partitions by fault month
+(incidents/year=2024/month=3/part-0.parquet); lines and towers are small
+dimension tables written as single files. The manifest keeps the change
+log seq the export is current to, so an incremental run only rewrites the
+months touched by changed or deleted incidents (found through change_log
+and the id column of the existing files) and appends new months.
+Incidents without a fault date are not exported.
+
+aggregate_incidents() runs group-bys over the files with DuckDB, or with
+pyarrow compute when DuckDB is not installed, without touching the
+operational database. Both are optional dependencies:
+
+    pip install pyarrow duckdb
+    python columnar_export.py [--full]
+"""
+import argparse
+import json
+import os
+import shutil
+import time
+from datetime import date, datetime
+from sqlalchemy import Boolean, Date, DateTime, Float, Integer
+from sqlalchemy.orm import Session
+from database import ChangeLog, TransmissionLine, TowerLocation, TrippingIncident, date_bucket
+from incident_archive import incident_source
+from read_routing import router
+from sync import current_seq
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+EXPORT_DIR = os.path.join("exports", "parquet")
+MANIFEST = "_manifest.json"
+BATCH_SIZE = 10000
+
+DIMENSIONS = {"lines": TransmissionLine, "towers": TowerLocation}
+
+GROUP_COLUMNS = ("year", "month", "fault_type", "transmission_line_id", "attributed_to_powergrid", "voltage_level")
+
+
+class ExportUnavailable(RuntimeError):
+    """pyarrow is not installed, or nothing has been exported yet"""
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ExportUnavailable("Parquet export needs pyarrow (pip install pyarrow)")
+
+
+def _arrow_schema(model):
+    def arrow_type(column_type):
+        if isinstance(column_type, DateTime):
+            return pa.timestamp("us")
+        if isinstance(column_type, Date):
+            return pa.date32()
+        if isinstance(column_type, Boolean):
+            return pa.bool_()
+        if isinstance(column_type, Integer):
+            return pa.int64()
+        if isinstance(column_type, Float):
+            return pa.float64()
+        return pa.string()
+    return pa.schema([(c.name, arrow_type(c.type)) for c in model.__table__.columns])
+
+
+def _write_atomic(table, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    pq.write_table(table, tmp, compression="zstd")
+    os.replace(tmp, path)
+
+
+def _rows_to_table(rows, schema):
+    return pa.Table.from_pylist([dict(row._mapping) for row in rows], schema=schema)
+
+
+# ==================== EXPORT ====================
+
+class ParquetExporter:
+    def __init__(self, root=EXPORT_DIR):
+        self.root = root
+
+    def manifest(self):
+        path = os.path.join(self.root, MANIFEST)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def _save_manifest(self, manifest):
+        os.makedirs(self.root, exist_ok=True)
+        tmp = os.path.join(self.root, f"{MANIFEST}.tmp")
+        with open(tmp, "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp, os.path.join(self.root, MANIFEST))
+
+    def _partition_path(self, year, month):
+        return os.path.join(self.root, "incidents", f"year={year}", f"month={month}", "part-0.parquet")
+
+    def _write_dimension(self, db: Session, name, model):
+        table = model.__table__
+        schema = _arrow_schema(model)
+        path = os.path.join(self.root, f"{name}.parquet")
+        tmp = f"{path}.tmp"
+        os.makedirs(self.root, exist_ok=True)
+        rows = 0
+        with pq.ParquetWriter(tmp, schema, compression="zstd") as writer:
+            result = db.execute(table.select().order_by(table.c.id).execution_options(yield_per=BATCH_SIZE))
+            for chunk in result.partitions():
+                writer.write_table(_rows_to_table(chunk, schema))
+                rows += len(chunk)
+        os.replace(tmp, path)
+        return rows
+
+    def _write_month(self, db: Session, year, month, schema):
+        """Rewrite one incident partition from the database; returns its row count"""
+        path = self._partition_path(year, month)
+        start = date(year, month, 1)
+        end = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+        table = incident_source(db, start, end)
+        rows = db.execute(table.select().where(
+            table.c.fault_date >= start, table.c.fault_date < end
+        ).order_by(table.c.fault_date, table.c.id)).all()
+        if not rows:
+            if os.path.exists(path):
+                shutil.rmtree(os.path.dirname(path))
+            return 0
+        _write_atomic(_rows_to_table(rows, schema), path)
+        return len(rows)
+
+    def _exported_months(self, incident_ids):
+        """(year, month) partitions currently holding any of these incident ids"""
+        directory = os.path.join(self.root, "incidents")
+        if not incident_ids or not os.path.isdir(directory):
+            return set()
+        dataset = ds.dataset(directory, format="parquet", partitioning="hive")
+        found = dataset.to_table(columns=["year", "month"], filter=pc.field("id").isin(list(incident_ids)))
+        return set(zip(found["year"].to_pylist(), found["month"].to_pylist()))
+
+    def export(self, db: Session, full=False):
+        """Bring the export up to date; returns a summary"""
+        _require_pyarrow()
+        started = time.perf_counter()
+        manifest = None if full else self.manifest()
+        seq = current_seq(db)
+        schema = _arrow_schema(TrippingIncident)
+
+        if manifest is None:
+            shutil.rmtree(self.root, ignore_errors=True)
+            changed = {"lines": True, "towers": True}
+            incidents = incident_source(db)
+            months = {
+                (row[0].year, row[0].month) for row in db.query(
+                    date_bucket(incidents.c.fault_date, "month")
+                ).filter(incidents.c.fault_date.isnot(None)).distinct().all()
+            }
+        else:
+            entries = db.query(ChangeLog.entity, ChangeLog.entity_id).filter(
+                ChangeLog.seq > manifest["seq"], ChangeLog.seq <= seq
+            ).all()
+            changed = {name: any(e.entity == name for e in entries) for name in DIMENSIONS}
+            incident_ids = sorted({e.entity_id for e in entries if e.entity == "incidents"})
+            months = self._exported_months(incident_ids)
+            for start in range(0, len(incident_ids), 500):
+                chunk = incident_ids[start:start + 500]
+                months |= {
+                    (row[0].year, row[0].month) for row in db.query(
+                        date_bucket(TrippingIncident.fault_date, "month")
+                    ).filter(TrippingIncident.id.in_(chunk), TrippingIncident.fault_date.isnot(None)).distinct().all()
+                }
+
+        written = {}
+        for name, model in DIMENSIONS.items():
+            if changed[name]:
+                written[name] = self._write_dimension(db, name, model)
+        incidents = 0
+        for year, month in sorted(months):
+            incidents += self._write_month(db, year, month, schema)
+
+        self._save_manifest({"seq": seq, "exported_at": datetime.utcnow().isoformat(), "format": 1})
+        return {
+            "seq": seq,
+            "full": manifest is None,
+            "partitions_written": len(months),
+            "incident_rows_written": incidents,
+            "dimensions_written": written,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+
+
+exporter = ParquetExporter()
+
+
+def run_export(full=False):
+    """Export from a read session (replica/snapshot when configured)"""
+    db, _, _ = router.session()
+    try:
+        return exporter.export(db, full=full)
+    finally:
+        db.close()
+
+
+# ==================== ANALYTICS ====================
+
+def _filters_sql(filters):
+    clauses, params = [], []
+    if filters.get("from"):
+        clauses.append("i.fault_date >= ?")
+        params.append(filters["from"])
+    if filters.get("to"):
+        clauses.append("i.fault_date < ?")
+        params.append(filters["to"])
+    if filters.get("line_id"):
+        clauses.append("i.transmission_line_id = ?")
+        params.append(filters["line_id"])
+    if filters.get("fault_type"):
+        clauses.append("i.fault_type = ?")
+        params.append(filters["fault_type"])
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+
+def _aggregate_duckdb(root, group_by, filters):
+    incidents = os.path.join(root, "incidents", "**", "*.parquet")
+    lines = os.path.join(root, "lines.parquet")
+    keys = [("l." if name == "voltage_level" else "i.") + name for name in group_by]
+    where, params = _filters_sql(filters)
+    sql = f"SELECT {''.join(key + ', ' for key in keys)}COUNT(*) AS count, " \
+          f"COALESCE(SUM(i.downtime_minutes), 0) AS downtime_minutes " \
+          f"FROM read_parquet('{incidents}', hive_partitioning = true) i "
+    if "voltage_level" in group_by:
+        sql += f"LEFT JOIN read_parquet('{lines}') l ON l.id = i.transmission_line_id "
+    sql += where
+    if keys:
+        sql += f" GROUP BY {', '.join(keys)} ORDER BY {', '.join(keys)}"
+    with duckdb.connect() as conn:
+        cursor = conn.execute(sql, params)
+        names = [d[0] for d in cursor.description]
+        return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+
+def _aggregate_pyarrow(root, group_by, filters):
+    dataset = ds.dataset(os.path.join(root, "incidents"), format="parquet", partitioning="hive")
+    expression = None
+    conditions = [
+        ("from", lambda v: pc.field("fault_date") >= pa.scalar(v, pa.date32())),
+        ("to", lambda v: pc.field("fault_date") < pa.scalar(v, pa.date32())),
+        ("line_id", lambda v: pc.field("transmission_line_id") == v),
+        ("fault_type", lambda v: pc.field("fault_type") == v),
+    ]
+    for name, build in conditions:
+        if filters.get(name):
+            condition = build(filters[name])
+            expression = condition if expression is None else expression & condition
+
+    columns = ["downtime_minutes"] + [name for name in group_by if name != "voltage_level"]
+    if "voltage_level" in group_by and "transmission_line_id" not in columns:
+        columns.append("transmission_line_id")
+    table = dataset.to_table(columns=columns, filter=expression)
+    if "voltage_level" in group_by:
+        lines = pq.read_table(os.path.join(root, "lines.parquet"), columns=["id", "voltage_level"])
+        table = table.join(lines, "transmission_line_id", "id", join_type="left outer")
+
+    table = table.append_column("_one", pa.array([1] * table.num_rows, pa.int64()))
+    result = table.group_by(list(group_by)).aggregate([("_one", "sum"), ("downtime_minutes", "sum")])
+    rows = [
+        {**{name: row[name] for name in group_by},
+         "count": row["_one_sum"], "downtime_minutes": row["downtime_minutes_sum"] or 0}
+        for row in result.to_pylist()
+    ]
+    return sorted(rows, key=lambda row: tuple((row[name] is None, row[name]) for name in group_by))
+
+
+def aggregate_incidents(group_by, filters=None, source=exporter):
+    """Incident count and downtime grouped by the given columns, read from the Parquet export.
+
+    filters may hold from/to (fault dates in [from, to), like the trend
+    endpoints), line_id and fault_type.
+    """
+    _require_pyarrow()
+    unknown = [name for name in group_by if name not in GROUP_COLUMNS]
+    if unknown:
+        raise ValueError(f"group_by must be among {', '.join(GROUP_COLUMNS)}")
+    root = source.root
+    manifest = source.manifest()
+    if manifest is None or not os.path.isdir(os.path.join(root, "incidents")):
+        raise ExportUnavailable("No Parquet export yet; run the export first")
+
+    started = time.perf_counter()
+    filters = filters or {}
+    if duckdb is not None:
+        engine, rows = "duckdb", _aggregate_duckdb(root, group_by, filters)
+    else:
+        engine, rows = "pyarrow", _aggregate_pyarrow(root, group_by, filters)
+    return {
+        "engine": engine,
+        "group_by": list(group_by),
+        "export_seq": manifest["seq"],
+        "exported_at": manifest["exported_at"],
+        "rows": rows,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export lines, towers and incidents to Parquet")
+    parser.add_argument("--full", action="store_true", help="rewrite everything instead of changed months")
+    args = parser.parse_args()
+
+    summary = run_export(full=args.full)
+    print(f"✅ Export at seq {summary['seq']}: {summary['partitions_written']} partitions, "
+          f"{summary['incident_rows_written']} incidents in {summary['elapsed_ms']} ms")
@@ -0,0 +1,198 @@
+"""Keeps derived tables and in-memory caches in step with writes.
+
+The write handlers in main.py call these functions before committing. Live
+events are written into the same transaction (events.emit); work that must
+only happen once the transaction is durable (in-memory caches, the anomaly
+detector) is queued with after_commit() and run by the session's
+after_commit event. Each hook is isolated: a failing hook is logged and the
+rest still run, because the write itself has already been committed.
+"""
+from datetime import date, timedelta
+from sqlalchemy import case, event, func
+from sqlalchemy.orm import Session
+from database import (
+    SessionLocal, TowerLocation, LineFeature, LinePrediction, AvailabilityRollup,
+    IncidentRollup, AnomalyAlert, AnomalyLineState, bump_generation
+)
+from ai_models.feature_store import refresh_line_features
+from availability import incident_months, recompute_months
+from rollups import incident_snapshot, apply_incident, update_line_voltage
+from leaderboard import leaderboard, GENERATION as INCIDENT_GENERATION
+from anomaly import process_new_incidents
+from events import emit
+from incident_archive import incident_source
+
+# Matches the "recent_incidents" window of /dashboard/stats
+RECENT_DAYS = 30
+
+
+def after_commit(db: Session, fn):
+    """Run `fn` once the current transaction commits (dropped on rollback)"""
+    db.info.setdefault("after_commit", []).append(fn)
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _run_after_commit(session):
+    for fn in session.info.pop("after_commit", []):
+        try:
+            fn()
+        except Exception as e:
+            print(f"⚠️  After-commit hook {getattr(fn, '__qualname__', fn)} failed: {type(e).__name__}: {e}")
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _drop_after_commit(session):
+    session.info.pop("after_commit", None)
+
+
+def snapshot_incident(incident):
+    """Everything derived data needs to know about an incident, before it changes"""
+    snapshot = incident_snapshot(incident)
+    if snapshot is not None:
+        snapshot["id"] = incident.id
+        snapshot["months"] = incident_months(incident)
+        snapshot["line_name"] = incident.transmission_line.line_name if incident.transmission_line else None
+    return snapshot
+
+
+def incident_written(db: Session, before=None, after=None):
+    """An incident was created (before=None), updated, or deleted (after=None)"""
+    lines = {s["transmission_line_id"] for s in (before, after) if s}
+    months = set().union(*(s["months"] for s in (before, after) if s))
+
+    refresh_line_features(db, lines)
+    recompute_months(db, months)
+    apply_incident(db, before, -1)
+    apply_incident(db, after, +1)
+
+    generation = bump_generation(db, INCIDENT_GENERATION)
+    after_commit(db, lambda: leaderboard.apply_change(before, after, generation))
+    if before is None:
+        after_commit(db, process_new_incidents)
+
+    action = "created" if before is None else "deleted" if after is None else "updated"
+    _emit_incident(db, action, before, after)
+
+
+def _incident_counters(snapshot, sign):
+    return {
+        "total_incidents": sign,
+        "recent_incidents": sign if snapshot["fault_date"] >= date.today() - timedelta(days=RECENT_DAYS) else 0,
+        "pg_attributed": sign if snapshot["attributed_to_powergrid"] == "YES" else 0,
+    }
+
+
+def _emit_counters(db: Session, *deltas):
+    totals = {}
+    for delta in deltas:
+        for key, value in delta.items():
+            totals[key] = totals.get(key, 0) + value
+    totals = {key: value for key, value in totals.items() if value}
+    if totals:
+        emit(db, "counters", totals)
+
+
+def _incident_event(snapshot):
+    if snapshot is None:
+        return None
+    return {
+        "id": snapshot["id"],
+        "line_id": snapshot["transmission_line_id"],
+        "line_name": snapshot["line_name"],
+        "fault_type": snapshot["fault_type"],
+        "fault_date": snapshot["fault_date"],
+        "downtime_minutes": snapshot["downtime_minutes"],
+        "attributed_to_powergrid": snapshot["attributed_to_powergrid"],
+    }
+
+
+def _emit_incident(db: Session, action, before, after):
+    data = _incident_event(after or before)
+    if data is None:
+        return  # undated incident: nothing on the dashboard changes
+    data["action"] = action
+    if before and after:
+        data["previous"] = _incident_event(before)
+    emit(db, "incident", data)
+    _emit_counters(
+        db,
+        _incident_counters(before, -1) if before else {},
+        _incident_counters(after, +1) if after else {},
+    )
+
+
+def towers_written(db: Session, line_ids, action="updated", tower=None):
+    """Towers on these lines were created, moved, updated or deleted"""
+    refresh_line_features(db, line_ids)
+    if tower is not None:
+        data = {"action": action, "id": tower.id, "line_id": tower.transmission_line_id,
+                "tower_number": tower.tower_number, "condition": tower.condition}
+        emit(db, "tower", data)
+        if action != "updated":
+            _emit_counters(db, {"total_towers": 1 if action == "created" else -1})
+
+
+def towers_bulk_updated(db: Session, line_ids, changes):
+    """One feature refresh and one event for a batch of tower updates ({tower_id: fields})"""
+    refresh_line_features(db, line_ids)
+    emit(db, "tower", {"action": "bulk_updated",
+                       "towers": [{"id": tower_id, **fields} for tower_id, fields in changes.items()]})
+
+
+def _line_event(action, line):
+    return {"action": action, "id": line.id, "name": line.line_name,
+            "voltage_level": line.voltage_level, "total_length_km": line.total_length_km}
+
+
+def line_created(db: Session, line):
+    refresh_line_features(db, [line.id])
+    emit(db, "line", _line_event("created", line))
+    _emit_counters(db, {"total_lines": 1, "total_km": line.total_length_km or 0})
+
+
+def line_updated(db: Session, line, previous_km=0):
+    update_line_voltage(db, line.id, line.voltage_level)
+    # Voltage/name changes affect every board the line appears on
+    bump_generation(db, INCIDENT_GENERATION)
+    emit(db, "line", _line_event("updated", line))
+    _emit_counters(db, {"total_km": (line.total_length_km or 0) - (previous_km or 0)})
+
+
+def drop_derived_rows(db: Session, line_ids):
+    """Delete every row derived from the lines, including their anomaly alerts and state"""
+    for model in (LineFeature, LinePrediction, AvailabilityRollup, IncidentRollup, AnomalyAlert, AnomalyLineState):
+        db.query(model).filter(model.transmission_line_id.in_(line_ids)).delete(synchronize_session=False)
+
+
+def _children_removed_counters(db: Session, line_ids):
+    """Counter deltas for removing every tower and incident of the lines"""
+    recent_from = date.today() - timedelta(days=RECENT_DAYS)
+    source = incident_source(db)
+    incidents, recent, attributed = db.query(
+        func.count(source.c.id),
+        func.coalesce(func.sum(case((source.c.fault_date >= recent_from, 1), else_=0)), 0),
+        func.coalesce(func.sum(case((source.c.attributed_to_powergrid == "YES", 1), else_=0)), 0)
+    ).filter(source.c.transmission_line_id.in_(line_ids)).one()
+    towers = db.query(func.count(TowerLocation.id)).filter(TowerLocation.transmission_line_id.in_(line_ids)).scalar()
+    return {"total_towers": -towers, "total_incidents": -incidents, "recent_incidents": -recent,
+            "pg_attributed": -attributed}
+
+
+def lines_deleted(db: Session, lines):
+    """Drop derived rows of lines about to be deleted; call before their children are removed"""
+    line_ids = [line.id for line in lines]
+    if not line_ids:
+        return
+    drop_derived_rows(db, line_ids)
+    bump_generation(db, INCIDENT_GENERATION)
+
+    for line in lines:
+        emit(db, "line", _line_event("deleted", line))
+    _emit_counters(db, {"total_lines": -len(lines), "total_km": -sum(line.total_length_km or 0 for line in lines)},
+                   _children_removed_counters(db, line_ids))
+
+
+def line_children_removed(db: Session, line_ids):
+    """Children written to lines after lines_deleted() are about to be removed too"""
+    bump_generation(db, INCIDENT_GENERATION)
+    _emit_counters(db, _children_removed_counters(db, line_ids))
@@ -0,0 +1,180 @@
+"""Pub/sub bus behind the /events/stream Server-Sent Events endpoint.
+
+Write handlers emit small deltas (new/updated/deleted incidents, towers
+and lines, dashboard counter changes) into event_log, inside the
+transaction of the change itself, so an event exists exactly when its
+change committed. Every worker tails event_log while it has subscribers
+and feeds its bus: each event is serialized to an SSE frame once, appended
+to a bounded ring buffer and all subscribers are woken through one shared
+asyncio.Event, so fan-out costs one frame per event regardless of how many
+screens are connected.
+
+Event ids are event_log ids, the same in every worker, so a client
+reconnecting with Last-Event-ID to any worker is replayed what it missed,
+or told to reload if the gap has already left the buffer. Ids of
+transactions still in flight can commit out of order on PostgreSQL; the
+tailer holds back behind such a gap for up to GAP_SECONDS before it gives
+the id up as rolled back.
+"""
+import asyncio
+import json
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from database import SessionLocal, EventLog
+
+BUFFER_SIZE = 2048
+HEARTBEAT_SECONDS = 15
+POLL_SECONDS = 0.5
+GAP_SECONDS = 2.0
+RETENTION_HOURS = 24
+
+
+def emit(db: Session, topic, data):
+    """Add an event to the caller's transaction; subscribers see it once it commits"""
+    db.add(EventLog(topic=topic, payload=json.dumps(data, default=str, separators=(",", ":"))))
+
+
+def prune(db: Session, hours=RETENTION_HOURS):
+    """Delete events older than `hours`; returns the number removed"""
+    cutoff = datetime.utcnow() - timedelta(hours=hours)
+    removed = db.query(EventLog).filter(EventLog.created_at < cutoff).delete(synchronize_session=False)
+    db.commit()
+    return removed
+
+
+class EventBus:
+    def __init__(self, size=BUFFER_SIZE):
+        self.size = size
+        self.lock = threading.Lock()
+        self.events = deque(maxlen=size)  # (id, topic, frame)
+        self.last_id = 0
+        self.loop = None
+        self.wakeup = None
+        self.subscribers = 0
+        self.cursor = None  # last event_log id delivered; None until (re)loaded
+        self.gap_since = None
+        self.tailer = None
+
+    # ---------- tailing event_log ----------
+
+    def _deliver(self, rows):
+        if not rows:
+            return
+        with self.lock:
+            for row in rows:
+                frame = f"id: {row.id}\nevent: {row.topic}\ndata: {row.payload}\n\n".encode()
+                self.events.append((row.id, row.topic, frame))
+                self.last_id = row.id
+            loop = self.loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._wake)
+
+    def poll(self, db: Session):
+        """Deliver committed events after the cursor, in id order"""
+        if self.cursor is None:
+            # (Re)start: the newest events fill the buffer for Last-Event-ID replays
+            top = db.query(func.max(EventLog.id)).scalar() or 0
+            rows = db.query(EventLog).filter(
+                EventLog.id > top - self.size, EventLog.id <= top
+            ).order_by(EventLog.id).all()
+            with self.lock:
+                self.events.clear()
+                self.last_id = top
+            self._deliver(rows)
+            self.cursor, self.gap_since = top, None
+            return
+
+        rows = db.query(EventLog).filter(EventLog.id > self.cursor).order_by(EventLog.id).limit(self.size).all()
+        ready = []
+        expected = self.cursor + 1
+        for row in rows:
+            if row.id != expected:
+                self.gap_since = self.gap_since or time.monotonic()
+                if time.monotonic() - self.gap_since < GAP_SECONDS:
+                    break
+            self.gap_since = None
+            ready.append(row)
+            expected = row.id + 1
+        if ready:
+            self.cursor = ready[-1].id
+            self._deliver(ready)
+
+    def _tail(self):
+        while True:
+            if self.subscribers:
+                db = SessionLocal()
+                try:
+                    self.poll(db)
+                except Exception as e:
+                    print(f"⚠️  Event tailer: {type(e).__name__}: {e}")
+                finally:
+                    db.close()
+            else:
+                self.cursor = None
+            time.sleep(POLL_SECONDS)
+
+    def _start_tailer(self):
+        if self.tailer is None:
+            self.tailer = threading.Thread(target=self._tail, name="event-tailer", daemon=True)
+            self.tailer.start()
+
+    # ---------- subscribers ----------
+
+    def _wake(self):
+        wakeup, self.wakeup = self.wakeup, asyncio.Event()
+        if wakeup is not None:
+            wakeup.set()
+
+    def since(self, last_id, topics=None):
+        """Frames after last_id, or None if some of them were already dropped"""
+        with self.lock:
+            if self.events and last_id < self.events[0][0] - 1:
+                return None
+            frames = []
+            for event_id, topic, frame in reversed(self.events):
+                if event_id <= last_id:
+                    break
+                if topics is None or topic in topics:
+                    frames.append(frame)
+            return frames[::-1], self.last_id
+
+    async def subscribe(self, last_id=None, topics=None, is_disconnected=None):
+        """Async iterator of SSE frames, starting after last_id (or now)"""
+        if self.loop is None:
+            self.loop = asyncio.get_running_loop()
+            self.wakeup = asyncio.Event()
+        self.subscribers += 1
+        self._start_tailer()
+        try:
+            # Wait for the tailer to load the buffer, so ids mean the same as in other workers
+            while self.cursor is None:
+                if is_disconnected is not None and await is_disconnected():
+                    return
+                await asyncio.sleep(POLL_SECONDS / 5)
+            cursor = self.last_id if last_id is None else last_id
+            yield b"retry: 5000\n\n"
+            while True:
+                wakeup = self.wakeup
+                batch = self.since(cursor, topics)
+                if batch is None:
+                    yield f"event: reset\ndata: {{\"last_id\":{self.last_id}}}\n\n".encode()
+                    cursor = self.last_id
+                    continue
+                frames, cursor = batch
+                for frame in frames:
+                    yield frame
+                try:
+                    await asyncio.wait_for(wakeup.wait(), HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    if is_disconnected is not None and await is_disconnected():
+                        return
+                    yield b": keep-alive\n\n"
+        finally:
+            self.subscribers -= 1
+
+
+bus = EventBus()
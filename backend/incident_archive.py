@@ -0,0 +1,153 @@
+"""Hot/cold partitioning of tripping incidents by fault year.
+
+Most screens look at the last 30 or 180 days, so incidents of fault years
+older than the last HOT_YEARS are moved out of tripping_incidents into one
+table per year (tripping_incidents_2019, ...), registered in
+incident_archives. Archived rows keep their ids and are read-only; the
+hot table never reissues them (AUTOINCREMENT on SQLite, sequences on
+servers).
+
+Queries that may reach back into archived years select from
+incident_source(db, start, end) instead of the tripping_incidents table: it
+is the hot table alone when the date range does not touch an archived
+year, and a UNION ALL of the hot table and the matching year tables
+otherwise (back-dated incidents of archived years still go to the hot
+table, so it is always included).
+
+Rollups, availability, the leaderboard and the change log are not
+affected by archiving; the archive job only moves rows.
+
+    python incident_archive.py [--hot-years 2]
+"""
+import argparse
+import os
+from datetime import date
+from sqlalchemy import Column, Index, MetaData, Table, func, select, union_all
+from sqlalchemy.orm import Session
+from database import SessionLocal, TrippingIncident, IncidentArchive, date_bucket
+
+HOT_YEARS = int(os.getenv("INCIDENT_HOT_YEARS", "2"))
+CHUNK_SIZE = 1000
+
+archive_metadata = MetaData()
+_tables = {}
+
+
+class ArchivedIncidentError(Exception):
+    """Write attempted on an archived (read-only) incident"""
+
+
+def archive_table(year):
+    """Table object of one archived year (same columns as tripping_incidents)"""
+    if year not in _tables:
+        name = f"tripping_incidents_{year}"
+        columns = [Column(c.name, c.type, primary_key=c.primary_key) for c in TrippingIncident.__table__.columns]
+        _tables[year] = Table(
+            name, archive_metadata, *columns,
+            Index(f"ix_{name}_line", "transmission_line_id"),
+            Index(f"ix_{name}_fault_date", "fault_date"),
+        )
+    return _tables[year]
+
+
+def archived_years(db: Session):
+    return [row.year for row in db.query(IncidentArchive.year).order_by(IncidentArchive.year).all()]
+
+
+def archive_tables(db: Session):
+    return [archive_table(year) for year in archived_years(db)]
+
+
+def incident_source(db: Session, start=None, end=None):
+    """Selectable with the tripping_incidents columns, covering fault dates in [start, end)"""
+    hot = TrippingIncident.__table__
+    years = [
+        year for year in archived_years(db)
+        if (start is None or year >= start.year) and (end is None or year <= end.year)
+    ]
+    if not years:
+        return hot
+    return union_all(select(hot), *[select(archive_table(year)) for year in years]).subquery("incidents")
+
+
+def find_archived(db: Session, incident_id):
+    """Fault year of an archived incident, or None"""
+    for year in archived_years(db):
+        table = archive_table(year)
+        if db.execute(select(table.c.id).where(table.c.id == incident_id)).first():
+            return year
+    return None
+
+
+def check_not_archived(db: Session, incident_id):
+    year = find_archived(db, incident_id)
+    if year is not None:
+        raise ArchivedIncidentError(f"Incident {incident_id} is archived ({year}) and read-only")
+
+
+# ==================== ARCHIVE JOB ====================
+
+def archive_year(db: Session, year, chunk_size=CHUNK_SIZE):
+    """Move the hot incidents of one fault year into its archive table, chunk by chunk"""
+    hot = TrippingIncident.__table__
+    table = archive_table(year)
+    table.create(bind=db.connection(), checkfirst=True)
+    if db.get(IncidentArchive, year) is None:
+        db.add(IncidentArchive(year=year))
+        db.flush()
+
+    columns = [c.name for c in hot.columns]
+    moved = 0
+    while True:
+        ids = [row.id for row in db.query(TrippingIncident.id).filter(
+            TrippingIncident.fault_date >= date(year, 1, 1),
+            TrippingIncident.fault_date < date(year + 1, 1, 1)
+        ).order_by(TrippingIncident.id).limit(chunk_size).all()]
+        if not ids:
+            break
+        conn = db.connection()
+        conn.execute(table.insert().from_select(columns, select(*[hot.c[name] for name in columns]).where(hot.c.id.in_(ids))))
+        conn.execute(hot.delete().where(hot.c.id.in_(ids)))
+        db.commit()
+        moved += len(ids)
+    db.commit()
+    return moved
+
+
+def archive_old_years(db: Session, hot_years=HOT_YEARS, today=None):
+    """Archive every fault year before the last `hot_years`; returns {year: rows moved}"""
+    first_hot_year = (today or date.today()).year - hot_years + 1
+    years = sorted(
+        row[0].year for row in db.query(date_bucket(TrippingIncident.fault_date, "year")).filter(
+            TrippingIncident.fault_date < date(first_hot_year, 1, 1)
+        ).distinct().all()
+    )
+    return {year: archive_year(db, year) for year in years}
+
+
+def archive_summary(db: Session):
+    summary = []
+    for row in db.query(IncidentArchive).order_by(IncidentArchive.year).all():
+        table = archive_table(row.year)
+        summary.append({
+            "year": row.year,
+            "table": table.name,
+            "row_count": db.execute(select(func.count()).select_from(table)).scalar(),
+            "archived_at": row.archived_at.isoformat() if row.archived_at else None,
+        })
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move incidents of old fault years into per-year archive tables")
+    parser.add_argument("--hot-years", type=int, default=HOT_YEARS, help="fault years kept in the main table")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        moved = archive_old_years(db, args.hot_years)
+        for year, count in moved.items():
+            print(f"   📦 {year}: archived {count} incidents")
+        print(f"✅ Archived {sum(moved.values())} incidents from {len(moved)} years")
+    finally:
+        db.close()
@@ -0,0 +1,158 @@
+"""Top-N lines by fault type and time window.
+
+Each (fault_type, window) keeps per-line counts and a bounded top-N list in
+memory, updated in place on incident writes, so the endpoint serves a
+precomputed list. reconcile() rebuilds everything exactly from the day and
+month incident rollups; it runs on first use, when the day changes (windows
+slide), and when another worker has written incidents since this process
+last synced (detected through the "incidents" cache generation).
+"""
+import heapq
+import threading
+from datetime import date, timedelta
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from database import SessionLocal, TransmissionLine, IncidentRollup, get_generation
+
+TOP_N = 10
+
+# Window name -> days back from today (None = all history)
+WINDOWS = {"30d": 30, "90d": 90, "365d": 365, "3y": 3 * 365, "all": None}
+
+GENERATION = "incidents"
+
+
+def _rank_key(entry):
+    count, line_id = entry
+    return (count, -line_id)
+
+
+class FaultLeaderboard:
+    def __init__(self, top_n=TOP_N):
+        self.top_n = top_n
+        self.lock = threading.Lock()
+        self.counts = {}  # (fault_type, window) -> {line_id: count}
+        self.tops = {}  # (fault_type, window) -> [(count, line_id)], best first
+        self.lines = {}  # line_id -> (line_name, voltage_level)
+        self.generation = None
+        self.anchored_on = None
+
+    # ---------- exact recompute ----------
+
+    def reconcile(self, db: Session, today: date = None):
+        """Rebuild all boards from the incident rollups"""
+        today = today or date.today()
+        generation = get_generation(db, GENERATION)
+        counts = {}
+
+        for window, days in WINDOWS.items():
+            if days is None:
+                query = db.query(
+                    IncidentRollup.fault_type, IncidentRollup.transmission_line_id,
+                    func.sum(IncidentRollup.incident_count)
+                ).filter(IncidentRollup.granularity == "month")
+            else:
+                query = db.query(
+                    IncidentRollup.fault_type, IncidentRollup.transmission_line_id,
+                    func.sum(IncidentRollup.incident_count)
+                ).filter(
+                    IncidentRollup.granularity == "day",
+                    IncidentRollup.period_start >= today - timedelta(days=days)
+                )
+            for fault_type, line_id, count in query.group_by(
+                IncidentRollup.fault_type, IncidentRollup.transmission_line_id
+            ).all():
+                if count:
+                    counts.setdefault((fault_type, window), {})[line_id] = int(count)
+
+        lines = {row.id: (row.line_name, row.voltage_level)
+                 for row in db.query(TransmissionLine.id, TransmissionLine.line_name, TransmissionLine.voltage_level).all()}
+
+        with self.lock:
+            self.counts = counts
+            self.tops = {key: self._largest(board) for key, board in counts.items()}
+            self.lines = lines
+            self.generation = generation
+            self.anchored_on = today
+
+    def _largest(self, board):
+        return heapq.nlargest(self.top_n, ((c, l) for l, c in board.items()), key=_rank_key)
+
+    # ---------- incremental updates ----------
+
+    def _bump(self, key, line_id, delta):
+        board = self.counts.setdefault(key, {})
+        count = board.get(line_id, 0) + delta
+        if count > 0:
+            board[line_id] = count
+        else:
+            board.pop(line_id, None)
+
+        top = self.tops.get(key, [])
+        in_top = any(l == line_id for _, l in top)
+        if delta > 0:
+            if in_top or len(top) < self.top_n or _rank_key((count, line_id)) > _rank_key(top[-1]):
+                entries = [(c, l) for c, l in top if l != line_id] + [(count, line_id)]
+                self.tops[key] = heapq.nlargest(self.top_n, entries, key=_rank_key)
+        elif in_top:
+            # A line outside the top list may now outrank it
+            self.tops[key] = self._largest(board)
+
+    def apply_change(self, before, after, generation):
+        """Move one incident between boards; `before`/`after` are rollup snapshots.
+
+        Only applied if this process saw every earlier write (generation is
+        exactly one ahead); otherwise the next read reconciles.
+        """
+        with self.lock:
+            if self.generation is None or generation != self.generation + 1:
+                return
+            for snapshot, delta in ((before, -1), (after, 1)):
+                if snapshot is None:
+                    continue
+                if snapshot.get("line_name"):
+                    self.lines[snapshot["transmission_line_id"]] = (snapshot["line_name"], snapshot["voltage_level"])
+                for window, days in WINDOWS.items():
+                    if days is None or snapshot["fault_date"] >= self.anchored_on - timedelta(days=days):
+                        self._bump((snapshot["fault_type"], window), snapshot["transmission_line_id"], delta)
+            self.generation = generation
+
+    # ---------- reads ----------
+
+    def top(self, db: Session, fault_type: str, window: str = "365d", limit: int = TOP_N):
+        today = date.today()
+        if (self.generation is None or self.anchored_on != today
+                or get_generation(db, GENERATION) != self.generation):
+            self.reconcile(db, today)
+
+        with self.lock:
+            entries = self.tops.get((fault_type, window), [])[:limit]
+            return [
+                {
+                    "rank": rank,
+                    "line_id": line_id,
+                    "line_name": self.lines.get(line_id, (None, None))[0],
+                    "voltage_level": self.lines.get(line_id, (None, None))[1],
+                    "count": count,
+                }
+                for rank, (count, line_id) in enumerate(entries, 1)
+            ]
+
+    def fault_types(self):
+        with self.lock:
+            return sorted({fault_type for fault_type, _ in self.counts})
+
+
+leaderboard = FaultLeaderboard()
+
+
+if __name__ == "__main__":
+    db = SessionLocal()
+    try:
+        leaderboard.reconcile(db)
+        for fault_type in leaderboard.fault_types():
+            print(f"\n⚡ {fault_type} (365d)")
+            for entry in leaderboard.top(db, fault_type, "365d"):
+                print(f"   {entry['rank']:>2}. {entry['line_name']} - {entry['count']}")
+    finally:
+        db.close()
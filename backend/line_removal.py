@@ -0,0 +1,181 @@
+"""Set-based deletion and decommissioning of transmission lines.
+
+Deleting a line through the ORM cascade loads every tower and incident of
+the line into the session and deletes them one by one. These helpers issue
+bulk DELETEs keyed on the indexed transmission_line_id columns instead,
+recording change-log tombstones for the removed rows themselves (the flush
+hook never sees bulk statements).
+
+Decommissioning copies a line's towers and incidents into the
+decommissioned_* tables in chunks, committing after each chunk so that
+lines with years of history never hold the write lock for long, and then
+archives and removes the line rows. The line is marked "Decommissioning"
+first and check_lines_writable() refuses writes to it from then on; the
+last transaction locks the lines and sweeps up whatever a write that
+checked just before still added.
+
+    python line_removal.py --decommission 12 14
+"""
+import argparse
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from database import (
+    SessionLocal, TransmissionLine, TowerLocation, TrippingIncident, record_changes,
+    decommissioned_lines, decommissioned_towers, decommissioned_incidents
+)
+import derived_data
+from incident_archive import archive_tables
+
+CHUNK_SIZE = 1000
+
+# Line statuses under which the line's towers and incidents are being moved away
+REMOVING_STATUSES = ("Decommissioning", "Decommissioned")
+
+# (model, change log entity, archive table)
+CHILDREN = (
+    (TowerLocation, "towers", decommissioned_towers),
+    (TrippingIncident, "incidents", decommissioned_incidents),
+)
+
+
+class LineDecommissioningError(Exception):
+    pass
+
+
+def decommissioning_lines(db: Session, line_ids):
+    """The subset of line_ids that are being decommissioned"""
+    line_ids = {line_id for line_id in line_ids if line_id is not None}
+    if not line_ids:
+        return set()
+    return {row.id for row in db.query(TransmissionLine.id).filter(
+        TransmissionLine.id.in_(line_ids), TransmissionLine.status.in_(REMOVING_STATUSES)
+    ).all()}
+
+
+def check_lines_writable(db: Session, line_ids):
+    """Raise LineDecommissioningError if any of the lines is being decommissioned"""
+    blocked = decommissioning_lines(db, line_ids)
+    if blocked:
+        raise LineDecommissioningError(f"Transmission line {min(blocked)} is being decommissioned")
+
+
+def _child_ids(db: Session, table, line_ids, limit=None):
+    query = select(table.c.id).where(table.c.transmission_line_id.in_(line_ids)).order_by(table.c.id)
+    if limit:
+        query = query.limit(limit)
+    return [row.id for row in db.execute(query).all()]
+
+
+def _child_tables(db: Session):
+    """(table, change log entity, decommission archive) of every table holding line children,
+    including the per-year incident archives"""
+    tables = [(model.__table__, entity, archive) for model, entity, archive in CHILDREN]
+    tables += [(table, "incidents", decommissioned_incidents) for table in archive_tables(db)]
+    return tables
+
+
+def _remove_rows(db: Session, table, entity, ids, archive=None):
+    """Optionally copy rows to their archive table, then delete them and log tombstones"""
+    conn = db.connection()
+    if archive is not None:
+        columns = [c.name for c in table.columns]
+        conn.execute(archive.insert().from_select(
+            columns, select(*[table.c[name] for name in columns]).where(table.c.id.in_(ids))
+        ))
+    conn.execute(table.delete().where(table.c.id.in_(ids)))
+    record_changes(conn, entity, ids, "delete")
+
+
+def delete_lines(db: Session, line_ids):
+    """Delete lines with their towers and incidents in one transaction; returns counts"""
+    lines = db.query(TransmissionLine).filter(TransmissionLine.id.in_(list(line_ids))).all()
+    result = remove_lines(db, lines)
+    db.commit()
+    return result
+
+
+def remove_lines(db: Session, lines):
+    """delete_lines() for already loaded lines, without committing"""
+    if not lines:
+        return {"lines": 0, "towers": 0, "incidents": 0}
+    ids = [line.id for line in lines]
+    derived_data.lines_deleted(db, lines)
+
+    counts = {"towers": 0, "incidents": 0}
+    for table, entity, _ in _child_tables(db):
+        child_ids = _child_ids(db, table, ids)
+        for start in range(0, len(child_ids), CHUNK_SIZE):
+            _remove_rows(db, table, entity, child_ids[start:start + CHUNK_SIZE])
+        counts[entity] += len(child_ids)
+
+    for line in lines:
+        db.expunge(line)
+    _remove_rows(db, TransmissionLine.__table__, "lines", ids)
+    return {"lines": len(ids), **counts}
+
+
+def decommission_lines(db: Session, line_ids, chunk_size=CHUNK_SIZE, progress=None):
+    """Archive lines and their children into the decommissioned_* tables, chunk by chunk;
+    progress(entity, archived so far) is called after every chunk"""
+    lines = db.query(TransmissionLine).filter(TransmissionLine.id.in_(list(line_ids))).all()
+    if not lines:
+        return {"lines": 0, "towers": 0, "incidents": 0}
+    ids = [line.id for line in lines]
+
+    # Derived data first, so it already reflects the end state while children move
+    for line in lines:
+        line.status = "Decommissioning"
+    derived_data.lines_deleted(db, lines)
+    db.commit()
+
+    counts = {"towers": 0, "incidents": 0}
+    for table, entity, archive in _child_tables(db):
+        while True:
+            chunk = _child_ids(db, table, ids, limit=chunk_size)
+            if not chunk:
+                break
+            _remove_rows(db, table, entity, chunk, archive)
+            db.commit()
+            counts[entity] += len(chunk)
+            if progress is not None:
+                progress(entity, counts[entity])
+
+    db.expunge_all()
+    # A write that checked the status just before it changed may have added
+    # children since. Lock the lines so any such write still in flight
+    # finishes (or fails on the foreign key) first, then sweep them up.
+    db.query(TransmissionLine.id).filter(TransmissionLine.id.in_(ids)).with_for_update().all()
+    db.query(TransmissionLine).filter(TransmissionLine.id.in_(ids)).update(
+        {TransmissionLine.status: "Decommissioned"}, synchronize_session=False
+    )
+    stragglers = [(table, entity, archive, _child_ids(db, table, ids)) for table, entity, archive in _child_tables(db)]
+    if any(chunk for *_, chunk in stragglers):
+        derived_data.line_children_removed(db, ids)
+        for table, entity, archive, chunk in stragglers:
+            if chunk:
+                _remove_rows(db, table, entity, chunk, archive)
+                counts[entity] += len(chunk)
+    derived_data.drop_derived_rows(db, ids)
+    _remove_rows(db, TransmissionLine.__table__, "lines", ids, decommissioned_lines)
+    db.commit()
+    return {"lines": len(ids), **counts}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Delete or decommission transmission lines")
+    parser.add_argument("line_ids", type=int, nargs="+")
+    parser.add_argument("--decommission", action="store_true", help="archive instead of deleting")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        if args.decommission:
+            result = decommission_lines(db, args.line_ids, args.chunk_size,
+                                        progress=lambda entity, done: print(f"   📦 {entity}: archived {done}"))
+        else:
+            result = delete_lines(db, args.line_ids)
+        print(f"✅ {'Decommissioned' if args.decommission else 'Deleted'} {result['lines']} lines "
+              f"({result['towers']} towers, {result['incidents']} incidents)")
+    finally:
+        db.close()
@@ -1,14 +1,28 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+import threading
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, status
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
 from sqlalchemy import func
 from typing import List, Optional
 from datetime import datetime, date, timedelta
-import uvicorn
-from database import get_db, create_tables, State, TransmissionLine, TrippingIncident, TowerLocation, MaintenanceOffice, User
+from database import get_db, ensure_schema, State, TransmissionLine, TrippingIncident, TowerLocation, MaintenanceOffice, User, AnomalyAlert, DriftSnapshot
 from pydantic import BaseModel
-from ai_models.predictive_maintenance import PredictiveMaintenanceModel
 from ai_models.chatbot import PowerGridChatbot
+from ai_models.inference import INFERENCE_SOCKET, RemoteMaintenanceModel
+from availability import get_availability, get_line_availability
+from rollups import incident_trend, GROUP_COLUMNS
+from leaderboard import leaderboard, WINDOWS as LEADERBOARD_WINDOWS, TOP_N as LEADERBOARD_TOP_N
+from anomaly import detector, alert_to_dict
+from events import bus
+from line_removal import delete_lines, decommission_lines, check_lines_writable, LineDecommissioningError
+from read_routing import get_read_db
+from backup import create_backup, list_backups, BackupError
+from scheduler import scheduler, job_summary, job_history, SCHEDULER_ENABLED
+from incident_archive import incident_source, check_not_archived, archive_old_years, archive_summary, ArchivedIncidentError, HOT_YEARS
+from tower_updates import bulk_update_towers, MAX_ITEMS as TOWER_BULK_MAX
+from sync import changes_since, apply_upload, PAGE_SIZE as SYNC_PAGE_SIZE, MAX_UPLOAD as SYNC_MAX_UPLOAD
+import derived_data
 
 
 # Import auth
@@ -17,6 +31,7 @@ from auth import (
     verify_password, 
     create_access_token, 
     get_current_active_user,
+    get_stream_user,
     require_admin,
     ACCESS_TOKEN_EXPIRE_MINUTES
 )
@@ -31,8 +46,14 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Read-Source", "X-Data-Staleness"],
 )
 
+@app.exception_handler(LineDecommissioningError)
+async def line_decommissioning_handler(request: Request, exc: LineDecommissioningError):
+    """Writes touching a line whose towers and incidents are being archived"""
+    return JSONResponse(status_code=409, content={"detail": str(exc)})
+
 # ==================== PYDANTIC MODELS ====================
 
 class UserCreate(BaseModel):
@@ -146,15 +167,47 @@ class TrippingIncidentResponse(BaseModel):
     root_cause: Optional[str]
     corrective_action: Optional[str]
     remarks: Optional[str]
+    fault_at: Optional[datetime] = None
+    restored_at: Optional[datetime] = None
 
 class ChatMessage(BaseModel):
     message: str
 
+class TowerInspectionUpdate(BaseModel):
+    id: Optional[int] = None
+    line_id: Optional[int] = None
+    tower_number: Optional[str] = None
+    condition: Optional[str] = None
+    last_inspection_date: Optional[date] = None
+    remarks: Optional[str] = None
+
+class TowerBulkUpdate(BaseModel):
+    updates: List[TowerInspectionUpdate]
+
+class LineIdsRequest(BaseModel):
+    line_ids: List[int]
+
+class SyncChange(BaseModel):
+    entity: str  # lines, towers or incidents
+    op: str = "upsert"  # upsert or delete
+    id: Optional[int] = None  # omit to create
+    base_seq: int = 0  # seq the client last synced this row at
+    data: dict = {}
+
+class SyncUpload(BaseModel):
+    changes: List[SyncChange]
+
 # ==================== STARTUP ====================
 
 @app.on_event("startup")
 def startup_event():
-    create_tables()
+    ensure_schema()
+    if SCHEDULER_ENABLED:
+        scheduler.start(maintenance_model=get_maintenance_model)
+
+@app.on_event("shutdown")
+def shutdown_event():
+    scheduler.stop()
 
 @app.get("/")
 def read_root():
@@ -277,31 +330,34 @@ def logout(current_user: User = Depends(get_current_active_user)):
 @app.get("/dashboard/stats")
 async def get_dashboard_stats(
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Get dashboard statistics"""
     total_lines = db.query(TransmissionLine).count()
     total_towers = db.query(TowerLocation).count()
-    total_incidents = db.query(TrippingIncident).count()
+    # All years, including archived ones
+    incidents = incident_source(db)
+    total_incidents = db.query(func.count(incidents.c.id)).scalar()
     total_km = db.query(func.sum(TransmissionLine.total_length_km)).scalar() or 0
     
     thirty_days_ago = datetime.now().date() - timedelta(days=30)
-    recent_incidents = db.query(TrippingIncident).filter(
-        TrippingIncident.fault_date >= thirty_days_ago
-    ).count()
+    recent = incident_source(db, thirty_days_ago)
+    recent_incidents = db.query(func.count(recent.c.id)).filter(
+        recent.c.fault_date >= thirty_days_ago
+    ).scalar()
     
-    pg_attributed = db.query(TrippingIncident).filter(
-        TrippingIncident.attributed_to_powergrid == "YES"
-    ).count()
+    pg_attributed = db.query(func.count(incidents.c.id)).filter(
+        incidents.c.attributed_to_powergrid == "YES"
+    ).scalar()
     
     # FIX: Include km in voltage breakdown
     incidents_by_voltage = db.query(
         TransmissionLine.voltage_level,
-        func.count(TrippingIncident.id).label('count'),
+        func.count(incidents.c.id).label('count'),
         func.sum(TransmissionLine.total_length_km).label('km')  # Add this
     ).join(
-        TrippingIncident,
-        TransmissionLine.id == TrippingIncident.transmission_line_id
+        incidents,
+        TransmissionLine.id == incidents.c.transmission_line_id
     ).group_by(
         TransmissionLine.voltage_level
     ).all()
@@ -316,23 +372,19 @@ async def get_dashboard_stats(
     ]
     
     incidents_by_fault = db.query(
-        TrippingIncident.fault_type,
-        func.count(TrippingIncident.id).label('count')
+        incidents.c.fault_type,
+        func.count(incidents.c.id).label('count')
     ).group_by(
-        TrippingIncident.fault_type
+        incidents.c.fault_type
     ).all()
     
     fault_data = [{"type": f[0], "count": f[1]} for f in incidents_by_fault]
     
     six_months_ago = datetime.now().date() - timedelta(days=180)
-    monthly_incidents = db.query(
-        func.strftime('%Y-%m', TrippingIncident.fault_date).label('month'),
-        func.count(TrippingIncident.id).label('count')
-    ).filter(
-        TrippingIncident.fault_date >= six_months_ago
-    ).group_by('month').order_by('month').all()
-    
-    monthly_data = [{"month": m[0], "count": m[1]} for m in monthly_incidents]
+    monthly_data = [
+        {"month": m["period"], "count": m["count"]}
+        for m in incident_trend(db, six_months_ago, granularity="month")
+    ]
     
     return {
         "total_lines": total_lines,
@@ -346,6 +398,113 @@ async def get_dashboard_stats(
         "monthly_trend": monthly_data
     }
 
+@app.get("/dashboard/trend")
+def get_incident_trend(
+    granularity: str = "month",
+    months: int = 6,
+    from_: Optional[date] = Query(None, alias="from"),
+    to: Optional[date] = None,
+    group_by: Optional[str] = None,
+    line_id: Optional[int] = None,
+    maintenance_office_id: Optional[int] = None,
+    fault_type: Optional[str] = None,
+    voltage_level: Optional[str] = None,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_read_db)
+):
+    """Incident trend from the day/month rollups (default: last 6 months by month)"""
+    if granularity not in ("day", "month"):
+        raise HTTPException(status_code=400, detail="granularity must be 'day' or 'month'")
+    if group_by and group_by not in GROUP_COLUMNS:
+        raise HTTPException(status_code=400, detail=f"group_by must be one of {', '.join(GROUP_COLUMNS)}")
+    
+    start = from_ or datetime.now().date() - timedelta(days=30 * months)
+    trend = incident_trend(db, start, to, granularity=granularity, group_by=group_by, filters={
+        "line": line_id,
+        "maintenance_office_id": maintenance_office_id,
+        "fault_type": fault_type,
+        "voltage_level": voltage_level,
+    })
+    return {"granularity": granularity, "from": start, "to": to, "group_by": group_by, "trend": trend}
+
+@app.get("/analytics/top-lines")
+def get_top_lines(
+    fault_type: str,
+    window: str = "365d",
+    limit: int = LEADERBOARD_TOP_N,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Lines with the most incidents of a fault type in a time window (precomputed)"""
+    if window not in LEADERBOARD_WINDOWS:
+        raise HTTPException(status_code=400, detail=f"window must be one of {', '.join(LEADERBOARD_WINDOWS)}")
+    if not 1 <= limit <= LEADERBOARD_TOP_N:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {LEADERBOARD_TOP_N}")
+
+    return {
+        "fault_type": fault_type,
+        "window": window,
+        "lines": leaderboard.top(db, fault_type, window, limit)
+    }
+
+@app.post("/analytics/export")
+def export_analytics_data(
+    full: bool = False,
+    current_user: User = Depends(get_current_active_user)
+):
+    """Bring the Parquet export of lines, towers and incidents up to date"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Only administrators can run exports")
+    from columnar_export import run_export, ExportUnavailable
+    try:
+        return run_export(full=full)
+    except ExportUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+@app.get("/analytics/incidents")
+def get_incident_aggregates(
+    group_by: List[str] = Query(["year"]),
+    from_: Optional[date] = Query(None, alias="from"),
+    to: Optional[date] = None,
+    line_id: Optional[int] = None,
+    fault_type: Optional[str] = None,
+    current_user: User = Depends(get_current_active_user)
+):
+    """Incident count and downtime over any span of history, from the Parquet export
+    (fault dates in [from, to), as in /dashboard/trend)"""
+    from columnar_export import aggregate_incidents, ExportUnavailable
+    try:
+        return aggregate_incidents(group_by, {"from": from_, "to": to, "line_id": line_id, "fault_type": fault_type})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ExportUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+# ==================== LIVE EVENTS ====================
+
+@app.get("/events/stream")
+async def stream_events(
+    request: Request,
+    topics: Optional[str] = None,
+    current_user: User = Depends(get_stream_user)
+):
+    """Server-Sent Events: incident/tower/line changes and dashboard counter deltas.
+
+    Browsers' EventSource cannot set headers, so the token may also be passed
+    as ?access_token=. No database session is held while streaming.
+    """
+    last_event_id = request.headers.get("last-event-id")
+    wanted = set(topics.split(",")) if topics else None
+    frames = bus.subscribe(
+        last_id=int(last_event_id) if last_event_id and last_event_id.isdigit() else None,
+        topics=wanted,
+        is_disconnected=request.is_disconnected
+    )
+    return StreamingResponse(frames, media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+
 # ==================== TRANSMISSION LINES ====================
 
 @app.get("/transmission-lines/", response_model=List[TransmissionLineResponse])
@@ -420,6 +579,8 @@ async def create_transmission_line(
         remarks=line.remarks
     )
     db.add(db_line)
+    db.flush()
+    derived_data.line_created(db, db_line)
     db.commit()
     db.refresh(db_line)
     
@@ -450,7 +611,9 @@ async def update_transmission_line(
     db_line = db.query(TransmissionLine).filter(TransmissionLine.id == line_id).first()
     if not db_line:
         raise HTTPException(status_code=404, detail="Transmission line not found")
+    check_lines_writable(db, [line_id])
     
+    previous_km = db_line.total_length_km
     db_line.line_name = line.name
     db_line.voltage_level = line.voltage_level
     db_line.total_length_km = line.total_length_km
@@ -460,6 +623,7 @@ async def update_transmission_line(
     db_line.status = line.status
     db_line.remarks = line.remarks
     
+    derived_data.line_updated(db, db_line, previous_km)
     db.commit()
     db.refresh(db_line)
     
@@ -489,11 +653,34 @@ async def delete_transmission_line(
     db_line = db.query(TransmissionLine).filter(TransmissionLine.id == line_id).first()
     if not db_line:
         raise HTTPException(status_code=404, detail="Transmission line not found")
+    check_lines_writable(db, [line_id])
     
-    db.delete(db_line)
-    db.commit()
+    delete_lines(db, [line_id])
     return {"message": "Transmission line deleted successfully"}
 
+@app.post("/transmission-lines/bulk-delete")
+def bulk_delete_transmission_lines(
+    request: LineIdsRequest,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Delete many lines with their towers and incidents using set-based DELETEs"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Only administrators can delete transmission lines")
+    check_lines_writable(db, request.line_ids)
+    return delete_lines(db, request.line_ids)
+
+@app.post("/transmission-lines/decommission")
+def decommission_transmission_lines(
+    request: LineIdsRequest,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Move lines and their towers/incidents to the decommissioned_* archive tables in chunks"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Only administrators can decommission transmission lines")
+    return decommission_lines(db, request.line_ids)
+
 # ==================== TOWER LOCATIONS ====================
 
 @app.get("/tower-locations/")
@@ -566,6 +753,7 @@ async def create_tower_location(
     line = db.query(TransmissionLine).filter(TransmissionLine.id == tower.line_id).first()
     if not line:
         raise HTTPException(status_code=400, detail="Transmission line not found")
+    check_lines_writable(db, [tower.line_id])
     
     db_tower = TowerLocation(
         transmission_line_id=tower.line_id,
@@ -581,6 +769,7 @@ async def create_tower_location(
         remarks=tower.remarks
     )
     db.add(db_tower)
+    derived_data.towers_written(db, [tower.line_id], "created", db_tower)
     db.commit()
     db.refresh(db_tower)
     
@@ -601,6 +790,19 @@ async def create_tower_location(
         remarks=db_tower.remarks
     )
 
+@app.post("/tower-locations/bulk-update")
+def bulk_update_tower_locations(
+    batch: TowerBulkUpdate,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Update condition/inspection fields of many towers (by id or line_id + tower_number) in one transaction"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Only administrators can update tower locations")
+    if len(batch.updates) > TOWER_BULK_MAX:
+        raise HTTPException(status_code=400, detail=f"At most {TOWER_BULK_MAX} updates per request")
+    return bulk_update_towers(db, [item.model_dump(exclude_unset=True) for item in batch.updates])
+
 @app.put("/tower-locations/{tower_id}", response_model=TowerLocationResponse)
 async def update_tower_location(
     tower_id: int,
@@ -615,6 +817,8 @@ async def update_tower_location(
     if not db_tower:
         raise HTTPException(status_code=404, detail="Tower location not found")
     
+    affected_lines = {db_tower.transmission_line_id, tower.line_id}
+    check_lines_writable(db, affected_lines)
     db_tower.transmission_line_id = tower.line_id
     db_tower.tower_number = tower.tower_number
     db_tower.latitude = tower.latitude
@@ -627,6 +831,7 @@ async def update_tower_location(
     db_tower.condition = tower.condition
     db_tower.remarks = tower.remarks
     
+    derived_data.towers_written(db, affected_lines, "updated", db_tower)
     db.commit()
     db.refresh(db_tower)
     
@@ -659,8 +864,10 @@ async def delete_tower_location(
     db_tower = db.query(TowerLocation).filter(TowerLocation.id == tower_id).first()
     if not db_tower:
         raise HTTPException(status_code=404, detail="Tower location not found")
+    check_lines_writable(db, [db_tower.transmission_line_id])
     
     db.delete(db_tower)
+    derived_data.towers_written(db, [db_tower.transmission_line_id], "deleted", db_tower)
     db.commit()
     return {"message": "Tower location deleted successfully"}
 
@@ -672,19 +879,31 @@ async def get_tripping_incidents(
     voltage_level: Optional[str] = None,
     fault_type: Optional[str] = None,
     attributed_to_powergrid: Optional[str] = None,
+    from_: Optional[datetime] = Query(None, alias="from"),
+    to: Optional[datetime] = None,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    query = db.query(TrippingIncident).join(TransmissionLine)
+    """List incidents; `from`/`to` bound fault_at (inclusive/exclusive) via its index.
+    Archived years are only read when the range reaches into them."""
+    source = incident_source(db, from_, to)
+    query = db.query(source, TransmissionLine.line_name, TransmissionLine.voltage_level).join(
+        TransmissionLine, TransmissionLine.id == source.c.transmission_line_id
+    )
+    
+    if from_:
+        query = query.filter(source.c.fault_at >= from_)
+    if to:
+        query = query.filter(source.c.fault_at < to)
     
     if line_id:
-        query = query.filter(TrippingIncident.transmission_line_id == line_id)
+        query = query.filter(source.c.transmission_line_id == line_id)
     if voltage_level:
         query = query.filter(TransmissionLine.voltage_level == voltage_level)
     if fault_type:
-        query = query.filter(TrippingIncident.fault_type == fault_type)
+        query = query.filter(source.c.fault_type == fault_type)
     if attributed_to_powergrid:
-        query = query.filter(TrippingIncident.attributed_to_powergrid == attributed_to_powergrid)
+        query = query.filter(source.c.attributed_to_powergrid == attributed_to_powergrid)
     
     incidents = query.all()
     
@@ -692,8 +911,8 @@ async def get_tripping_incidents(
         TrippingIncidentResponse(
             id=incident.id,
             line_id=incident.transmission_line_id,
-            line_name=incident.transmission_line.line_name,
-            voltage_level=incident.transmission_line.voltage_level,
+            line_name=incident.line_name,
+            voltage_level=incident.voltage_level,
             fault_date=incident.fault_date,
             fault_time=incident.fault_time,
             fault_type=incident.fault_type,
@@ -704,7 +923,9 @@ async def get_tripping_incidents(
             attributed_to_powergrid=incident.attributed_to_powergrid,
             root_cause=incident.root_cause,
             corrective_action=incident.corrective_action,
-            remarks=incident.remarks
+            remarks=incident.remarks,
+            fault_at=incident.fault_at,
+            restored_at=incident.restored_at
         ) for incident in incidents
     ]
 
@@ -720,6 +941,7 @@ async def create_tripping_incident(
     line = db.query(TransmissionLine).filter(TransmissionLine.id == incident.line_id).first()
     if not line:
         raise HTTPException(status_code=400, detail="Transmission line not found")
+    check_lines_writable(db, [incident.line_id])
     
     db_incident = TrippingIncident(
         transmission_line_id=incident.line_id,
@@ -736,6 +958,8 @@ async def create_tripping_incident(
         remarks=incident.remarks
     )
     db.add(db_incident)
+    db.flush()
+    derived_data.incident_written(db, after=derived_data.snapshot_incident(db_incident))
     db.commit()
     db.refresh(db_incident)
     
@@ -753,7 +977,9 @@ async def create_tripping_incident(
         attributed_to_powergrid=db_incident.attributed_to_powergrid,
         root_cause=db_incident.root_cause,
         corrective_action=db_incident.corrective_action,
-        remarks=db_incident.remarks
+        remarks=db_incident.remarks,
+        fault_at=db_incident.fault_at,
+        restored_at=db_incident.restored_at
     )
 
 @app.put("/tripping-incidents/{incident_id}", response_model=TrippingIncidentResponse)
@@ -768,8 +994,14 @@ async def update_tripping_incident(
     
     db_incident = db.query(TrippingIncident).filter(TrippingIncident.id == incident_id).first()
     if not db_incident:
+        try:
+            check_not_archived(db, incident_id)
+        except ArchivedIncidentError as e:
+            raise HTTPException(status_code=409, detail=str(e))
         raise HTTPException(status_code=404, detail="Tripping incident not found")
     
+    check_lines_writable(db, [db_incident.transmission_line_id, incident.line_id])
+    previous = derived_data.snapshot_incident(db_incident)
     db_incident.transmission_line_id = incident.line_id
     db_incident.fault_date = incident.fault_date
     db_incident.fault_time = incident.fault_time
@@ -783,6 +1015,9 @@ async def update_tripping_incident(
     db_incident.corrective_action = incident.corrective_action
     db_incident.remarks = incident.remarks
     
+    db.flush()
+    db.expire(db_incident, ["transmission_line"])
+    derived_data.incident_written(db, before=previous, after=derived_data.snapshot_incident(db_incident))
     db.commit()
     db.refresh(db_incident)
     
@@ -801,7 +1036,9 @@ async def update_tripping_incident(
         attributed_to_powergrid=db_incident.attributed_to_powergrid,
         root_cause=db_incident.root_cause,
         corrective_action=db_incident.corrective_action,
-        remarks=db_incident.remarks
+        remarks=db_incident.remarks,
+        fault_at=db_incident.fault_at,
+        restored_at=db_incident.restored_at
     )
 
 @app.delete("/tripping-incidents/{incident_id}")
@@ -815,12 +1052,197 @@ async def delete_tripping_incident(
     
     db_incident = db.query(TrippingIncident).filter(TrippingIncident.id == incident_id).first()
     if not db_incident:
+        try:
+            check_not_archived(db, incident_id)
+        except ArchivedIncidentError as e:
+            raise HTTPException(status_code=409, detail=str(e))
         raise HTTPException(status_code=404, detail="Tripping incident not found")
     
+    check_lines_writable(db, [db_incident.transmission_line_id])
+    previous = derived_data.snapshot_incident(db_incident)
     db.delete(db_incident)
+    db.flush()
+    derived_data.incident_written(db, before=previous)
     db.commit()
     return {"message": "Tripping incident deleted successfully"}
 
+@app.get("/incident-archives")
+def get_incident_archives(
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Fault years moved out of the main incident table"""
+    return {"hot_years": HOT_YEARS, "archives": archive_summary(db)}
+
+@app.post("/incident-archives/run")
+def run_incident_archive(
+    hot_years: int = HOT_YEARS,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Move incidents of fault years before the last `hot_years` into per-year archive tables"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Only administrators can archive incidents")
+    if hot_years < 1:
+        raise HTTPException(status_code=400, detail="hot_years must be at least 1")
+    moved = archive_old_years(db, hot_years)
+    return {"archived": moved, "archives": archive_summary(db)}
+
+# ==================== BACKUPS ====================
+
+@app.get("/backups")
+def get_backups(current_user: User = Depends(get_current_active_user)):
+    """Retained database snapshots, newest first"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Only administrators can manage backups")
+    return {"backups": list_backups()}
+
+@app.post("/backups")
+def create_database_backup(current_user: User = Depends(get_current_active_user)):
+    """Take an online snapshot of the database (restore with `python backup.py --restore`)"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Only administrators can manage backups")
+    try:
+        return create_backup()
+    except BackupError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# ==================== SCHEDULED JOBS ====================
+
+@app.get("/jobs")
+def get_scheduled_jobs(
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Schedules, leases, last run and recent durations of the maintenance jobs"""
+    return {"enabled": SCHEDULER_ENABLED, "jobs": job_summary(db)}
+
+@app.get("/jobs/runs")
+def get_job_runs(
+    job: Optional[str] = None,
+    status: Optional[str] = None,
+    limit: int = 50,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Job run history, newest first"""
+    return {"runs": job_history(db, job, status, max(1, min(limit, 500)))}
+
+@app.post("/jobs/{name}/run")
+def run_scheduled_job(name: str, current_user: User = Depends(get_current_active_user)):
+    """Run a job now in the background; it still takes the job's lease"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Only administrators can run jobs")
+    if name not in scheduler.jobs:
+        raise HTTPException(status_code=404, detail=f"Unknown job {name}")
+    if not scheduler.run_in_background(name):
+        raise HTTPException(status_code=409, detail=f"{name} is already running")
+    return {"started": name}
+
+# ==================== AVAILABILITY ====================
+
+@app.get("/availability/")
+def get_availability_summary(
+    year: int,
+    month: Optional[int] = None,
+    level: str = "line",
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_read_db)
+):
+    """Monthly (or yearly, without month) availability per line, office or region"""
+    if level not in ("line", "office", "region"):
+        raise HTTPException(status_code=400, detail="level must be 'line', 'office' or 'region'")
+    if month is not None and not 1 <= month <= 12:
+        raise HTTPException(status_code=400, detail="month must be between 1 and 12")
+    
+    return {
+        "year": year,
+        "month": month,
+        "level": level,
+        "results": get_availability(db, year, month, level)
+    }
+
+@app.get("/availability/{line_id}")
+def get_line_availability_data(
+    line_id: int,
+    year: int,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_read_db)
+):
+    """Month-by-month availability of one line for a year"""
+    result = get_line_availability(db, line_id, year)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Transmission line not found")
+    return result
+
+# ==================== OFFLINE SYNC ====================
+
+@app.get("/sync")
+def sync_changes(
+    since: int = 0,
+    limit: int = SYNC_PAGE_SIZE,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Lines, towers and incidents changed after `since` (plus deleted ids); repeat while more is true"""
+    if not 1 <= limit <= SYNC_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {SYNC_PAGE_SIZE}")
+    return changes_since(db, since, limit)
+
+@app.post("/sync/upload")
+def sync_upload(
+    upload: SyncUpload,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Apply offline edits; each item reports created/updated/deleted, conflict or error"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Only administrators can upload changes")
+    if len(upload.changes) > SYNC_MAX_UPLOAD:
+        raise HTTPException(status_code=400, detail=f"At most {SYNC_MAX_UPLOAD} changes per upload")
+    return apply_upload(db, [change.model_dump() for change in upload.changes])
+
+# ==================== ANOMALY ALERTS ====================
+
+@app.get("/api/alerts")
+def get_anomaly_alerts(
+    line_id: Optional[int] = None,
+    acknowledged: Optional[bool] = None,
+    limit: int = 100,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Alerts raised by the streaming incident anomaly detector, newest first"""
+    query = db.query(AnomalyAlert)
+    if line_id:
+        query = query.filter(AnomalyAlert.transmission_line_id == line_id)
+    if acknowledged is not None:
+        query = query.filter(AnomalyAlert.acknowledged == acknowledged)
+    alerts = query.order_by(AnomalyAlert.id.desc()).limit(limit).all()
+    return [alert_to_dict(alert) for alert in alerts]
+
+@app.get("/api/alerts/stream")
+def stream_anomaly_alerts(
+    after_id: int = 0,
+    timeout: float = 25.0,
+    current_user: User = Depends(get_current_active_user)
+):
+    """Long-poll for alerts newer than after_id (returns [] on timeout)"""
+    return detector.stream.wait(after_id, min(max(timeout, 0.0), 60.0))
+
+@app.post("/api/alerts/{alert_id}/acknowledge")
+def acknowledge_anomaly_alert(
+    alert_id: int,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    alert = db.query(AnomalyAlert).filter(AnomalyAlert.id == alert_id).first()
+    if not alert:
+        raise HTTPException(status_code=404, detail="Alert not found")
+    alert.acknowledged = True
+    db.commit()
+    return alert_to_dict(alert)
+
 # ==================== SUPPORTING ENDPOINTS ====================
 
 @app.get("/states/")
@@ -851,15 +1273,35 @@ async def get_maintenance_offices(
 
 # ==================== PREDICTIVE MAINTENENCE ====================
 
+# pandas/numpy/sklearn are only imported when the first AI request arrives, so
+# workers that never serve one start fast and stay small. With INFERENCE_SOCKET
+# set, the model lives in the standalone worker (ai_models/inference.py) and is
+# never imported here at all.
+_maintenance_model = None
+_maintenance_model_lock = threading.Lock()
+
+def get_maintenance_model():
+    """Return the shared predictive maintenance model, creating it on first use"""
+    global _maintenance_model
+    if _maintenance_model is None:
+        # Sync endpoints and the scheduler call this from several threads
+        with _maintenance_model_lock:
+            if _maintenance_model is None:
+                if INFERENCE_SOCKET:
+                    _maintenance_model = RemoteMaintenanceModel()
+                else:
+                    from ai_models.predictive_maintenance import PredictiveMaintenanceModel
+                    _maintenance_model = PredictiveMaintenanceModel()
+    return _maintenance_model
 
 @app.get("/api/ai/predictive-maintenance")
-async def get_predictive_maintenance(
+def get_predictive_maintenance(
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """Get AI-powered predictive maintenance recommendations"""
     try:
-        model = PredictiveMaintenanceModel()
+        model = get_maintenance_model()
         predictions = model.predict_maintenance_needs(db)
         
         return {
@@ -871,16 +1313,28 @@ async def get_predictive_maintenance(
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/ai/train-model")
-async def train_ai_model(
+def train_ai_model(
+    mode: str = "standard",
+    budget_seconds: Optional[float] = None,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    """Train/retrain the AI model"""
+    """Train/retrain the AI model (mode=select runs the hyperparameter search,
+    mode=incremental only adds trees for lines whose features changed)"""
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Only admins can train models")
+    if mode not in ("standard", "select", "incremental"):
+        raise HTTPException(status_code=400, detail="mode must be 'standard', 'select' or 'incremental'")
     
     try:
-        model = PredictiveMaintenanceModel()
+        model = get_maintenance_model()
+        if mode == "select":
+            result = model.select_model(db, budget_seconds=budget_seconds)
+            return {**result, "message": "Model selected successfully" if result["success"] else result.get("message")}
+        if mode == "incremental":
+            result = model.update_model(db)
+            return {**result, "message": result.get("message") or f"Model updated ({result['mode']})"}
+
         success = model.train_model(db)
         
         return {"success": success, "message": "Model trained successfully"}
@@ -888,24 +1342,61 @@ async def train_ai_model(
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/ai/model-metrics")
-async def get_model_metrics(
+def get_model_metrics(
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """Get AI model performance metrics"""
     try:
-        model = PredictiveMaintenanceModel()
+        model = get_maintenance_model()
         metrics = model.get_model_metrics(db)
         return metrics
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/ai/drift")
+def get_model_drift(
+    limit: int = 10,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Feature and prediction drift per model version (PSI/KS against training), newest first"""
+    from ai_models.drift import snapshot_to_dict
+    snapshots = db.query(DriftSnapshot).order_by(DriftSnapshot.computed_at.desc()).limit(max(1, min(limit, 100))).all()
+    return {"snapshots": [snapshot_to_dict(s) for s in snapshots]}
+
+@app.get("/api/ai/forecast")
+def get_incident_forecast(
+    months: int = 6,
+    line_ids: Optional[List[int]] = Query(None),
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_read_db)
+):
+    """Expected trips per line for the next months (seasonal Poisson, fitted network-wide;
+    read from the last fit, which the scheduler and the refit endpoint keep up to date)"""
+    from ai_models.forecasting import forecast_incidents, MAX_HORIZON_MONTHS
+    if not 1 <= months <= MAX_HORIZON_MONTHS:
+        raise HTTPException(status_code=400, detail=f"months must be between 1 and {MAX_HORIZON_MONTHS}")
+    return forecast_incidents(db, months, line_ids)
+
+@app.post("/api/ai/forecast/refit")
+def refit_incident_forecast(
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Refit the forecast parameters for all lines"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Only admins can train models")
+    from ai_models.forecasting import get_forecaster
+    _, summary = get_forecaster(db, refit=True)
+    return {"success": True, **summary}
+
 # ==================== CHATBOT ====================
 @app.post("/api/ai/chatbot")
 async def chatbot_query(
     chat_message: ChatMessage,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """AI chatbot for natural language queries"""
     try:
@@ -925,7 +1416,9 @@ async def chatbot_query(
 # ==================== RUN ====================
 
 if __name__ == "__main__":
-    create_tables()
+    import uvicorn
+
+    ensure_schema()
     print("✅ Database tables initialized")
     print("🚀 Starting PowerGrid API server...")
     
@@ -0,0 +1,138 @@
+"""Read sessions for heavy analytics endpoints, kept off the write path.
+
+get_read_db() hands out a read-only session from one of three sources and
+reports how old its data may be in the X-Read-Source / X-Data-Staleness
+response headers:
+
+* replica  - READ_DATABASE_URL (e.g. a PostgreSQL streaming replica); its
+  replay lag is checked every few seconds;
+* snapshot - with READ_SNAPSHOT_SECONDS > 0 on SQLite, a copy of the
+  database taken with the online backup API and refreshed in the
+  background once it is older than that;
+* primary  - otherwise, a separate read-only connection pool on the primary
+  database (with WAL, SQLite readers do not block the writer).
+
+A replica or snapshot older than READ_MAX_STALENESS seconds is bypassed in
+favour of the primary, so staleness stays bounded.
+"""
+import os
+import threading
+import time
+from fastapi import Response
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+from backup import online_copy
+from database import SQLALCHEMY_DATABASE_URL, engine, is_sqlite, make_engine
+
+READ_DATABASE_URL = os.getenv("READ_DATABASE_URL")
+SNAPSHOT_SECONDS = float(os.getenv("READ_SNAPSHOT_SECONDS", "0"))
+MAX_STALENESS_SECONDS = float(os.getenv("READ_MAX_STALENESS", "300"))
+SNAPSHOT_PATH = "powergrid_read.db"
+LAG_CHECK_SECONDS = 5
+
+
+class ReadRouter:
+    def __init__(self, replica_url=READ_DATABASE_URL, snapshot_seconds=SNAPSHOT_SECONDS,
+                 max_staleness=MAX_STALENESS_SECONDS, snapshot_path=SNAPSHOT_PATH):
+        self.max_staleness = max_staleness
+        self.snapshot_seconds = snapshot_seconds
+        self.snapshot_path = snapshot_path
+        self.lock = threading.Lock()
+        self.refreshing = False
+        self.snapshot_at = None  # wall-clock time the current snapshot was taken
+        self.lag = 0.0
+        self.lag_checked_at = 0.0
+
+        self.primary = sessionmaker(bind=make_engine(SQLALCHEMY_DATABASE_URL, read_only=True))
+        if replica_url:
+            self.mode = "replica"
+            self.replica = sessionmaker(bind=make_engine(replica_url, read_only=True))
+        elif snapshot_seconds > 0 and is_sqlite(engine):
+            self.mode = "snapshot"
+            # A new connection per session, so a swapped-in snapshot file is picked up
+            self.snapshot = sessionmaker(bind=make_engine(
+                f"sqlite:///{snapshot_path}", read_only=True, poolclass=NullPool
+            ))
+        else:
+            self.mode = "primary"
+
+    # ---------- snapshot ----------
+
+    def refresh_snapshot(self):
+        """Copy the primary SQLite database into the snapshot file (online backup)"""
+        tmp = f"{self.snapshot_path}.tmp"
+        started = time.time()
+        online_copy(tmp)
+        os.replace(tmp, self.snapshot_path)
+        self.snapshot_at = started
+        return started
+
+    def _refresh_in_background(self):
+        with self.lock:
+            if self.refreshing:
+                return
+            self.refreshing = True
+
+        def run():
+            try:
+                self.refresh_snapshot()
+            except Exception as e:
+                print(f"⚠️  Read snapshot refresh failed: {e}")
+            finally:
+                self.refreshing = False
+
+        threading.Thread(target=run, name="read-snapshot", daemon=True).start()
+
+    # ---------- replica ----------
+
+    def _replica_lag(self):
+        now = time.monotonic()
+        if now - self.lag_checked_at < LAG_CHECK_SECONDS:
+            return self.lag
+        db = self.replica()
+        try:
+            if db.bind.dialect.name == "postgresql":
+                # NULL on a server that is not replaying WAL (i.e. not a replica)
+                lag = db.execute(text(
+                    "SELECT EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())"
+                )).scalar()
+                self.lag = max(float(lag or 0), 0.0)
+            else:
+                self.lag = 0.0
+        except Exception:
+            self.lag = float("inf")
+        finally:
+            db.close()
+        self.lag_checked_at = now
+        return self.lag
+
+    # ---------- sessions ----------
+
+    def session(self):
+        """(session, source, staleness in seconds) for the freshest allowed source"""
+        if self.mode == "replica":
+            lag = self._replica_lag()
+            if lag <= self.max_staleness:
+                return self.replica(), "replica", lag
+        elif self.mode == "snapshot":
+            age = None if self.snapshot_at is None else time.time() - self.snapshot_at
+            if age is None or age > self.snapshot_seconds:
+                self._refresh_in_background()
+            if age is not None and age <= self.max_staleness:
+                return self.snapshot(), "snapshot", age
+        return self.primary(), "primary", 0.0
+
+
+router = ReadRouter()
+
+
+def get_read_db(response: Response):
+    """Read-only session for analytics endpoints; sets the staleness headers"""
+    db, source, staleness = router.session()
+    response.headers["X-Read-Source"] = source
+    response.headers["X-Data-Staleness"] = f"{staleness:.1f}"
+    try:
+        yield db
+    finally:
+        db.close()
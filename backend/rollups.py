@@ -0,0 +1,204 @@
+"""Day and month incident rollups keyed by line, fault type, voltage and attribution.
+
+Writes apply +1/-1 deltas to the affected buckets; trend queries read a
+small date range of rollup rows instead of grouping the raw incident table.
+Run this module directly to rebuild the rollups from scratch:
+
+    python rollups.py
+"""
+from collections import defaultdict
+from datetime import date
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from database import SessionLocal, TransmissionLine, IncidentRollup
+from incident_archive import incident_source
+
+GRANULARITIES = ("day", "month")
+
+GROUP_COLUMNS = {
+    "line": IncidentRollup.transmission_line_id,
+    "fault_type": IncidentRollup.fault_type,
+    "voltage_level": IncidentRollup.voltage_level,
+    "attributed_to_powergrid": IncidentRollup.attributed_to_powergrid,
+}
+
+
+def bucket_start(day, granularity):
+    return day if granularity == "day" else day.replace(day=1)
+
+
+def incident_snapshot(incident):
+    """The rollup dimensions of an incident, captured before it is modified"""
+    if incident.fault_date is None:
+        return None
+    return {
+        "transmission_line_id": incident.transmission_line_id,
+        "fault_date": incident.fault_date,
+        "fault_type": incident.fault_type,
+        "voltage_level": incident.transmission_line.voltage_level if incident.transmission_line else None,
+        "attributed_to_powergrid": incident.attributed_to_powergrid,
+        "downtime_minutes": incident.downtime_minutes or 0,
+    }
+
+
+def apply_incident(db: Session, snapshot, sign=1):
+    """Add (sign=1) or remove (sign=-1) one incident from its day and month buckets. Does not commit."""
+    if snapshot is None:
+        return
+    for granularity in GRANULARITIES:
+        key = dict(
+            granularity=granularity,
+            period_start=bucket_start(snapshot["fault_date"], granularity),
+            transmission_line_id=snapshot["transmission_line_id"],
+            fault_type=snapshot["fault_type"],
+            voltage_level=snapshot["voltage_level"],
+            attributed_to_powergrid=snapshot["attributed_to_powergrid"],
+        )
+        row = db.query(IncidentRollup).filter_by(**key).first()
+        if row is None:
+            if sign < 0:
+                continue
+            row = IncidentRollup(incident_count=0, downtime_minutes=0, **key)
+            db.add(row)
+        row.incident_count += sign
+        row.downtime_minutes += sign * snapshot["downtime_minutes"]
+        if row.incident_count <= 0:
+            db.delete(row)
+    db.flush()
+
+
+def update_line_voltage(db: Session, line_id, voltage_level):
+    """Keep the denormalized voltage in step with its line. Does not commit."""
+    db.query(IncidentRollup).filter(
+        IncidentRollup.transmission_line_id == line_id
+    ).update({IncidentRollup.voltage_level: voltage_level}, synchronize_session=False)
+
+
+def rebuild_rollups(db: Session):
+    """Recompute all rollups with one GROUP BY per day bucket; months are summed from days"""
+    db.query(IncidentRollup).delete(synchronize_session=False)
+
+    incidents = incident_source(db)
+    day_rows = db.query(
+        incidents.c.fault_date,
+        incidents.c.transmission_line_id,
+        incidents.c.fault_type,
+        TransmissionLine.voltage_level,
+        incidents.c.attributed_to_powergrid,
+        func.count(incidents.c.id),
+        func.coalesce(func.sum(incidents.c.downtime_minutes), 0)
+    ).join(
+        TransmissionLine, TransmissionLine.id == incidents.c.transmission_line_id
+    ).filter(
+        incidents.c.fault_date.isnot(None)
+    ).group_by(
+        incidents.c.fault_date,
+        incidents.c.transmission_line_id,
+        incidents.c.fault_type,
+        TransmissionLine.voltage_level,
+        incidents.c.attributed_to_powergrid
+    ).all()
+
+    months = defaultdict(lambda: [0, 0])
+    mappings = []
+    for fault_date, line_id, fault_type, voltage, attributed, count, downtime in day_rows:
+        dims = dict(transmission_line_id=line_id, fault_type=fault_type,
+                    voltage_level=voltage, attributed_to_powergrid=attributed)
+        mappings.append(dict(granularity="day", period_start=fault_date,
+                             incident_count=count, downtime_minutes=downtime, **dims))
+        month = months[(fault_date.replace(day=1), line_id, fault_type, voltage, attributed)]
+        month[0] += count
+        month[1] += downtime
+
+    for (period_start, line_id, fault_type, voltage, attributed), (count, downtime) in months.items():
+        mappings.append(dict(granularity="month", period_start=period_start,
+                             transmission_line_id=line_id, fault_type=fault_type,
+                             voltage_level=voltage, attributed_to_powergrid=attributed,
+                             incident_count=count, downtime_minutes=downtime))
+
+    db.bulk_insert_mappings(IncidentRollup, mappings)
+    db.commit()
+    return len(mappings)
+
+
+def _bucket_counts(db: Session, granularity, start, end, group_by=None, filters=None):
+    column = GROUP_COLUMNS.get(group_by)
+    columns = [IncidentRollup.period_start]
+    if column is not None:
+        columns.append(column)
+
+    query = db.query(
+        *columns,
+        func.sum(IncidentRollup.incident_count),
+        func.sum(IncidentRollup.downtime_minutes)
+    ).filter(
+        IncidentRollup.granularity == granularity,
+        IncidentRollup.period_start >= start,
+        IncidentRollup.period_start < end
+    )
+
+    filters = filters or {}
+    if filters.get("maintenance_office_id"):
+        query = query.join(
+            TransmissionLine, TransmissionLine.id == IncidentRollup.transmission_line_id
+        ).filter(TransmissionLine.maintenance_office_id == filters["maintenance_office_id"])
+    for name in ("line", "fault_type", "voltage_level", "attributed_to_powergrid"):
+        if filters.get(name):
+            query = query.filter(GROUP_COLUMNS[name] == filters[name])
+
+    return query.group_by(*columns).all()
+
+
+def _next_month(day):
+    return date(day.year + 1, 1, 1) if day.month == 12 else date(day.year, day.month + 1, 1)
+
+
+def incident_trend(db: Session, start: date, end: date = None, granularity="month", group_by=None, filters=None):
+    """Incident counts per bucket in [start, end).
+
+    Monthly trends whose range starts or ends mid-month read those partial
+    months from the day rollups, so results match a raw fault_date range
+    filter exactly.
+    """
+    end = end or date.max
+    if granularity == "day":
+        rows = [tuple(row) for row in _bucket_counts(db, "day", start, end, group_by, filters)]
+    else:
+        first_full = start if start.day == 1 else _next_month(start)
+        last_full = end if end == date.max else end.replace(day=1)
+
+        if first_full >= last_full:
+            partial_days = [(start, end)]
+        else:
+            partial_days = [(start, first_full), (last_full, end)]
+        rows = [tuple(row) for row in _bucket_counts(db, "month", first_full, last_full, group_by, filters)] \
+            if first_full < last_full else []
+        for day_start, day_end in partial_days:
+            if day_start < day_end:
+                for row in _bucket_counts(db, "day", day_start, day_end, group_by, filters):
+                    rows.append((row[0].replace(day=1),) + tuple(row[1:]))
+
+    merged = defaultdict(lambda: [0, 0])
+    for row in rows:
+        key = tuple(row[:-2])
+        merged[key][0] += row[-2] or 0
+        merged[key][1] += row[-1] or 0
+
+    label = "%Y-%m-%d" if granularity == "day" else "%Y-%m"
+    result = []
+    for key in sorted(merged, key=lambda k: tuple(str(v) for v in k)):
+        count, downtime = merged[key]
+        entry = {"period": key[0].strftime(label), "count": count, "downtime_minutes": downtime}
+        if group_by in GROUP_COLUMNS:
+            entry[group_by] = key[1]
+        result.append(entry)
+    return result
+
+
+if __name__ == "__main__":
+    db = SessionLocal()
+    try:
+        rows = rebuild_rollups(db)
+        print(f"✅ Rebuilt incident rollups ({rows} rows)")
+    finally:
+        db.close()
@@ -0,0 +1,454 @@
+"""In-process scheduler for the nightly maintenance jobs.
+
+Every API worker starts the scheduler on startup (SCHEDULER_ENABLED=0 turns
+it off). Jobs run on 5-field cron schedules in server local time
+
+    minute hour day-of-month month day-of-week(0 = Sunday)
+
+with `*`, `a-b`, `*/n`, `a-b/n` and comma lists; SCHEDULE_<JOB> overrides a
+job's schedule and "off" disables it. Slots missed while no worker was up
+are not replayed.
+
+Leader election is per slot: when a slot comes due each worker waits a
+random jitter of up to SCHEDULER_JITTER_SECONDS, then tries to claim the
+job's row in job_leases with one conditional UPDATE that only succeeds if
+the slot has not been claimed yet and no lease is held. The first worker
+to wake runs the job; a worker that dies mid-run holds the job only until
+its lease expires. Jobs that warm in-process caches run in every worker
+and skip the lease.
+
+Every run is stored in job_runs with its worker, duration, outcome and the
+summary the job returned (GET /jobs, GET /jobs/runs).
+
+    python scheduler.py --list
+    python scheduler.py --run backup
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import func, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from database import SessionLocal, engine, is_sqlite, bump_generation, JobLease, JobRun
+
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "1") != "0"
+JITTER_SECONDS = float(os.getenv("SCHEDULER_JITTER_SECONDS", "120"))
+LEASE_SECONDS = 3600
+HISTORY_DAYS = 90
+MAX_SLEEP_SECONDS = 60  # re-check the clock at least this often
+STATS_RUNS = 30  # recent runs summarised per job
+
+# (low, high) of minute, hour, day of month, month, day of week
+CRON_FIELDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 6))
+
+
+class JobSkipped(Exception):
+    """Raised by a job that has nothing to do in this deployment"""
+
+
+class CronSchedule:
+    def __init__(self, expr):
+        fields = expr.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron schedule needs 5 fields: {expr!r}")
+        self.expr = expr
+        self.minutes, self.hours, self.days, self.months, self.weekdays = (
+            self._parse(field, low, high) for field, (low, high) in zip(fields, CRON_FIELDS)
+        )
+        # As in cron, a restricted day of month and day of week match either
+        self.any_day = fields[2] == "*" or fields[4] == "*"
+
+    @staticmethod
+    def _parse(field, low, high):
+        values = set()
+        for part in field.split(","):
+            spec, _, step = part.partition("/")
+            if spec == "*":
+                start, end = low, high
+            elif "-" in spec:
+                start, end = (int(v) for v in spec.split("-"))
+            else:
+                start = int(spec)
+                end = high if step else start
+            step = int(step) if step else 1
+            if not low <= start <= end <= high or step < 1:
+                raise ValueError(f"Invalid cron field: {field!r}")
+            values.update(range(start, end + 1, step))
+        return frozenset(values)
+
+    def _day_matches(self, day):
+        in_month = day.day in self.days
+        in_week = (day.weekday() + 1) % 7 in self.weekdays
+        return (in_month and in_week) if self.any_day else (in_month or in_week)
+
+    def next_after(self, moment):
+        """First matching minute strictly after `moment`"""
+        t = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = t + timedelta(days=366 * 5)
+        while t < limit:
+            if t.month not in self.months or not self._day_matches(t):
+                t = t.replace(hour=0, minute=0) + timedelta(days=1)
+            elif t.hour not in self.hours:
+                t = t.replace(minute=0) + timedelta(hours=1)
+            elif t.minute not in self.minutes:
+                t += timedelta(minutes=1)
+            else:
+                return t
+        raise ValueError(f"Cron schedule never matches: {self.expr!r}")
+
+
+class Job:
+    def __init__(self, name, schedule, fn, leader=True, lease_seconds=LEASE_SECONDS):
+        self.name = name
+        self.fn = fn  # fn(db) -> JSON-able summary
+        self.leader = leader  # False: runs in every worker
+        self.lease_seconds = lease_seconds
+        expr = os.getenv(f"SCHEDULE_{name.upper()}", schedule).strip()
+        self.schedule = None if expr.lower() == "off" else CronSchedule(expr)
+
+
+# ==================== JOBS ====================
+
+def _local_model():
+    from ai_models.predictive_maintenance import PredictiveMaintenanceModel
+    return PredictiveMaintenanceModel()
+
+
+def refresh_features(db: Session):
+    """Re-anchor the recent-incident window of the line features"""
+    from ai_models.feature_store import refresh_line_features
+    count = refresh_line_features(db)
+    db.commit()
+    return {"lines": count}
+
+
+def rebuild_aggregates(db: Session):
+    """Exact rebuild of the incident and availability rollups"""
+    from availability import rebuild_availability
+    from rollups import rebuild_rollups
+    rollups = rebuild_rollups(db)
+    availability = rebuild_availability(db)
+    # Leaderboards in every worker re-read the rebuilt rollups
+    bump_generation(db, "incidents")
+    db.commit()
+    return {"rollup_rows": rollups, "availability_rows": availability}
+
+
+def retrain_model(db: Session):
+    """Incremental model update (full rebuild when due)"""
+    return scheduler.maintenance_model().update_model(db)
+
+
+def refit_forecast(db: Session):
+    """Refit the incident forecast if incidents changed or a month began"""
+    from ai_models.forecasting import get_forecaster
+    _, summary = get_forecaster(db)
+    return summary or {"refit": False}
+
+
+def warm_predictions(db: Session):
+    """Score every line so the first maintenance request reads cached predictions"""
+    predictions = scheduler.maintenance_model().predict_maintenance_needs(db)
+    return {"recommendations": len(predictions)}
+
+
+def warm_leaderboard(db: Session):
+    """Rebuild this worker's fault leaderboards for the new day"""
+    from leaderboard import leaderboard
+    leaderboard.reconcile(db)
+    return {"boards": len(leaderboard.tops)}
+
+
+def run_backup(db: Session):
+    from backup import create_backup
+    if not is_sqlite(engine):
+        raise JobSkipped("Online backups are for SQLite")
+    return create_backup()
+
+
+def export_incidents(db: Session):
+    from columnar_export import run_export, ExportUnavailable
+    try:
+        return run_export()
+    except ExportUnavailable as e:
+        raise JobSkipped(str(e))
+
+
+def prune_events(db: Session):
+    from events import prune
+    return {"removed": prune(db)}
+
+
+def detect_anomalies(db: Session):
+    """Run the anomaly detector over incidents that no write hook processed"""
+    from anomaly import detector
+    return {"incidents": detector.catch_up(db)}
+
+
+def archive_incidents(db: Session):
+    from incident_archive import archive_old_years
+    return {"archived": archive_old_years(db)}
+
+
+JOBS = [
+    Job("features", "5 0 * * *", refresh_features),
+    Job("leaderboard", "10 0 * * *", warm_leaderboard, leader=False),
+    Job("aggregates", "20 0 * * *", rebuild_aggregates),
+    Job("retrain", "0 1 * * *", retrain_model, lease_seconds=4 * 3600),
+    Job("forecast", "30 1 * * *", refit_forecast),
+    Job("predictions", "0 2 * * *", warm_predictions),
+    Job("backup", "30 2 * * *", run_backup),
+    Job("export", "0 3 * * *", export_incidents),
+    Job("events", "30 3 * * *", prune_events),
+    Job("archive", "0 4 1 * *", archive_incidents, lease_seconds=4 * 3600),
+    Job("anomalies", "*/10 * * * *", detect_anomalies),
+]
+
+
+# ==================== SCHEDULER ====================
+
+class Scheduler:
+    def __init__(self, jobs=JOBS, jitter=JITTER_SECONDS):
+        self.jobs = {job.name: job for job in jobs}
+        self.jitter = jitter
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self.maintenance_model = _local_model
+        self.lock = threading.Lock()
+        self.running = set()
+        self.next_runs = {}
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self, maintenance_model=None):
+        """Start the scheduler thread; `maintenance_model` returns the model jobs use"""
+        if maintenance_model is not None:
+            self.maintenance_model = maintenance_model
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"  # forked workers
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._loop, name="scheduler", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def _loop(self):
+        now = datetime.now()
+        due = {}
+        for job in self.jobs.values():
+            if job.schedule is not None:
+                slot = job.schedule.next_after(now)
+                due[job.name] = (slot, slot + timedelta(seconds=random.uniform(0, self.jitter)))
+        self.next_runs = {name: slot for name, (slot, _) in due.items()}
+
+        while due and not self.stop_event.is_set():
+            name = min(due, key=lambda n: due[n][1])
+            slot, start_at = due[name]
+            wait = (start_at - datetime.now()).total_seconds()
+            if wait > 0:
+                self.stop_event.wait(min(wait, MAX_SLEEP_SECONDS))
+                continue
+            job = self.jobs[name]
+            self.run(job, slot)
+            following = job.schedule.next_after(max(slot, datetime.now()))
+            due[name] = (following, following + timedelta(seconds=random.uniform(0, self.jitter)))
+            self.next_runs[name] = following
+
+    # ---------- lease ----------
+
+    def claim(self, job, slot):
+        """Take the job's lock row for this slot; False if another worker has it"""
+        table = JobLease.__table__
+        now = datetime.utcnow()
+        values = dict(owner=self.owner, last_slot=slot, acquired_at=now,
+                      expires_at=now + timedelta(seconds=job.lease_seconds))
+        with engine.begin() as conn:
+            claimed = conn.execute(table.update().where(
+                table.c.name == job.name,
+                or_(table.c.last_slot.is_(None), table.c.last_slot < slot),
+                or_(table.c.expires_at.is_(None), table.c.expires_at < now),
+            ).values(**values)).rowcount
+            if claimed:
+                return True
+            exists = conn.execute(table.select().where(table.c.name == job.name)).first() is not None
+        if exists:
+            return False
+        try:
+            with engine.begin() as conn:
+                conn.execute(table.insert().values(name=job.name, **values))
+            return True
+        except IntegrityError:
+            return False  # another worker created it first
+
+    def release(self, job):
+        table = JobLease.__table__
+        with engine.begin() as conn:
+            conn.execute(table.update().where(
+                table.c.name == job.name, table.c.owner == self.owner
+            ).values(expires_at=datetime.utcnow()))
+
+    # ---------- runs ----------
+
+    def run(self, job, slot=None):
+        """Run a job now (slot None = manual); returns its JobRun id, or None if
+        another worker (or this one) is already running it"""
+        with self.lock:
+            if job.name in self.running:
+                return None
+            self.running.add(job.name)
+        try:
+            trigger = "manual" if slot is None else "schedule"
+            if job.leader and not self.claim(job, slot or datetime.now()):
+                return None
+
+            started_at = datetime.utcnow()
+            started = time.perf_counter()
+            result, error, status = None, None, "success"
+            db = SessionLocal()
+            try:
+                result = job.fn(db)
+            except JobSkipped as e:
+                status, error = "skipped", str(e)
+            except Exception as e:
+                db.rollback()
+                status, error = "failed", f"{type(e).__name__}: {e}"
+                print(f"⚠️  Scheduled job {job.name} failed: {error}")
+            finally:
+                db.close()
+                if job.leader:
+                    self.release(job)
+
+            return self._record(job, trigger, slot, started_at, started, status, result, error)
+        finally:
+            with self.lock:
+                self.running.discard(job.name)
+
+    def run_in_background(self, name):
+        """Manual trigger; False if the job is already running in this worker"""
+        job = self.jobs[name]
+        if job.name in self.running:
+            return False
+        threading.Thread(target=self.run, args=(job,), name=f"job-{name}", daemon=True).start()
+        return True
+
+    def _record(self, job, trigger, slot, started_at, started, status, result, error):
+        db = SessionLocal()
+        try:
+            run = JobRun(
+                job=job.name, owner=self.owner, trigger=trigger, scheduled_for=slot,
+                started_at=started_at, finished_at=datetime.utcnow(),
+                duration_ms=round((time.perf_counter() - started) * 1000, 1),
+                status=status, result=json.dumps(result, default=str), error=error,
+            )
+            db.add(run)
+            db.query(JobRun).filter(
+                JobRun.job == job.name,
+                JobRun.started_at < datetime.utcnow() - timedelta(days=HISTORY_DAYS)
+            ).delete(synchronize_session=False)
+            db.commit()
+            return run.id
+        finally:
+            db.close()
+
+
+scheduler = Scheduler()
+
+
+# ==================== STATUS ====================
+
+def run_to_dict(run):
+    return {
+        "id": run.id,
+        "job": run.job,
+        "owner": run.owner,
+        "trigger": run.trigger,
+        "scheduled_for": run.scheduled_for.isoformat() if run.scheduled_for else None,
+        "started_at": run.started_at.isoformat() if run.started_at else None,
+        "finished_at": run.finished_at.isoformat() if run.finished_at else None,
+        "duration_ms": run.duration_ms,
+        "status": run.status,
+        "result": json.loads(run.result) if run.result else None,
+        "error": run.error,
+    }
+
+
+def job_history(db: Session, job=None, status=None, limit=50):
+    query = db.query(JobRun)
+    if job:
+        query = query.filter(JobRun.job == job)
+    if status:
+        query = query.filter(JobRun.status == status)
+    return [run_to_dict(run) for run in query.order_by(JobRun.started_at.desc(), JobRun.id.desc()).limit(limit).all()]
+
+
+def job_summary(db: Session, sched=scheduler):
+    """Schedule, lease, last run and recent duration statistics of every job"""
+    leases = {lease.name: lease for lease in db.query(JobLease).all()}
+    totals = dict(db.query(JobRun.job, func.count(JobRun.id)).group_by(JobRun.job).all())
+    summary = []
+    for job in sched.jobs.values():
+        recent = db.query(JobRun).filter(JobRun.job == job.name).order_by(
+            JobRun.started_at.desc(), JobRun.id.desc()).limit(STATS_RUNS).all()
+        durations = [run.duration_ms for run in recent if run.status == "success"]
+        lease = leases.get(job.name)
+        summary.append({
+            "job": job.name,
+            "description": (job.fn.__doc__ or "").strip(),
+            "schedule": job.schedule.expr if job.schedule else None,
+            "leader": job.leader,
+            "next_run": sched.next_runs[job.name].isoformat() if job.name in sched.next_runs else None,
+            "running_here": job.name in sched.running,
+            "lease": {
+                "owner": lease.owner,
+                "last_slot": lease.last_slot.isoformat() if lease.last_slot else None,
+                "expires_at": lease.expires_at.isoformat() if lease.expires_at else None,
+            } if lease else None,
+            "last_run": run_to_dict(recent[0]) if recent else None,
+            "runs": totals.get(job.name, 0),
+            "recent": {
+                "runs": len(recent),
+                "failed": sum(run.status == "failed" for run in recent),
+                "avg_ms": round(sum(durations) / len(durations), 1) if durations else None,
+                "max_ms": max(durations) if durations else None,
+            },
+        })
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scheduled maintenance jobs")
+    parser.add_argument("--list", action="store_true", help="show schedules and recent runs")
+    parser.add_argument("--run", metavar="JOB", help="run one job now (takes the lease)")
+    args = parser.parse_args()
+
+    if args.run:
+        if args.run not in scheduler.jobs:
+            raise SystemExit(f"❌ Unknown job {args.run}; one of {', '.join(scheduler.jobs)}")
+        run_id = scheduler.run(scheduler.jobs[args.run])
+        if run_id is None:
+            raise SystemExit(f"❌ {args.run} is running in another worker")
+        db = SessionLocal()
+        try:
+            run = run_to_dict(db.get(JobRun, run_id))
+        finally:
+            db.close()
+        icon = {"success": "✅", "skipped": "⏭️ ", "failed": "❌"}[run["status"]]
+        print(f"{icon} {args.run} {run['status']} in {run['duration_ms']:.0f} ms: {run['error'] or run['result']}")
+    else:
+        db = SessionLocal()
+        try:
+            now = datetime.now()
+            for job in job_summary(db):
+                spec = scheduler.jobs[job["job"]].schedule
+                upcoming = spec.next_after(now).strftime("%Y-%m-%d %H:%M") if spec else "off"
+                last = job["last_run"]
+                status = f"{last['status']} {last['duration_ms']:.0f} ms at {last['started_at'][:16]}" if last else "never run"
+                print(f"🕒 {job['job']:<12} {job['schedule'] or 'off':<12} next {upcoming}  last {status}")
+        finally:
+            db.close()
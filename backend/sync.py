@@ -0,0 +1,281 @@
+"""Delta sync for offline clients (field tablets).
+
+Every flushed insert/update/delete of a line, tower or incident is recorded
+in change_log by a session hook in database.py; a row keeps only its latest
+entry, so the log grows with the number of rows, not with edits, and
+deletes leave tombstones. Clients remember the highest seq they have seen
+and pull only newer changes in a columnar batch:
+
+    GET /sync?since=<seq>
+    {"seq": 1234, "more": false, "entities": {"towers": {
+        "fields": ["id", "seq", "tower_number", ...],
+        "rows": [[17, 1201, "T-017", ...], ...],
+        "deleted": [23, 24]}}}
+
+Offline edits are uploaded with the seq each row was last synced at
+(base_seq). A row changed on the server since then is reported as a
+conflict together with the server's copy, instead of being overwritten.
+
+seq values come from SQLite's serialized writers; on PostgreSQL with
+concurrent writers a client could skip a change committed out of seq order.
+"""
+from datetime import date
+from sqlalchemy import Date, DateTime, Float, Integer, func
+from sqlalchemy.orm import Session
+from database import ChangeLog, State, MaintenanceOffice, TransmissionLine, TowerLocation, TrippingIncident
+import derived_data
+from line_removal import remove_lines, check_lines_writable, LineDecommissioningError
+from incident_archive import check_not_archived, ArchivedIncidentError
+
+PAGE_SIZE = 2000
+MAX_UPLOAD = 1000
+
+SYNC_ENTITIES = {
+    "lines": (TransmissionLine, [
+        "line_name", "voltage_level", "commission_date", "total_length_km", "state_id",
+        "maintenance_office_id", "status", "remarks",
+    ]),
+    "towers": (TowerLocation, [
+        "transmission_line_id", "tower_number", "latitude", "longitude", "foundation_type", "tower_type",
+        "height_meters", "installation_date", "last_inspection_date", "condition", "remarks",
+    ]),
+    "incidents": (TrippingIncident, [
+        "transmission_line_id", "fault_date", "fault_time", "fault_type", "fault_location", "affected_phases",
+        "restoration_time", "downtime_minutes", "attributed_to_powergrid", "root_cause", "corrective_action",
+        "remarks",
+    ]),
+}
+
+# Fields the REST *Create models in main.py require, under their column names;
+# a sync create must carry all of them and an update cannot clear them
+REQUIRED_FIELDS = {
+    "lines": ["line_name", "voltage_level", "total_length_km", "commission_date", "state_id",
+              "maintenance_office_id"],
+    "towers": ["transmission_line_id", "tower_number", "latitude", "longitude", "foundation_type", "tower_type",
+               "height_meters", "installation_date"],
+    "incidents": ["transmission_line_id", "fault_date", "fault_time", "fault_type", "fault_location",
+                  "affected_phases", "downtime_minutes"],
+}
+
+# Defaults the REST models fill in when a field is omitted on create
+CREATE_DEFAULTS = {
+    "lines": {"status": "Active"},
+    "towers": {"condition": "Good"},
+    "incidents": {"attributed_to_powergrid": "YES"},
+}
+
+REFERENCES = {
+    "transmission_line_id": TransmissionLine,
+    "state_id": State,
+    "maintenance_office_id": MaintenanceOffice,
+}
+
+
+class SyncError(Exception):
+    pass
+
+
+def _row_values(obj, fields):
+    return [getattr(obj, name) for name in fields]
+
+
+def current_seq(db: Session):
+    return db.query(func.max(ChangeLog.seq)).scalar() or 0
+
+
+# ==================== PULL ====================
+
+def changes_since(db: Session, since=0, limit=PAGE_SIZE):
+    """Rows changed after `since`, oldest change first, at most `limit` entries"""
+    entries = db.query(ChangeLog).filter(ChangeLog.seq > since).order_by(ChangeLog.seq).limit(limit + 1).all()
+    more = len(entries) > limit
+    entries = entries[:limit]
+
+    entities = {}
+    for entity, (model, fields) in SYNC_ENTITIES.items():
+        upserts = {e.entity_id: e.seq for e in entries if e.entity == entity and e.op == "upsert"}
+        deleted = [e.entity_id for e in entries if e.entity == entity and e.op == "delete"]
+        if not upserts and not deleted:
+            continue
+
+        rows = []
+        ids = list(upserts)
+        for start in range(0, len(ids), 500):
+            for obj in db.query(model).filter(model.id.in_(ids[start:start + 500])).all():
+                rows.append([obj.id, upserts[obj.id]] + _row_values(obj, fields))
+        rows.sort(key=lambda row: row[1])
+        entities[entity] = {"fields": ["id", "seq"] + fields, "rows": rows, "deleted": deleted}
+
+    return {
+        "since": since,
+        "seq": entries[-1].seq if entries else max(since, 0),
+        "more": more,
+        "entities": entities,
+    }
+
+
+# ==================== UPLOAD ====================
+
+def _coerce(model, name, value):
+    if value is None:
+        return None
+    column_type = model.__table__.c[name].type
+    try:
+        if isinstance(column_type, Date) and not isinstance(column_type, DateTime):
+            return value if isinstance(value, date) else date.fromisoformat(str(value))
+        if isinstance(column_type, Float):
+            return float(value)
+        if isinstance(column_type, Integer):
+            return int(value)
+    except (TypeError, ValueError):
+        raise SyncError(f"Invalid value for {name}: {value!r}")
+    return str(value)
+
+
+def _validated(db: Session, entity, model, fields, data, creating):
+    unknown = set(data) - set(fields)
+    if unknown:
+        raise SyncError(f"Unknown fields for {entity}: {', '.join(sorted(unknown))}")
+    values = {name: _coerce(model, name, value) for name, value in data.items()}
+
+    required = REQUIRED_FIELDS[entity]
+    if creating:
+        missing = [name for name in required if values.get(name) is None]
+        if missing:
+            raise SyncError(f"Missing required fields: {', '.join(missing)}")
+        for name, value in CREATE_DEFAULTS[entity].items():
+            if values.get(name) is None:
+                values[name] = value
+    else:
+        cleared = [name for name in required if name in values and values[name] is None]
+        if cleared:
+            raise SyncError(f"Required fields cannot be cleared: {', '.join(cleared)}")
+    for name, target in REFERENCES.items():
+        if values.get(name) is not None and db.get(target, values[name]) is None:
+            raise SyncError(f"{name} {values[name]} does not exist")
+    return values
+
+
+def _entry_seq(db: Session, entity, entity_id):
+    entry = db.query(ChangeLog.seq, ChangeLog.op).filter(
+        ChangeLog.entity == entity, ChangeLog.entity_id == entity_id
+    ).first()
+    return entry or (None, None)
+
+
+def _apply_line(db, line, values, op, creating):
+    if op == "delete":
+        remove_lines(db, [line])
+        return
+    previous_km = line.total_length_km
+    for name, value in values.items():
+        setattr(line, name, value)
+    db.flush()
+    if creating:
+        derived_data.line_created(db, line)
+    else:
+        derived_data.line_updated(db, line, previous_km)
+
+
+def _apply_tower(db, tower, values, op, creating):
+    if op == "delete":
+        db.delete(tower)
+        derived_data.towers_written(db, [tower.transmission_line_id], "deleted", tower)
+        return
+    lines = {tower.transmission_line_id}
+    for name, value in values.items():
+        setattr(tower, name, value)
+    lines.add(tower.transmission_line_id)
+    derived_data.towers_written(db, lines - {None}, "created" if creating else "updated", tower)
+
+
+def _apply_incident(db, incident, values, op, creating):
+    previous = None if creating else derived_data.snapshot_incident(incident)
+    if op == "delete":
+        db.delete(incident)
+        db.flush()
+        derived_data.incident_written(db, before=previous)
+        return
+    for name, value in values.items():
+        setattr(incident, name, value)
+    db.flush()
+    db.expire(incident, ["transmission_line"])
+    derived_data.incident_written(db, before=previous, after=derived_data.snapshot_incident(incident))
+
+
+def apply_change(db: Session, change):
+    """Apply one uploaded change; returns its per-item result. Raises SyncError."""
+    entity, op = change.get("entity"), change.get("op", "upsert")
+    if entity not in SYNC_ENTITIES:
+        raise SyncError(f"Unknown entity: {entity}")
+    if op not in ("upsert", "delete"):
+        raise SyncError(f"Unknown op: {op}")
+    model, fields = SYNC_ENTITIES[entity]
+    entity_id = change.get("id")
+    base_seq = change.get("base_seq") or 0
+
+    obj = None
+    if entity_id is not None:
+        seq, last_op = _entry_seq(db, entity, entity_id)
+        obj = db.get(model, entity_id)
+        if obj is None and entity == "incidents":
+            try:
+                check_not_archived(db, entity_id)
+            except ArchivedIncidentError as e:
+                raise SyncError(str(e))
+        if op == "delete" and last_op == "delete":
+            return {"status": "deleted", "id": entity_id, "seq": seq}
+        if seq is not None and seq > base_seq:
+            return {
+                "status": "conflict",
+                "server_seq": seq,
+                "server": None if last_op == "delete" or obj is None
+                else dict(zip(["id"] + fields, [obj.id] + _row_values(obj, fields))),
+            }
+        if obj is None:
+            if op == "delete":
+                return {"status": "deleted"}
+            raise SyncError(f"{entity} {entity_id} does not exist")
+    elif op == "delete":
+        raise SyncError("id is required to delete")
+
+    creating = obj is None
+    values = {} if op == "delete" else _validated(db, entity, model, fields, change.get("data") or {}, creating)
+    try:
+        check_lines_writable(db, [values.get("transmission_line_id"),
+                                  None if obj is None else obj.id if entity == "lines" else obj.transmission_line_id])
+    except LineDecommissioningError as e:
+        raise SyncError(str(e))
+    if creating:
+        obj = model()
+        db.add(obj)
+
+    if entity == "lines":
+        _apply_line(db, obj, values, op, creating)
+    elif entity == "towers":
+        _apply_tower(db, obj, values, op, creating)
+    else:
+        _apply_incident(db, obj, values, op, creating)
+
+    db.flush()
+    if op == "delete":
+        return {"status": "deleted", "id": entity_id, "seq": _entry_seq(db, entity, entity_id)[0]}
+    return {"status": "created" if creating else "updated", "id": obj.id, "seq": _entry_seq(db, entity, obj.id)[0]}
+
+
+def apply_upload(db: Session, changes):
+    """Apply a batch of offline edits in one transaction.
+
+    apply_change() checks conflicts and validates each item before touching
+    any row, so rejected items leave nothing behind and no savepoints are
+    needed (pysqlite does not handle them reliably).
+    """
+    results = []
+    for index, change in enumerate(changes):
+        try:
+            result = apply_change(db, change)
+        except SyncError as e:
+            result = {"status": "error", "detail": str(e)}
+        results.append({"index": index, "entity": change.get("entity"), **result})
+    db.commit()
+    return {"seq": current_seq(db), "results": results}
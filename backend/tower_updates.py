@@ -0,0 +1,94 @@
+"""Batch condition/inspection updates for towers after a patrol.
+
+Items address a tower by id or by (line_id, tower_number). All tower
+numbers are resolved with one query, the updates run as executemany
+statements grouped by the set of fields they change, and the whole batch
+commits once, with one feature refresh for the affected lines.
+"""
+from sqlalchemy import bindparam, tuple_
+from sqlalchemy.orm import Session
+from database import TowerLocation, record_changes
+from line_removal import decommissioning_lines
+import derived_data
+
+MAX_ITEMS = 5000
+
+UPDATABLE_FIELDS = ("condition", "last_inspection_date", "remarks")
+
+
+def _resolve(db: Session, items):
+    """{item index: tower id} plus per-item errors"""
+    by_id = {item["id"] for item in items if item.get("id") is not None}
+    known = {row.id: row.transmission_line_id for row in db.query(
+        TowerLocation.id, TowerLocation.transmission_line_id
+    ).filter(TowerLocation.id.in_(by_id)).all()} if by_id else {}
+
+    pairs = {(item["line_id"], item["tower_number"]) for item in items
+             if item.get("id") is None and item.get("line_id") is not None and item.get("tower_number")}
+    numbered = {}
+    if pairs:
+        for row in db.query(TowerLocation.id, TowerLocation.transmission_line_id, TowerLocation.tower_number).filter(
+            tuple_(TowerLocation.transmission_line_id, TowerLocation.tower_number).in_(list(pairs))
+        ).all():
+            numbered.setdefault((row.transmission_line_id, row.tower_number), []).append(row.id)
+            known[row.id] = row.transmission_line_id
+
+    resolved, errors = {}, {}
+    for index, item in enumerate(items):
+        if item.get("id") is not None:
+            if item["id"] in known:
+                resolved[index] = item["id"]
+            else:
+                errors[index] = "not_found"
+        elif item.get("line_id") is not None and item.get("tower_number"):
+            matches = numbered.get((item["line_id"], item["tower_number"]), [])
+            if len(matches) == 1:
+                resolved[index] = matches[0]
+            else:
+                errors[index] = "ambiguous" if matches else "not_found"
+        else:
+            errors[index] = "id or line_id and tower_number required"
+    return resolved, errors, known
+
+
+def bulk_update_towers(db: Session, items):
+    """Apply a batch of {id | line_id+tower_number, fields...} updates; returns per-item status"""
+    resolved, errors, lines = _resolve(db, items)
+    blocked = decommissioning_lines(db, {lines[tower_id] for tower_id in resolved.values()})
+    for index, tower_id in list(resolved.items()):
+        if lines[tower_id] in blocked:
+            errors[index] = "line_decommissioning"
+            del resolved[index]
+
+    changes = {}  # tower id -> fields, later items win
+    for index, tower_id in resolved.items():
+        fields = {name: items[index][name] for name in UPDATABLE_FIELDS if name in items[index]}
+        if not fields:
+            errors[index] = "no fields to update"
+            continue
+        changes.setdefault(tower_id, {}).update(fields)
+
+    groups = {}
+    for tower_id, fields in changes.items():
+        groups.setdefault(tuple(sorted(fields)), []).append({"_id": tower_id, **{f"_{k}": v for k, v in fields.items()}})
+
+    table = TowerLocation.__table__
+    conn = db.connection()
+    for names, params in groups.items():
+        statement = table.update().where(table.c.id == bindparam("_id")).values(
+            {name: bindparam(f"_{name}") for name in names}
+        )
+        conn.execute(statement, params)
+
+    if changes:
+        record_changes(conn, "towers", list(changes), "upsert")
+        derived_data.towers_bulk_updated(db, {lines[tower_id] for tower_id in changes}, changes)
+    db.commit()
+
+    results = []
+    for index, item in enumerate(items):
+        if index in errors:
+            results.append({"index": index, "status": "error", "detail": errors[index]})
+        else:
+            results.append({"index": index, "status": "updated", "id": resolved[index]})
+    return {"updated": len(changes), "failed": len(errors), "results": results}
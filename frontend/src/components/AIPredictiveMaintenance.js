@@ -170,6 +170,15 @@ const AIPredictiveMaintenance = () => {
                             {(pred.risk_probability * 100).toFixed(0)}%
                           </span>
                         </div>
+                        {pred.explanation && (
+                          <div className="text-xs text-gray-500 mt-1">
+                            {pred.explanation.contributions
+                              .filter((c) => c.contribution > 0)
+                              .slice(0, 2)
+                              .map((c) => `${c.feature.replace(/_/g, ' ')} +${(c.contribution * 100).toFixed(0)}%`)
+                              .join(', ')}
+                          </div>
+                        )}
                       </td>
                     </tr>
                   );
@@ -2,6 +2,37 @@ import React, { useState, useEffect } from 'react';
 import { Link } from 'react-router-dom';
 import { api } from '../services/api';
 
+// Add (sign = 1) or remove (sign = -1) one incident from the tripping stats
+const countIncident = (stats, incident, sign) => {
+  const currentYear = new Date().getFullYear();
+  const currentMonth = new Date().getMonth();
+  const incidentDate = new Date(incident.fault_date);
+  const incidentYear = incidentDate.getFullYear();
+  const incidentMonth = incidentDate.getMonth();
+
+  stats.totalTrippings += sign;
+
+  // Count by fault type
+  if (incident.fault_type === 'LIGHTNING') stats.lightning += sign;
+  else if (incident.fault_type === 'VEGETATION') stats.vegetation += sign;
+  else if (incident.fault_type === 'HARDWARE FAULT') stats.hardwareFault += sign;
+  else stats.others += sign;
+
+  // Count attributed to PowerGrid
+  if (incident.attributed_to_powergrid === 'YES') stats.attriToPowerGrid += sign;
+
+  // Current year trippings
+  if (incidentYear === currentYear) {
+    stats.currentYearTrippings += sign;
+    if (incidentMonth === currentMonth) stats.thisMonthTrippings += sign;
+  }
+
+  // Last year trippings
+  if (incidentYear === currentYear - 1) {
+    stats.lastYearTrippings += sign;
+    if (incidentMonth === currentMonth) stats.lastYearSameMonthTrippings += sign;
+  }
+};
 
 const Dashboard = () => {
   const [stats, setStats] = useState(null);
@@ -13,6 +44,33 @@ const Dashboard = () => {
     fetchAllData();
   }, []);
 
+  // Apply counter deltas pushed by the server instead of polling
+  useEffect(() => {
+    return api.subscribeToEvents({
+      counters: (delta) => {
+        setStats((current) => {
+          if (!current) return current;
+          const next = { ...current };
+          Object.entries(delta).forEach(([key, value]) => {
+            if (typeof next[key] === 'number') next[key] = next[key] + value;
+          });
+          return next;
+        });
+      },
+      incident: (event) => {
+        setTrippingStats((current) => {
+          if (!current) return current;
+          const next = { ...current };
+          if (event.previous) countIncident(next, event.previous, -1);
+          countIncident(next, event, event.action === 'deleted' ? -1 : 1);
+          return next;
+        });
+      },
+      // Missed more events than the server buffers: reload once
+      reset: () => fetchAllData(),
+    });
+  }, []);
+
   const fetchAllData = async () => {
     try {
       const dashboardData = await api.getDashboardStats();
@@ -32,48 +90,20 @@ const Dashboard = () => {
   };
 
   const processTrippingStats = (incidents) => {
-    const currentYear = new Date().getFullYear();
     const stats = {
       lightning: 0,
       vegetation: 0,
       hardwareFault: 0,
       others: 0,
       attriToPowerGrid: 0,
-      totalTrippings: incidents.length,
+      totalTrippings: 0,
       currentYearTrippings: 0,
       lastYearTrippings: 0,
       thisMonthTrippings: 0,
       lastYearSameMonthTrippings: 0
     };
 
-    const currentMonth = new Date().getMonth();
-
-    incidents.forEach(incident => {
-      const incidentDate = new Date(incident.fault_date);
-      const incidentYear = incidentDate.getFullYear();
-      const incidentMonth = incidentDate.getMonth();
-
-      // Count by fault type
-      if (incident.fault_type === 'LIGHTNING') stats.lightning++;
-      else if (incident.fault_type === 'VEGETATION') stats.vegetation++;
-      else if (incident.fault_type === 'HARDWARE FAULT') stats.hardwareFault++;
-      else stats.others++;
-
-      // Count attributed to PowerGrid
-      if (incident.attributed_to_powergrid === 'YES') stats.attriToPowerGrid++;
-
-      // Current year trippings
-      if (incidentYear === currentYear) {
-        stats.currentYearTrippings++;
-        if (incidentMonth === currentMonth) stats.thisMonthTrippings++;
-      }
-
-      // Last year trippings
-      if (incidentYear === currentYear - 1) {
-        stats.lastYearTrippings++;
-        if (incidentMonth === currentMonth) stats.lastYearSameMonthTrippings++;
-      }
-    });
+    incidents.forEach(incident => countIncident(stats, incident, 1));
 
     setTrippingStats(stats);
   };
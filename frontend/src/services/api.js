@@ -130,6 +130,16 @@ export const api = {
     return response.data;
   },
 
+  // Live updates (Server-Sent Events); returns a function that closes the stream
+  subscribeToEvents: (handlers) => {
+    const token = localStorage.getItem('token');
+    const source = new EventSource(`${API_BASE_URL}/events/stream?access_token=${encodeURIComponent(token || '')}`);
+    Object.entries(handlers).forEach(([topic, handler]) => {
+      source.addEventListener(topic, (event) => handler(event.data ? JSON.parse(event.data) : null));
+    });
+    return () => source.close();
+  },
+
   // Generic methods for flexibility
   get: async (url) => {
     const response = await axiosInstance.get(url);